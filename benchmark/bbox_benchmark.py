@@ -0,0 +1,91 @@
+import argparse
+import pickle
+import time
+import tracemalloc
+
+import pypdfium2 as pdfium
+import tabulate
+
+from pdftext.pdf.chars import get_chars
+from pdftext.pdf.pages import get_pages
+from pdftext.schema import Bbox
+
+
+class DictBbox:
+    # The previous Bbox layout: a regular class with an instance __dict__, and merges that allocate
+    def __init__(self, bbox):
+        self.bbox = bbox
+        self.ensure_nonzero_area = False
+
+    def merge(self, other):
+        return DictBbox([
+            min(self.bbox[0], other.bbox[0]),
+            min(self.bbox[1], other.bbox[1]),
+            max(self.bbox[2], other.bbox[2]),
+            max(self.bbox[3], other.bbox[3])
+        ])
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    duration = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count for stat in snapshot.statistics("filename"))
+    return result, duration, peak, allocations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Bbox allocations and merges.")
+    parser.add_argument("pdf_path", type=str, help="Path to the pdf to benchmark", nargs="?", default="tests/data/adversarial.pdf")
+    args = parser.parse_args()
+
+    pdf = pdfium.PdfDocument(args.pdf_path)
+    char_boxes = []
+    for page_idx in range(len(pdf)):
+        page = pdf.get_page(page_idx)
+        chars = get_chars(page.get_textpage(), page.get_bbox(), page.get_rotation())
+        char_boxes.extend(char["bbox"].bbox for char in chars)
+
+    def merge_dict_bboxes():
+        boxes = [DictBbox(list(b)) for b in char_boxes]
+        merged = boxes[0]
+        for box in boxes[1:]:
+            merged = merged.merge(box)
+        return boxes
+
+    def merge_slot_bboxes():
+        boxes = [Bbox(list(b)) for b in char_boxes]
+        merged = boxes[0].copy()
+        for box in boxes[1:]:
+            merged.merge_into(box)
+        return boxes
+
+    rows = []
+    for name, func in [("dict + merge", merge_dict_bboxes), ("slots + merge_into", merge_slot_bboxes)]:
+        boxes, duration, peak, allocations = measure(func)
+        pickle_start = time.perf_counter()
+        pickled = pickle.dumps(boxes)
+        pickle.loads(pickled)
+        pickle_time = time.perf_counter() - pickle_start
+        rows.append((name, len(boxes), round(duration, 4), round(peak / 1e6, 2), allocations, round(len(pickled) / 1e6, 2), round(pickle_time, 4)))
+
+    print(f"Bbox merge over {len(char_boxes)} char boxes")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Layout", "Boxes", "Time (s)", "Peak (MB)", "Live allocations", "Pickle (MB)", "Pickle roundtrip (s)"]))
+
+    pages, duration, peak, allocations = measure(lambda: get_pages(pdf, range(len(pdf)), flatten_pdf=False))
+    print()
+    print(f"get_pages over {len(pages)} pages")
+    print(tabulate.tabulate([(
+        round(duration / len(pages), 4),
+        round(peak / 1e6 / len(pages), 2),
+        allocations // len(pages),
+    )], tablefmt="github", headers=["Time (s per page)", "Peak (MB per page)", "Live allocations per page"]))
+    pdf.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -48,8 +48,8 @@ def pdfplumber_inference(pdf_path):
     return pages
 
 
-def pdftext_inference(pdf_path, workers=None):
-    return paginated_plain_text_output(pdf_path, workers=workers)
+def pdftext_inference(pdf_path, workers=None, fast=False):
+    return paginated_plain_text_output(pdf_path, workers=workers, fast=fast)
 
 
 def compare_docs(doc1: str, doc2: str):
@@ -62,6 +62,7 @@ def main():
     parser.add_argument("--max", type=int, help="Maximum number of pages to process.", default=None)
     parser.add_argument("--pdftext_only", action="store_true", help="Only run pdftext inference", default=False)
     parser.add_argument("--pdftext_workers", type=int, help="Number of workers to use for pdftext inference", default=None)
+    parser.add_argument("--pdftext_fast", action="store_true", help="Also benchmark the pdftext fast text-only mode", default=False)
     args = parser.parse_args()
 
     split = "train"
@@ -76,6 +77,9 @@ def main():
     if args.pdftext_only:
         times_tools = ["pymupdf", "pdftext"]
         alignment_tools = ["pdftext"]
+    if args.pdftext_fast:
+        times_tools.append("pdftext_fast")
+        alignment_tools.append("pdftext_fast")
     for i in tqdm(range(len(dataset)), desc="Benchmarking"):
         row = dataset[i]
         pdf = row["pdf"]
@@ -85,9 +89,14 @@ def main():
             f.seek(0)
             pdf_path = f.name
 
-            pdftext_inference_model = partial(pdftext_inference, workers=args.pdftext_workers)
-            inference_funcs = [pymupdf_inference, pdftext_inference_model, pdfplumber_inference]
-            for tool, inference_func in zip(times_tools, inference_funcs):
+            inference_funcs = {
+                "pymupdf": pymupdf_inference,
+                "pdftext": partial(pdftext_inference, workers=args.pdftext_workers),
+                "pdfplumber": pdfplumber_inference,
+                "pdftext_fast": partial(pdftext_inference, workers=args.pdftext_workers, fast=True),
+            }
+            for tool in times_tools:
+                inference_func = inference_funcs[tool]
                 start = time.time()
                 pages = inference_func(pdf_path)
                 times[tool].append(time.time() - start)
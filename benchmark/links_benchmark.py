@@ -0,0 +1,81 @@
+import argparse
+import copy
+import time
+
+import numpy as np
+import tabulate
+
+from pdftext.pdf.links import split_links
+from pdftext.pdf.utils import intersecting_pairs, matrix_intersection_area
+from pdftext.schema import Bbox
+
+
+def synthetic_page(line_count, spans_per_line=4, chars_per_span=8):
+    # A bibliography-like page, where every span is a link to a reference or an url
+    char_idx = 0
+    lines, links = [], []
+    for line_idx in range(line_count):
+        y = line_idx * 12
+        spans = []
+        for span_idx in range(spans_per_line):
+            x = span_idx * chars_per_span * 6
+            chars = []
+            for i in range(chars_per_span):
+                chars.append({"bbox": Bbox([x + i * 6, y, x + (i + 1) * 6, y + 10]), "char": "a", "rotation": 0, "font": {"name": "f"}, "char_idx": char_idx})
+                char_idx += 1
+            spans.append({
+                "bbox": Bbox([x, y, x + chars_per_span * 6, y + 10]), "text": "a" * chars_per_span, "rotation": 0, "font": {"name": "f"},
+                "char_start_idx": chars[0]["char_idx"], "char_end_idx": chars[-1]["char_idx"], "chars": chars, "url": "",
+            })
+            links.append({"page": 0, "bbox": [x + 3, y + 1, x + chars_per_span * 3, y + 9], "dest_page": None, "dest_pos": None, "url": f"https://example.com/{line_idx}/{span_idx}"})
+        lines.append({"spans": spans, "bbox": Bbox([0, y, spans_per_line * chars_per_span * 6, y + 10])})
+    return {"page": 0, "blocks": [{"lines": lines, "bbox": Bbox([0, 0, spans_per_line * chars_per_span * 6, line_count * 12])}]}, links
+
+
+def dense_match(link_bboxes, span_bboxes):
+    # The previous lookup: a links x spans matrix of intersection areas
+    intersection_matrix = matrix_intersection_area(link_bboxes, span_bboxes)
+    return {link_idx: int(row.argmax()) for link_idx, row in enumerate(intersection_matrix) if row.sum() > 0}
+
+
+def pair_match(link_bboxes, span_bboxes):
+    link_idxs, span_idxs, areas = intersecting_pairs(link_bboxes, span_bboxes)
+    order = np.lexsort((span_idxs, -areas, link_idxs))
+    link_idxs, span_idxs = link_idxs[order], span_idxs[order]
+    first = np.concatenate([[True], link_idxs[1:] != link_idxs[:-1]])
+    return dict(zip(link_idxs[first].tolist(), span_idxs[first].tolist()))
+
+
+def best_time(func, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark matching links to spans on pages with many links.")
+    parser.add_argument("--iterations", type=int, help="Number of iterations", default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for line_count in [10, 100, 500, 2000]:
+        page, links = synthetic_page(line_count)
+        span_bboxes = [span["bbox"].bbox for block in page["blocks"] for line in block["lines"] for span in line["spans"]]
+        link_bboxes = [link["bbox"] for link in links]
+        assert dense_match(link_bboxes, span_bboxes) == pair_match(link_bboxes, span_bboxes)
+        dense = best_time(lambda: dense_match(link_bboxes, span_bboxes), args.iterations)
+        pairs = best_time(lambda: pair_match(link_bboxes, span_bboxes), args.iterations)
+        # split_links changes the page, so each run gets its own copy
+        copies = [copy.deepcopy(page) for _ in range(args.iterations)]
+        split = best_time(lambda: split_links(copies.pop(), links), args.iterations)
+        rows.append((len(links), len(span_bboxes), round(dense * 1000, 2), round(pairs * 1000, 2), round(split * 1000, 2)))
+
+    print(f"One page, best of {args.iterations}")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Links", "Spans", "Dense matrix (ms)", "Grid pairs (ms)", "split_links (ms)"]))
+
+
+if __name__ == "__main__":
+    main()
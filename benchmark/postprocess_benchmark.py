@@ -0,0 +1,65 @@
+import argparse
+import time
+import unicodedata
+
+import tabulate
+
+from pdftext.extraction import dictionary_output
+from pdftext.pdf.utils import LINE_BREAKS, SPACES, TABS, WHITESPACE_CHARS
+from pdftext.postprocessing import HYPHEN_CHAR, LIGATURES, REPLACEMENTS, postprocess_text
+
+
+def replace_each(text):
+    # The previous postprocess_text: one replace pass per entry, then a category lookup per char
+    for old, new in REPLACEMENTS.items():
+        text = text.replace(old, new)
+    for item in SPACES:
+        text = text.replace(item, " ")
+    for item in LINE_BREAKS:
+        text = text.replace(item, "\n")
+    for item in TABS:
+        text = text.replace(item, "\t")
+    text = "".join(char for char in text if (unicodedata.category(char)[0] != "C" or char == HYPHEN_CHAR or char in WHITESPACE_CHARS))
+    for ligature, replacement in LIGATURES.items():
+        text = text.replace(ligature, replacement)
+    return text
+
+
+def time_texts(func, texts, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text postprocessing on spans, lines and whole pages.")
+    parser.add_argument("pdf_path", type=str, help="Path to the pdf to benchmark", nargs="?", default="tests/data/adversarial.pdf")
+    parser.add_argument("--iterations", type=int, help="Number of iterations", default=3)
+    args = parser.parse_args()
+
+    pages = dictionary_output(args.pdf_path, disable_links=True)
+    lines = [line for page in pages for block in page["blocks"] for line in block["lines"]]
+    levels = {
+        # _process_span postprocesses each span, merge_text each line, and whole pages show the cost per char
+        "Span": [span["text"] for line in lines for span in line["spans"]],
+        "Line": ["".join(span["text"] for span in line["spans"]) for line in lines],
+        "Page": ["\n".join("".join(span["text"] for span in line["spans"]) for block in page["blocks"] for line in block["lines"]) for page in pages],
+    }
+
+    rows = []
+    for level, texts in levels.items():
+        assert [replace_each(text) for text in texts] == [postprocess_text(text) for text in texts]
+        previous = time_texts(replace_each, texts, args.iterations)
+        translate = time_texts(postprocess_text, texts, args.iterations)
+        rows.append((level, len(texts), sum(len(text) for text in texts), round(previous * 1000, 2), round(translate * 1000, 2)))
+
+    print(f"{len(pages)} pages, best of {args.iterations}")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Level", "Texts", "Chars", "Replace per entry (ms)", "Translate table (ms)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import math
+import time
+
+import pypdfium2 as pdfium
+import tabulate
+
+from pdftext.pool import ExtractionPool, _run_batch
+
+
+def contiguous_chunks(pool: ExtractionPool, pdf_path: str, page_range: list):
+    # The previous scheduling: one equal, contiguous chunk of pages per worker
+    pages_per_worker = math.ceil(len(page_range) / pool.workers)
+    chunks = [page_range[i * pages_per_worker:(i + 1) * pages_per_worker] for i in range(pool.workers)]
+    start = time.perf_counter()
+    futures = [pool.executor.submit(_run_batch, pdf_path, chunk) for chunk in chunks if chunk]
+    for future in futures:
+        pool._record(future.result())
+    pool.scheduled_time += time.perf_counter() - start
+
+
+def dynamic_batches(pool: ExtractionPool, pdf_path: str, page_range: list):
+    # Packed pages, like contiguous_chunks, so unpacking in the parent isn't counted for one and not the other
+    for _ in pool.iter_packed_pages(pdf_path, page_range):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page scheduling across workers.")
+    parser.add_argument("pdf_path", type=str, help="Path to the pdf to benchmark", nargs="?", default="tests/data/adversarial.pdf")
+    parser.add_argument("--workers", type=int, help="Number of workers", default=4)
+    args = parser.parse_args()
+
+    pdf = pdfium.PdfDocument(args.pdf_path)
+    page_range = list(range(len(pdf)))
+    pdf.close()
+
+    rows = []
+    for name, schedule in [("contiguous chunks", contiguous_chunks), ("dynamic batches", dynamic_batches)]:
+        with ExtractionPool(workers=args.workers) as pool:
+            # Warm up the workers, so process startup isn't counted
+            pool.executor.submit(_run_batch, args.pdf_path, [0]).result()
+            pool.worker_stats = {}
+
+            start = time.perf_counter()
+            schedule(pool, args.pdf_path, page_range)
+            duration = time.perf_counter() - start
+
+            utilization = sorted(pool.utilization().values(), reverse=True)
+            utilization += [0.0] * (args.workers - len(utilization))
+            rows.append((name, round(duration, 2), round(sum(utilization) / args.workers * 100, 1), " ".join(f"{u * 100:.0f}%" for u in utilization)))
+
+    print(f"Scheduling {len(page_range)} pages over {args.workers} workers")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Scheduler", "Time (s)", "Mean utilization (%)", "Per-worker utilization"]))
+
+
+if __name__ == "__main__":
+    main()
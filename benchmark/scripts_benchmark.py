@@ -0,0 +1,76 @@
+import argparse
+import copy
+import random
+import time
+
+import tabulate
+
+from pdftext.pdf.pages import _reduce_others, assign_scripts
+from pdftext.schema import Bbox
+
+
+def synthetic_line(span_count, seed=0):
+    # Text spans with raised and lowered single digits in between, like a line of inline formulas
+    rng = random.Random(seed)
+    spans = []
+    x = 0
+    for i in range(span_count):
+        if i % 3 == 1:
+            y_start = rng.choice([-4, 6])
+            text, width, height = str(rng.randint(0, 9)), 4, 6
+        else:
+            y_start = rng.uniform(-0.5, 0.5)
+            text, width, height = "x + y", 20, 10
+        spans.append({"bbox": Bbox([x, y_start, x + width, y_start + height]), "text": text})
+        x += width
+    return {"spans": spans, "bbox": Bbox([0, -4, x, 12])}
+
+
+def scan_spans(line, line_distance_threshold=.1):
+    # The previous check: every span is compared with every other span in the line
+    spans = line["spans"]
+    return [(
+        any([span["bbox"].y_start < (s["bbox"].y_start - s["bbox"].height * line_distance_threshold) for j, s in enumerate(spans) if j != i]),
+        any([span["bbox"].y_end > (s["bbox"].y_end + s["bbox"].height * line_distance_threshold) for j, s in enumerate(spans) if j != i]),
+    ) for i, span in enumerate(spans)]
+
+
+def reduce_spans(line, line_distance_threshold=.1):
+    spans = line["spans"]
+    other_tops = _reduce_others([s["bbox"].y_start - s["bbox"].height * line_distance_threshold for s in spans], max)
+    other_bottoms = _reduce_others([s["bbox"].y_end + s["bbox"].height * line_distance_threshold for s in spans], min)
+    return [(span["bbox"].y_start < top, span["bbox"].y_end > bottom) for span, top, bottom in zip(spans, other_tops, other_bottoms)]
+
+
+def best_time(func, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark superscript and subscript detection on lines with many spans.")
+    parser.add_argument("--iterations", type=int, help="Number of iterations", default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for span_count in [10, 100, 1000, 3000]:
+        line = synthetic_line(span_count)
+        assert scan_spans(line) == reduce_spans(line)
+        scan = best_time(lambda: scan_spans(line), args.iterations)
+        reduce = best_time(lambda: reduce_spans(line), args.iterations)
+        # Flags don't affect detection, so the same line can be reused
+        scripts = copy.deepcopy(line)
+        assign = best_time(lambda: assign_scripts([scripts]), args.iterations)
+        flagged = sum(1 for span in scripts["spans"] if span.get("superscript") or span.get("subscript"))
+        rows.append((span_count, flagged, round(scan * 1000, 2), round(reduce * 1000, 2), round(assign * 1000, 2)))
+
+    print(f"One line, best of {args.iterations}")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Spans", "Scripts", "Compare all spans (ms)", "Prefix/suffix (ms)", "assign_scripts (ms)"]))
+
+
+if __name__ == "__main__":
+    main()
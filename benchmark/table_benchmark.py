@@ -0,0 +1,104 @@
+import argparse
+import time
+
+import numpy as np
+import tabulate
+
+from pdftext.extraction import dictionary_output
+from pdftext.schema import Bbox
+from pdftext.tables import LineIndex, group_cells, is_same_span, table_cell_text
+
+
+def tile_tables(img_size, rows, cols):
+    # A page split into a grid of tables, like a financial statement with many small tables
+    width, height = img_size[0] / cols, img_size[1] / rows
+    return [[c * width, r * height, (c + 1) * width, (r + 1) * height] for r in range(rows) for c in range(cols)]
+
+
+def scan_lines(page, img_size, tables, table_thresh=.8):
+    # The previous lookup: every line is rescaled and checked against every table
+    found = []
+    for table in tables:
+        table_poly = Bbox(bbox=table)
+        found.append([
+            line for block in page["blocks"] for line in block["lines"]
+            if Bbox(bbox=line["bbox"]).rescale(img_size, page).intersection_pct(table_poly) >= table_thresh
+        ])
+    return found
+
+
+def index_lines(page, img_size, tables, table_thresh=.8):
+    line_index = LineIndex(page, img_size)
+    found = []
+    for table in tables:
+        table_poly = Bbox(bbox=table)
+        found.append([
+            line_index.lines[line_idx] for line_idx in line_index.query(table)
+            if line_index.bboxes[line_idx].intersection_pct(table_poly) >= table_thresh
+        ])
+    return found
+
+
+def stepping_line(chars):
+    # One line where each char is just over half the gap below the one before, the slowest case for grouping by passes
+    x, y = np.arange(chars) * 2., np.arange(chars) * 6.
+    line_starts = np.zeros(chars, dtype=bool)
+    line_starts[0] = True
+    return np.stack([x, y, x + 1, y + 5], axis=1), ["a"] * chars, line_starts
+
+
+def scan_cells(bboxes, texts, line_starts, img_size, space_thresh, rotation):
+    # The previous grouping, char by char
+    starts, curr_box = [], None
+    for i, bbox in enumerate(bboxes.tolist()):
+        if line_starts[i] or not is_same_span(bbox, curr_box, img_size, space_thresh, rotation):
+            starts.append(i)
+            curr_box = bbox
+        else:
+            curr_box = [min(curr_box[0], bbox[0]), min(curr_box[1], bbox[1]), max(curr_box[2], bbox[2]), max(curr_box[3], bbox[3])]
+    return starts
+
+
+def best_time(func, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark table cell extraction on pages with many tables.")
+    parser.add_argument("pdf_path", type=str, help="Path to the pdf to benchmark", nargs="?", default="tests/data/adversarial.pdf")
+    parser.add_argument("--iterations", type=int, help="Number of iterations", default=3)
+    args = parser.parse_args()
+
+    pages = dictionary_output(args.pdf_path, keep_chars=True)
+    rows = []
+    for grid in [1, 2, 4, 6, 8]:
+        scan = index = cells = 0
+        for page in pages:
+            img_size = [page["width"] * 2, page["height"] * 2]
+            tables = tile_tables(img_size, grid, grid)
+            assert scan_lines(page, img_size, tables) == index_lines(page, img_size, tables)
+            scan += best_time(lambda: scan_lines(page, img_size, tables), args.iterations)
+            index += best_time(lambda: index_lines(page, img_size, tables), args.iterations)
+            cells += best_time(lambda: table_cell_text(tables, page, img_size), args.iterations)
+        rows.append((grid * grid, round(scan / len(pages) * 1000, 2), round(index / len(pages) * 1000, 2), round(cells / len(pages) * 1000, 2)))
+
+    print(f"Tables per page over {len(pages)} pages, best of {args.iterations}")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Tables", "Scan lines (ms per page)", "Line index (ms per page)", "table_cell_text (ms per page)"]))
+
+    rows = []
+    for chars in [1000, 8000]:
+        cell_args = (*stepping_line(chars), [1000, 1000], .01, 0)
+        assert np.flatnonzero(group_cells(*cell_args)[0]).tolist() == scan_cells(*cell_args)
+        rows.append((chars, round(best_time(lambda: scan_cells(*cell_args), args.iterations) * 1000, 2), round(best_time(lambda: group_cells(*cell_args), args.iterations) * 1000, 2)))
+
+    print("\nOne line of chars stepping just over half the gap apart")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Chars", "Char by char (ms)", "group_cells (ms)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import pickle
+import time
+
+import pypdfium2 as pdfium
+import tabulate
+
+from pdftext.pdf.pages import get_pages
+from pdftext.wire import pack_page, unpack_page
+
+
+def transfer_pages(pages):
+    # The previous transfer: nested page dicts pickled as-is
+    pickled = pickle.dumps(pages, protocol=pickle.HIGHEST_PROTOCOL)
+    return pickle.loads(pickled), len(pickled)
+
+
+def transfer_packed(pages, keep_chars):
+    pickled = pickle.dumps([pack_page(page) for page in pages], protocol=pickle.HIGHEST_PROTOCOL)
+    return [unpack_page(packed, keep_chars) for packed in pickle.loads(pickled)], len(pickled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark moving extracted pages between processes.")
+    parser.add_argument("pdf_path", type=str, help="Path to the pdf to benchmark", nargs="?", default="tests/data/adversarial.pdf")
+    parser.add_argument("--iterations", type=int, help="Number of iterations", default=3)
+    args = parser.parse_args()
+
+    pdf = pdfium.PdfDocument(args.pdf_path)
+    pages = get_pages(pdf, range(len(pdf)), flatten_pdf=False)
+    pdf.close()
+
+    rows = []
+    for name, func in [
+        ("pickle pages", lambda: transfer_pages(pages)),
+        ("packed, keep_chars", lambda: transfer_packed(pages, True)),
+        ("packed, no chars", lambda: transfer_packed(pages, False)),
+    ]:
+        times = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            _, size = func()
+            times.append(time.perf_counter() - start)
+        rows.append((name, round(size / 1e6, 2), round(min(times), 4), round(min(times) / len(pages) * 1000, 2)))
+
+    print(f"Transferring {len(pages)} pages, best of {args.iterations}")
+    print(tabulate.tabulate(rows, tablefmt="github", headers=["Transfer", "Size (MB)", "Roundtrip (s)", "Roundtrip (ms per page)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import atexit
+from typing import AsyncIterator
+
+from pdftext.extraction import finish_page
+from pdftext.pool import ExtractionPool
+from pdftext.schema import Page, PageReference, Pages
+from pdftext.settings import settings
+from pdftext.wire import unpack_page
+
+_shared_pool: ExtractionPool | None = None
+
+
+def get_shared_pool() -> ExtractionPool:
+    # One pool for every async call in the process, so requests don't each start their own workers
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = ExtractionPool(settings.ASYNC_WORKERS)
+        atexit.register(_shared_pool.close)
+    return _shared_pool
+
+
+async def iter_pages_async(
+        pdf_path,
+        sort=False,
+        page_range=None,
+        keep_chars=False,
+        flatten_pdf=False,
+        quote_loosebox=True,
+        disable_links=False,
+        pool: ExtractionPool | None = None,
+        max_in_flight_pages: int | None = None
+) -> AsyncIterator[Page]:
+    """
+    Async version of iter_dictionary_output.  Pages are extracted in the worker processes of pool, or a pool shared by
+    all async calls, so the event loop is only busy with turning results into page dicts.
+    """
+    pool = pool or get_shared_pool()
+    refs = PageReference()
+    packed_pages = pool.iter_packed_pages_async(
+        pdf_path,
+        page_range,
+        flatten_pdf=flatten_pdf,
+        quote_loosebox=quote_loosebox,
+        links=not disable_links,
+        max_in_flight_pages=max_in_flight_pages
+    )
+    try:
+        async for packed in packed_pages:
+            yield finish_page(unpack_page(packed, keep_chars), refs, sort=sort, keep_chars=keep_chars, links=not disable_links)
+    finally:
+        await packed_pages.aclose()
+
+
+async def extract_async(
+        pdf_path,
+        sort=False,
+        page_range=None,
+        keep_chars=False,
+        flatten_pdf=False,
+        quote_loosebox=True,
+        disable_links=False,
+        pool: ExtractionPool | None = None,
+        max_in_flight_pages: int | None = None
+) -> Pages:
+    return [page async for page in iter_pages_async(
+        pdf_path,
+        sort=sort,
+        page_range=page_range,
+        keep_chars=keep_chars,
+        flatten_pdf=flatten_pdf,
+        quote_loosebox=quote_loosebox,
+        disable_links=disable_links,
+        pool=pool,
+        max_in_flight_pages=max_in_flight_pages
+    )]
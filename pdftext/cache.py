@@ -0,0 +1,236 @@
+import dataclasses
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+import zlib
+from collections import OrderedDict
+from importlib.metadata import PackageNotFoundError, version
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from pdftext.settings import settings
+from pdftext.wire import PackedPage
+
+try:
+    PDFTEXT_VERSION = version("pdftext")
+except PackageNotFoundError:
+    PDFTEXT_VERSION = "unknown"
+
+CACHE_FORMAT = 2  # Bump when PackedPage or the entry layout changes
+ENTRY_SUFFIX = ".page"
+EVICT_TO = 0.9  # Evict down to this fraction of max_bytes, so every put past the limit doesn't trigger a scan
+
+
+def document_hash(pdf_path) -> str:
+    # Takes a path, or the pdf bytes
+    if not isinstance(pdf_path, str):
+        return hashlib.sha256(pdf_path).hexdigest()
+
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _encode(value):
+    # JSON that keeps tuples and non-string dict keys, like the page bbox and span_urls
+    if isinstance(value, tuple):
+        return {"t": [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {"d": [[_encode(key), _encode(item)] for key, item in value.items()]}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict):
+        if "t" in value:
+            return tuple(_decode(item) for item in value["t"])
+        return {_decode(key): _decode(item) for key, item in value["d"]}
+    return value
+
+
+def dump_page(page: PackedPage) -> bytes:
+    """
+    Serializes a packed page as an npz, with the arrays as is, and the other fields as a JSON blob.  Cache
+    directories can be shared, so entries are never unpickled.
+    """
+    arrays = {}
+    fields = {}
+    for field in dataclasses.fields(PackedPage):
+        value = getattr(page, field.name)
+        if isinstance(value, np.ndarray):
+            arrays[field.name] = value
+        else:
+            fields[field.name] = _encode(value)
+    arrays["fields"] = np.frombuffer(json.dumps(fields).encode(), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def load_page(data: bytes) -> PackedPage:
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        values = {name: arrays[name] for name in arrays.files if name != "fields"}
+        fields = json.loads(arrays["fields"].tobytes())
+    values.update({name: _decode(value) for name, value in fields.items()})
+    return PackedPage(**values)
+
+
+class ResultCache:
+    """
+    An on-disk cache of extracted pages, keyed by the document's content hash and the options used to extract them.
+    Each page is its own compressed entry, so overlapping page ranges share entries.  Entries are written to a temp
+    file and renamed into place, so several processes can share a directory.  Reads refresh an entry's mtime, and the
+    least recently used entries are evicted once the directory grows past max_bytes.
+    """
+    def __init__(self, directory, max_bytes: int = settings.CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: int | None = None  # Estimate, other processes write too, so it's rescanned before evicting
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, doc_hash: str, options: Tuple[Any, ...], page_idx: int) -> str:
+        options_hash = hashlib.sha256(repr((CACHE_FORMAT, PDFTEXT_VERSION, options)).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, doc_hash[:2], f"{doc_hash}-{options_hash}-{page_idx}{ENTRY_SUFFIX}")
+
+    def contains(self, doc_hash: str, options: Tuple[Any, ...], page_idx: int) -> bool:
+        return os.path.exists(self._path(doc_hash, options, page_idx))
+
+    def get(self, doc_hash: str, options: Tuple[Any, ...], page_idx: int) -> PackedPage | None:
+        path = self._path(doc_hash, options, page_idx)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        try:
+            return load_page(zlib.decompress(data))
+        except (zlib.error, zipfile.BadZipFile, ValueError, KeyError, TypeError, EOFError):
+            return None
+
+    def put(self, doc_hash: str, options: Tuple[Any, ...], page_idx: int, page: PackedPage):
+        path = self._path(doc_hash, options, page_idx)
+        data = zlib.compress(dump_page(page), 1)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another process evicted it first
+            total -= size
+        self._size = total
+
+    def clear(self):
+        for _, _, path in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+
+
+class PageCache:
+    """
+    An in-memory LRU of extracted pages, keyed by a hash of each page's content and resources.  A page repeated across
+    documents, like boilerplate terms or an unchanged page in a revision, only goes through the char, span, line and
+    block pipeline once.  Pages are cached before links are merged, so links and the page index come from the document.
+    """
+    def __init__(self, max_pages: int = 256):
+        self.max_pages = max_pages
+        self.pages: OrderedDict[Tuple[Any, ...], PackedPage] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[Any, ...]) -> PackedPage | None:
+        packed = self.pages.get(key)
+        if packed is None:
+            self.misses += 1
+            return None
+        self.pages.move_to_end(key)
+        self.hits += 1
+        return packed
+
+    def put(self, key: Tuple[Any, ...], packed: PackedPage):
+        self.pages[key] = packed
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "pages": len(self.pages)}
+
+
+_default_cache: ResultCache | None = None
+_default_page_cache: PageCache | None = None
+
+
+def get_default_cache() -> ResultCache | None:
+    # The cache configured with CACHE_DIR, if any
+    global _default_cache
+    if settings.CACHE_DIR is None:
+        return None
+    if _default_cache is None or _default_cache.directory != settings.CACHE_DIR:
+        _default_cache = ResultCache(settings.CACHE_DIR)
+    return _default_cache
+
+
+def get_default_page_cache() -> PageCache | None:
+    # The process-wide page cache, sized by PAGE_CACHE_SIZE, and disabled at 0
+    global _default_page_cache
+    if settings.PAGE_CACHE_SIZE <= 0:
+        return None
+    if _default_page_cache is None:
+        _default_page_cache = PageCache(settings.PAGE_CACHE_SIZE)
+    return _default_page_cache
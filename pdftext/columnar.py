@@ -0,0 +1,258 @@
+import os
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from pdftext.extraction import iter_dictionary_output
+from pdftext.schema import Bbox, ColumnarDocument, Page
+
+TABLES = ("pages", "blocks", "lines", "spans", "chars", "fonts", "refs")
+STRING_COLUMNS = {"spans": ("text", "url"), "chars": ("char",), "fonts": ("name",)}
+BBOX_WIDTHS = {"bbox": 4, "coord": 2}
+
+
+def _bbox(bbox) -> List[float]:
+    return bbox.bbox if isinstance(bbox, Bbox) else bbox
+
+
+def _bboxes(bboxes: List[List[float]], width: int = 4) -> np.ndarray:
+    return np.array(bboxes, dtype=np.float32).reshape(-1, width)
+
+
+def _ends(strings: List[str]) -> np.ndarray:
+    return np.cumsum([len(string) for string in strings], dtype=np.int64)
+
+
+class _FontTable:
+    # Fonts are interned per document, but pages from the cache or other workers can have equal copies
+    def __init__(self):
+        self.objects: Dict[int, tuple] = {}  # id -> (font, font_id), holds the font so the id isn't reused
+        self.ids: Dict[tuple, int] = {}
+        self.fonts: List[dict] = []
+
+    def get_id(self, font: dict) -> int:
+        found = self.objects.get(id(font))
+        if found is not None:
+            return found[1]
+        key = (font["name"], font["flags"], font["size"], font["weight"])
+        font_id = self.ids.get(key)
+        if font_id is None:
+            font_id = self.ids[key] = len(self.fonts)
+            self.fonts.append(font)
+        self.objects[id(font)] = (font, font_id)
+        return font_id
+
+
+def pages_to_columnar(pages: Iterable[Page]) -> ColumnarDocument:
+    """
+    Flattens dictionary_output pages into one table per level, in document order.  Blocks, lines, spans and chars
+    point to their parent row with the page, block, line and span columns.  Bboxes can be Bbox objects or lists.
+    """
+    fonts = _FontTable()
+    page_rows, page_refs = [], []
+    block_pages, block_bboxes = [], []
+    line_blocks, line_bboxes = [], []
+    span_lines, span_bboxes, span_rotations, span_fonts, span_char_idxs, span_flags, span_texts, span_urls = [], [], [], [], [], [], [], []
+    char_spans, char_bboxes, char_rotations, char_fonts, char_idxs, char_texts = [], [], [], [], [], []
+
+    for page_row, page in enumerate(pages):
+        page_rows.append((page["page"], page["width"], page["height"], page["rotation"], _bbox(page["bbox"])))
+        page_refs.append(page.get("refs", []))  # Refs can still grow until the last page, so they're read at the end
+        for block in page["blocks"]:
+            block_pages.append(page_row)
+            block_bboxes.append(_bbox(block["bbox"]))
+            for line in block["lines"]:
+                line_blocks.append(len(block_pages) - 1)
+                line_bboxes.append(_bbox(line["bbox"]))
+                for span in line["spans"]:
+                    span_row = len(span_lines)
+                    span_lines.append(len(line_blocks) - 1)
+                    span_bboxes.append(_bbox(span["bbox"]))
+                    span_rotations.append(span["rotation"])
+                    span_fonts.append(fonts.get_id(span["font"]) if "font" in span else -1)
+                    span_char_idxs.append((span["char_start_idx"], span["char_end_idx"]))
+                    span_flags.append((span.get("superscript", False), span.get("subscript", False)))
+                    span_texts.append(span["text"])
+                    span_urls.append(span.get("url") or "")
+                    for char in span.get("chars", []):
+                        char_spans.append(span_row)
+                        char_bboxes.append(_bbox(char["bbox"]))
+                        char_rotations.append(char["rotation"])
+                        char_fonts.append(fonts.get_id(char["font"]))
+                        char_idxs.append(char["char_idx"])
+                        char_texts.append(char["char"])
+
+    refs = [(page_row, ref.idx, ref.coord) for page_row, page_refs_list in enumerate(page_refs) for ref in page_refs_list]
+    span_flags = np.array(span_flags, dtype=bool).reshape(-1, 2)
+    font_names = [font["name"] or "" for font in fonts.fonts]
+    return {
+        "pages": {
+            "page": np.array([row[0] for row in page_rows], dtype=np.int32),
+            "width": np.array([row[1] for row in page_rows], dtype=np.float32),
+            "height": np.array([row[2] for row in page_rows], dtype=np.float32),
+            "rotation": np.array([row[3] for row in page_rows], dtype=np.int32),
+            "bbox": _bboxes([row[4] for row in page_rows]),
+        },
+        "blocks": {
+            "page": np.array(block_pages, dtype=np.int32),
+            "bbox": _bboxes(block_bboxes),
+        },
+        "lines": {
+            "block": np.array(line_blocks, dtype=np.int32),
+            "bbox": _bboxes(line_bboxes),
+        },
+        "spans": {
+            "line": np.array(span_lines, dtype=np.int32),
+            "bbox": _bboxes(span_bboxes),
+            "rotation": np.array(span_rotations, dtype=np.float32),
+            "font": np.array(span_fonts, dtype=np.int32),
+            "char_start_idx": np.array([idxs[0] for idxs in span_char_idxs], dtype=np.int32),
+            "char_end_idx": np.array([idxs[1] for idxs in span_char_idxs], dtype=np.int32),
+            "superscript": span_flags[:, 0],
+            "subscript": span_flags[:, 1],
+            "text_ends": _ends(span_texts),
+            "url_ends": _ends(span_urls),
+        },
+        "chars": {
+            "span": np.array(char_spans, dtype=np.int32),
+            "bbox": _bboxes(char_bboxes),
+            "rotation": np.array(char_rotations, dtype=np.float32),
+            "font": np.array(char_fonts, dtype=np.int32),
+            "char_idx": np.array(char_idxs, dtype=np.int32),
+            "char_ends": _ends(char_texts),
+        },
+        "fonts": {
+            "size": np.array([font["size"] for font in fonts.fonts], dtype=np.float32),
+            "weight": np.array([font["weight"] for font in fonts.fonts], dtype=np.int32),
+            "flags": np.array([font["flags"] for font in fonts.fonts], dtype=np.int32),
+            "name_ends": _ends(font_names),
+        },
+        "refs": {
+            "page": np.array([ref[0] for ref in refs], dtype=np.int32),
+            "idx": np.array([ref[1] for ref in refs], dtype=np.int32),
+            "coord": _bboxes([ref[2] for ref in refs], 2),
+        },
+        "strings": {
+            "spans.text": "".join(span_texts),
+            "spans.url": "".join(span_urls),
+            "chars.char": "".join(char_texts),
+            "fonts.name": "".join(font_names),
+        },
+    }
+
+
+def columnar_output(
+        pdf_path,
+        sort=False,
+        page_range=None,
+        keep_chars=False,
+        flatten_pdf=False,
+        quote_loosebox=True,
+        disable_links=False,
+        workers=None,
+        pool=None,
+        cache=None
+) -> ColumnarDocument:
+    # Same arguments as dictionary_output, pages are flattened as they're yielded
+    return pages_to_columnar(iter_dictionary_output(
+        pdf_path,
+        sort=sort,
+        page_range=page_range,
+        keep_chars=keep_chars,
+        flatten_pdf=flatten_pdf,
+        quote_loosebox=quote_loosebox,
+        disable_links=disable_links,
+        workers=workers,
+        pool=pool,
+        cache=cache,
+        bbox_objects=True
+    ))
+
+
+def get_strings(document: ColumnarDocument, table: str, column: str) -> List[str]:
+    # Splits a string column back into one string per row
+    text = document["strings"][f"{table}.{column}"]
+    ends = document[table][f"{column}_ends"].tolist()
+    return [text[start:end] for start, end in zip([0] + ends, ends)]
+
+
+def save_npz(document: ColumnarDocument, path):
+    # A single uncompressed .npz, loadable with np.load and no pickle
+    arrays = {f"{table}.{column}": values for table in TABLES for column, values in document[table].items()}
+    arrays.update({f"strings.{key}": np.array(text) for key, text in document["strings"].items()})
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def load_npz(path) -> ColumnarDocument:
+    document = {table: {} for table in TABLES}
+    document["strings"] = {}
+    with np.load(path, allow_pickle=False) as data:
+        for key in data.files:
+            table, column = key.split(".", 1)
+            document[table][column] = str(data[key]) if table == "strings" else data[key]
+    return document
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+    except ImportError:
+        raise ImportError("Arrow output needs pyarrow, install it with `pip install pyarrow`")
+    return pyarrow
+
+
+def save_arrow(document: ColumnarDocument, directory):
+    """
+    Writes each table to directory/{table}.arrow, as an Arrow IPC (Feather v2) file.  Bboxes are fixed size lists of
+    float32, and string columns are Arrow strings.
+    """
+    pa = _import_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    for table in TABLES:
+        columns = {}
+        for column, values in document[table].items():
+            if column.endswith("_ends") and column[:-5] in STRING_COLUMNS.get(table, ()):
+                column = column[:-5]
+                columns[column] = pa.array(get_strings(document, table, column), type=pa.string())
+            elif column in BBOX_WIDTHS:
+                columns[column] = pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1)), BBOX_WIDTHS[column])
+            else:
+                columns[column] = pa.array(values)
+        pa.feather.write_feather(pa.table(columns), os.path.join(directory, f"{table}.arrow"))
+
+
+def load_arrow(directory) -> ColumnarDocument:
+    pa = _import_pyarrow()
+    document = {table: {} for table in TABLES}
+    document["strings"] = {}
+    for table in TABLES:
+        arrow_table = pa.feather.read_table(os.path.join(directory, f"{table}.arrow"))
+        for column in arrow_table.column_names:
+            values = arrow_table.column(column).combine_chunks()
+            if column in STRING_COLUMNS.get(table, ()):
+                strings = values.to_pylist()
+                document[table][f"{column}_ends"] = _ends(strings)
+                document["strings"][f"{table}.{column}"] = "".join(strings)
+            elif column in BBOX_WIDTHS:
+                document[table][column] = values.flatten().to_numpy().reshape(-1, BBOX_WIDTHS[column])
+            else:
+                document[table][column] = values.to_numpy(zero_copy_only=False)
+    return document
+
+
+def save_columnar(document: ColumnarDocument, path, format: str = "npz"):
+    if format == "npz":
+        save_npz(document, path)
+    elif format == "arrow":
+        save_arrow(document, path)
+    else:
+        raise ValueError(f"Unknown columnar format {format}, use npz or arrow")
+
+
+def load_columnar(path) -> ColumnarDocument:
+    # Arrow output is a directory of tables, npz is a single file
+    if os.path.isdir(path):
+        return load_arrow(path)
+    return load_npz(path)
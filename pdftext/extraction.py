@@ -1,95 +1,183 @@
-import atexit
-import math
-from concurrent.futures import ProcessPoolExecutor
-from functools import partial
-from itertools import repeat
-from typing import List
+from typing import Dict, Iterator, List
 
-import pypdfium2 as pdfium
-
-from pdftext.pdf.links import add_links_and_refs
-from pdftext.pdf.pages import get_pages
+from pdftext.cache import ResultCache, document_hash, get_default_cache
+from pdftext.pdf.links import resolve_links
+from pdftext.pdf.pages import iter_pages, iter_text_pages
+from pdftext.pool import ExtractionPool, _load_pdf, _page_range, as_pdf_input
 from pdftext.postprocessing import handle_hyphens, merge_text, postprocess_text, sort_blocks
-from pdftext.schema import Pages, TableInputs, Tables
+from pdftext.schema import Page, PageReference, Pages, TableInput, TableInputs, Tables
 from pdftext.settings import settings
 from pdftext.tables import table_cell_text
+from pdftext.wire import PackedPage, pack_page, unpack_page
 
 
-def _load_pdf(pdf, flatten_pdf):
-    pdf = pdfium.PdfDocument(pdf)
-
-    # Must be called on the parent pdf, before the page was retrieved
-    if flatten_pdf:
-        pdf.init_forms()
-
-    return pdf
+def _iter_pool_pages(pool: ExtractionPool, packed, pdf_path, page_range, flatten_pdf, quote_loosebox, text_only, keep_chars, links) -> Iterator[Page | PackedPage]:
+    if packed:
+        return pool.iter_packed_pages(pdf_path, page_range, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, text_only=text_only, links=links)
+    return pool.iter_pages(pdf_path, page_range, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, text_only=text_only, keep_chars=keep_chars, links=links)
 
 
-def _get_page_range(page_range, flatten_pdf=False, quote_loosebox=True) -> Pages:
-    return get_pages(pdf_doc, page_range, flatten_pdf, quote_loosebox)
+def _iter_extracted_pages(pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, workers=None, text_only=False, pool: ExtractionPool | None = None, keep_chars=True, links=False, packed=False) -> Iterator[Page | PackedPage]:
+    # keep_chars=False lets pages from workers skip building char dicts, spans keep an empty chars list
+    # packed=True yields PackedPage instead of page dicts
+    if pool is not None:
+        yield from _iter_pool_pages(pool, packed, pdf_path, page_range, flatten_pdf, quote_loosebox, text_only, keep_chars, links)
+        return
 
+    pdf_doc = _load_pdf(pdf_path, flatten_pdf)
+    link_pdf = None
+    try:
+        if page_range is None:
+            page_range = range(len(pdf_doc))
+
+        if workers is not None:
+            workers = min(workers, len(page_range) // settings.WORKER_PAGE_THRESHOLD)  # It's inefficient to have too many workers, since we batch in inference
+
+        if workers is None or workers <= 1:
+            if links:
+                # Flattening drops link annotations, so links come from an unflattened copy
+                link_pdf = _load_pdf(pdf_path, False) if flatten_pdf else pdf_doc
+            if text_only:
+                pages = iter_text_pages(pdf_doc, page_range, flatten_pdf)
+            else:
+                pages = iter_pages(pdf_doc, page_range, flatten_pdf, quote_loosebox, link_pdf=link_pdf)
+            yield from (map(pack_page, pages) if packed else pages)
+            return
+    finally:
+        if link_pdf is not None and link_pdf is not pdf_doc:
+            link_pdf.close()
+        pdf_doc.close()
 
-def worker_shutdown(pdf_doc):
-    pdf_doc.close()
-
+    with ExtractionPool(workers) as pool:
+        yield from _iter_pool_pages(pool, packed, pdf_path, page_range, flatten_pdf, quote_loosebox, text_only, keep_chars, links)
 
-def worker_init(pdf_path, flatten_pdf):
-    global pdf_doc
 
-    pdf_doc = _load_pdf(pdf_path, flatten_pdf)
+def _iter_cached_pages(cache: ResultCache, pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, workers=None, text_only=False, pool=None, links=False) -> Iterator[PackedPage]:
+    # Only options that change the extracted pages are in the key, sort, keep_chars and refs are applied afterwards
+    doc_hash = document_hash(pdf_path)
+    options = (flatten_pdf, quote_loosebox, text_only, links)
+    page_range = _page_range(pdf_path, page_range)
 
-    atexit.register(partial(worker_shutdown, pdf_doc))
+    misses = [page_idx for page_idx in page_range if not cache.contains(doc_hash, options, page_idx)]
+    miss_set = set(misses)
+    extracted = _iter_extracted_pages(pdf_path, misses, flatten_pdf, quote_loosebox, workers, text_only, pool, links=links, packed=True)
+    try:
+        for page_idx in page_range:
+            packed = None if page_idx in miss_set else cache.get(doc_hash, options, page_idx)
+            if packed is None:
+                if page_idx in miss_set:
+                    packed = next(extracted)
+                else:
+                    # Another process evicted the entry after the contains check
+                    packed = next(_iter_extracted_pages(pdf_path, [page_idx], flatten_pdf, quote_loosebox, text_only=text_only, links=links, packed=True))
+                cache.put(doc_hash, options, page_idx, packed)
+            yield packed
+    finally:
+        extracted.close()
 
 
-def _get_pages(pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, workers=None) -> Pages:
-    pdf_doc = _load_pdf(pdf_path, flatten_pdf)
-    if page_range is None:
-        page_range = range(len(pdf_doc))
+def _iter_pages(pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, workers=None, text_only=False, pool: ExtractionPool | None = None, keep_chars=True, links=False, cache: ResultCache | None = None) -> Iterator[Page]:
+    # Inputs are read once here, so file-like objects can be opened as many times as needed
+    pdf_path = as_pdf_input(pdf_path)
+    cache = cache or get_default_cache()
+    if cache is None:
+        yield from _iter_extracted_pages(pdf_path, page_range, flatten_pdf, quote_loosebox, workers, text_only, pool, keep_chars, links)
+        return
 
-    if workers is not None:
-        workers = min(workers, len(page_range) // settings.WORKER_PAGE_THRESHOLD)  # It's inefficient to have too many workers, since we batch in inference
+    for packed in _iter_cached_pages(cache, pdf_path, page_range, flatten_pdf, quote_loosebox, workers, text_only, pool, links):
+        yield unpack_page(packed, keep_chars)
 
-    if workers is None or workers <= 1:
-        pages = get_pages(pdf_doc, page_range, flatten_pdf, quote_loosebox)
-        pdf_doc.close()
-        return pages
 
-    pdf_doc.close()
-    page_range = list(page_range)
+def _get_pages(pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, workers=None, text_only=False, pool=None, cache=None) -> Pages:
+    return list(_iter_pages(pdf_path, page_range, flatten_pdf, quote_loosebox, workers, text_only, pool, cache=cache))
 
-    pages_per_worker = math.ceil(len(page_range) / workers)
-    page_range_chunks = [page_range[i * pages_per_worker:(i + 1) * pages_per_worker] for i in range(workers)]
 
-    with ProcessPoolExecutor(max_workers=workers, initializer=worker_init, initargs=(pdf_path, flatten_pdf)) as executor:
-        pages = list(executor.map(_get_page_range, page_range_chunks, repeat(flatten_pdf), repeat(quote_loosebox)))
+def iter_plain_text_output(pdf_path, sort=False, hyphens=False, page_range=None, flatten_pdf=False, workers=None, fast=False, pool=None, cache=None) -> Iterator[str]:
+    # fast skips per-char extraction, and only builds the lines and blocks needed for the text
+    for page in _iter_pages(pdf_path, page_range, workers=workers, flatten_pdf=flatten_pdf, text_only=fast, pool=pool, keep_chars=False, cache=cache):
+        yield merge_text(page, sort=sort, hyphens=hyphens).strip()
 
-    ordered_pages = [page for sublist in pages for page in sublist]
-    return ordered_pages
 
-
-def plain_text_output(pdf_path, sort=False, hyphens=False, page_range=None, flatten_pdf=False, workers=None) -> str:
-    text = paginated_plain_text_output(pdf_path, sort=sort, hyphens=hyphens, page_range=page_range, workers=workers, flatten_pdf=flatten_pdf)
+def plain_text_output(pdf_path, sort=False, hyphens=False, page_range=None, flatten_pdf=False, workers=None, fast=False, pool=None, cache=None) -> str:
+    text = paginated_plain_text_output(pdf_path, sort=sort, hyphens=hyphens, page_range=page_range, workers=workers, flatten_pdf=flatten_pdf, fast=fast, pool=pool, cache=cache)
     return "\n".join(text)
 
 
-def paginated_plain_text_output(pdf_path, sort=False, hyphens=False, page_range=None, flatten_pdf=False, workers=None) -> List[str]:
-    pages: Pages = _get_pages(pdf_path, page_range, workers=workers, flatten_pdf=flatten_pdf)
-    text = []
-    for page in pages:
-        text.append(merge_text(page, sort=sort, hyphens=hyphens).strip())
-    return text
+def paginated_plain_text_output(pdf_path, sort=False, hyphens=False, page_range=None, flatten_pdf=False, workers=None, fast=False, pool=None, cache=None) -> List[str]:
+    return list(iter_plain_text_output(pdf_path, sort=sort, hyphens=hyphens, page_range=page_range, flatten_pdf=flatten_pdf, workers=workers, fast=fast, pool=pool, cache=cache))
 
 
-def _process_span(span, page_width, page_height, keep_chars):
-    span["bbox"] = span["bbox"].bbox
+def _process_span(span, page_width, page_height, keep_chars, bbox_objects=False):
+    if not bbox_objects:
+        span["bbox"] = span["bbox"].bbox
     span["text"] = handle_hyphens(postprocess_text(span["text"]), keep_hyphens=True)
     if not keep_chars:
         del span["chars"]
-    else:
+    elif not bbox_objects:
         for char in span["chars"]:
             char["bbox"] = char["bbox"].bbox
 
 
+def _process_page(page: Page, sort=False, keep_chars=False, bbox_objects=False):
+    # bbox_objects leaves Bbox objects in place of bbox lists, for writers that serialize them directly
+    page_width, page_height = page["width"], page["height"]
+    for block in page["blocks"]:
+        for k in list(block.keys()):
+            if k not in ["lines", "bbox"]:
+                del block[k]
+        if not bbox_objects:
+            block["bbox"] = block["bbox"].bbox
+        for line in block["lines"]:
+            for k in list(line.keys()):
+                if k not in ["spans", "bbox"]:
+                    del line[k]
+            if not bbox_objects:
+                line["bbox"] = line["bbox"].bbox
+            for span in line["spans"]:
+                _process_span(span, page_width, page_height, keep_chars, bbox_objects)
+
+    if sort:
+        page["blocks"] = sort_blocks(page["blocks"])
+
+    if page["rotation"] == 90 or page["rotation"] == 270:
+        page["width"], page["height"] = page["height"], page["width"]
+        page["bbox"] = [page["bbox"][2], page["bbox"][3], page["bbox"][0], page["bbox"][1]]
+
+
+def finish_page(page: Page, refs: PageReference, sort=False, keep_chars=False, links=True, bbox_objects=False) -> Page:
+    # Turns an extracted page into an output page, pages have to be finished in page order to share refs
+    if links:
+        resolve_links(page, refs)
+        page["refs"] = refs.get_refs(page["page"])
+    _process_page(page, sort=sort, keep_chars=keep_chars, bbox_objects=bbox_objects)
+    return page
+
+
+def iter_dictionary_output(
+        pdf_path,
+        sort=False,
+        page_range=None,
+        keep_chars=False,
+        flatten_pdf=False,
+        quote_loosebox=True,
+        disable_links=False,
+        workers=None,
+        pool=None,
+        cache=None,
+        bbox_objects=False
+) -> Iterator[Page]:
+    """
+    Yields finished pages one at a time, in page order.
+    A page's refs list is shared with later pages, so refs from links on pages that haven't been yielded yet are
+    added to it as iteration continues.  With bbox_objects, bboxes are left as Bbox objects instead of lists.
+    """
+    refs = PageReference()
+    # Spans are split by link while extracting the page, only the ref numbering happens here
+    pages = _iter_pages(pdf_path, page_range, workers=workers, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, pool=pool, keep_chars=keep_chars, links=not disable_links, cache=cache)
+    for page in pages:
+        yield finish_page(page, refs, sort=sort, keep_chars=keep_chars, links=not disable_links, bbox_objects=bbox_objects)
+
+
 def dictionary_output(
         pdf_path,
         sort=False,
@@ -98,37 +186,34 @@ def dictionary_output(
         flatten_pdf=False,
         quote_loosebox=True,
         disable_links=False,
-        workers=None
+        workers=None,
+        pool=None,
+        cache=None
 ) -> Pages:
-    pages: Pages = _get_pages(pdf_path, page_range, workers=workers, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox)
+    return list(iter_dictionary_output(
+        pdf_path,
+        sort=sort,
+        page_range=page_range,
+        keep_chars=keep_chars,
+        flatten_pdf=flatten_pdf,
+        quote_loosebox=quote_loosebox,
+        disable_links=disable_links,
+        workers=workers,
+        pool=pool,
+        cache=cache
+    ))
 
-    if not disable_links:
-        pdf = _load_pdf(pdf_path, False)
-        add_links_and_refs(pages, pdf)
-        pdf.close()
 
-    for page in pages:
-        page_width, page_height = page["width"], page["height"]
-        for block in page["blocks"]:
-            for k in list(block.keys()):
-                if k not in ["lines", "bbox"]:
-                    del block[k]
-            block["bbox"] = block["bbox"].bbox
-            for line in block["lines"]:
-                for k in list(line.keys()):
-                    if k not in ["spans", "bbox"]:
-                        del line[k]
-                line["bbox"] = line["bbox"].bbox
-                for span in line["spans"]:
-                    _process_span(span, page_width, page_height, keep_chars)
+def _page_tables(page: Page, table_inputs: Dict[int, TableInput]) -> Tables:
+    # Runs in the workers for table_output, so only the table cells go back to the parent
+    _process_page(page, keep_chars=True)
+    return _table_cell_text(page, table_inputs[page["page"]])
 
-        if sort:
-            page["blocks"] = sort_blocks(page["blocks"])
 
-        if page["rotation"] == 90 or page["rotation"] == 270:
-            page["width"], page["height"] = page["height"], page["width"]
-            page["bbox"] = [page["bbox"][2], page["bbox"][3], page["bbox"][0], page["bbox"][1]]
-    return pages
+def _table_cell_text(page: Page, table_input: TableInput) -> Tables:
+    tables = table_cell_text(table_input["tables"], page, table_input["img_size"])
+    assert len(tables) == len(table_input["tables"]), "Number of tables and table inputs must match"
+    return tables
 
 
 def table_output(
@@ -138,18 +223,32 @@ def table_output(
     flatten_pdf=False,
     quote_loosebox=True,
     workers=None,
-    pages: Pages | None = None
+    pages: Pages | None = None,
+    pool=None,
+    cache=None
 ) -> List[Tables]:
-    # Extract pages if they don't exist
-    if not pages:
-        pages: Pages = dictionary_output(pdf_path, page_range=page_range, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, workers=workers, keep_chars=True)
-
-    assert len(pages) == len(table_inputs), "Number of pages and table inputs must match"
-
-    # Extract table cells per page
-    out_tables = []
-    for page, table_input in zip(pages, table_inputs):
-        tables = table_cell_text(table_input["tables"], page, table_input["img_size"])
-        assert len(tables) == len(table_input["tables"]), "Number of tables and table inputs must match"
-        out_tables.append(tables)
-    return out_tables
+    """
+    Extracts the text in table cells.  Pages are extracted one at a time, and only the cells are kept, so memory doesn't
+    grow with the document.  With workers or a pool, each page's cells are found in the worker that extracted it.
+    """
+    if pages:
+        assert len(pages) == len(table_inputs), "Number of pages and table inputs must match"
+        return [_table_cell_text(page, table_input) for page, table_input in zip(pages, table_inputs)]
+
+    pdf_path = as_pdf_input(pdf_path)
+    page_range = _page_range(pdf_path, page_range)
+    assert len(page_range) == len(table_inputs), "Number of pages and table inputs must match"
+
+    if workers is not None and pool is None:
+        workers = min(workers, len(page_range) // settings.WORKER_PAGE_THRESHOLD)
+    cache = cache or get_default_cache()
+    if cache is None and (pool is not None or (workers is not None and workers > 1)):
+        page_tables = dict(zip(page_range, table_inputs))
+        if pool is not None:
+            return list(pool.iter_page_results(pdf_path, _page_tables, page_range, flatten_pdf, quote_loosebox, links=True, table_inputs=page_tables))
+        with ExtractionPool(workers) as pool:
+            return list(pool.iter_page_results(pdf_path, _page_tables, page_range, flatten_pdf, quote_loosebox, links=True, table_inputs=page_tables))
+
+    # Cached pages are unpacked in this process, so the cells are found here
+    pages = iter_dictionary_output(pdf_path, page_range=page_range, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, keep_chars=True, workers=workers, pool=pool, cache=cache)
+    return [_table_cell_text(page, table_input) for page, table_input in zip(pages, table_inputs)]
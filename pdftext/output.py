@@ -0,0 +1,53 @@
+import dataclasses
+import json
+from typing import Iterable, TextIO
+
+from pdftext.schema import Bbox, Page, Reference
+
+
+def _default(obj):
+    if isinstance(obj, Bbox):
+        return obj.bbox
+    if isinstance(obj, Reference):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(default=_default)
+
+
+def dumps_page(page: Page) -> str:
+    return _encoder.encode(page)
+
+
+def write_json(pages: Iterable[Page], stream: TextIO, jsonl: bool = False, refs_stream: TextIO | None = None) -> int:
+    """
+    Writes each page to stream as soon as it's produced, as a JSON array matching json.dumps of the page list, or one
+    page per line with jsonl.  Bbox values are written as lists, so pages from iter_dictionary_output(bbox_objects=True)
+    can be written without converting.  Returns the number of pages written.
+
+    A page's refs can still grow after it's yielded (links on later pages), so pages are written without refs.  With
+    refs_stream, the refs of every page are written to it once all pages are done, in the same format as the pages,
+    each with its page.
+    """
+    count = 0
+    page_refs = []
+    if not jsonl:
+        stream.write("[")
+    for page in pages:
+        if "refs" in page:
+            page_refs.append(page["refs"])
+            page = {key: value for key, value in page.items() if key != "refs"}
+        if count and not jsonl:
+            stream.write(", ")
+        stream.write(dumps_page(page))
+        if jsonl:
+            stream.write("\n")
+        count += 1
+    if not jsonl:
+        stream.write("]")
+
+    if refs_stream is not None:
+        refs = [_encoder.encode(ref) for refs in page_refs for ref in refs]
+        refs_stream.write("".join(ref + "\n" for ref in refs) if jsonl else "[" + ", ".join(refs) + "]")
+    return count
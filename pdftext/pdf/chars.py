@@ -1,115 +1,193 @@
-import math
+from ctypes import POINTER, c_double, c_ushort, cast, create_string_buffer
+from typing import List
 
+import numpy as np
 import pypdfium2 as pdfium
 import pypdfium2.raw as pdfium_c
 
-from pdftext.pdf.utils import get_fontname
-from pdftext.schema import Bbox, Char, Chars, Spans, Span
-
-
-def get_chars(textpage: pdfium.PdfTextPage, page_bbox: list[float], page_rotation: int, quote_loosebox=True) -> Chars:
+from pdftext.pdf.utils import FontCache, page_bboxes
+from pdftext.schema import Bbox, CharArrays, Chars
+
+QUOTE_CODEPOINT = ord("'")
+WORD_BREAK_CHARS = ["\n", " ", "\x02"]
+WORD_BREAK_CODEPOINTS = [ord(c) for c in WORD_BREAK_CHARS]
+
+
+def get_char_arrays(
+    textpage: pdfium.PdfTextPage,
+    page_bbox: list[float],
+    page_rotation: int,
+    quote_loosebox=True,
+    font_cache: FontCache | None = None
+) -> CharArrays:
+    if font_cache is None:
+        font_cache = FontCache()
+
+    raw_textpage = textpage.raw
+    char_count = pdfium_c.FPDFText_CountChars(raw_textpage)
+
+    # Columns are collected as flat python lists, which is cheaper than per-element numpy writes
+    codepoints, rotations, boxes, font_ids, font_sizes, font_weights = [], [], [], [], [], []
+
+    # ctypes out-params are reused across chars instead of being allocated per call
+    loose_rect = pdfium_c.FS_RECTF()
+    left, right, bottom, top = c_double(), c_double(), c_double(), c_double()
+
+    for i in range(char_count):
+        codepoint = pdfium_c.FPDFText_GetUnicode(raw_textpage, i)
+        rotation = pdfium_c.FPDFText_GetCharAngle(raw_textpage, i)
+        loosebox = (rotation == 0) and (codepoint != QUOTE_CODEPOINT or quote_loosebox)
+
+        if loosebox:
+            ok = pdfium_c.FPDFText_GetLooseCharBox(raw_textpage, i, loose_rect)
+            boxes.extend((loose_rect.left, loose_rect.bottom, loose_rect.right, loose_rect.top))
+        else:
+            ok = pdfium_c.FPDFText_GetCharBox(raw_textpage, i, left, right, bottom, top)
+            boxes.extend((left.value, bottom.value, right.value, top.value))
+        if not ok:
+            raise pdfium.PdfiumError("Failed to get charbox.")
+
+        fontname, fontflag = font_cache.get_fontname(raw_textpage, i)
+        fontsize = pdfium_c.FPDFText_GetFontSize(raw_textpage, i)
+        fontweight = pdfium_c.FPDFText_GetFontWeight(raw_textpage, i)
+
+        codepoints.append(codepoint)
+        rotations.append(rotation)
+        font_ids.append(font_cache.get_font_id(fontname, fontflag, fontsize, fontweight))
+        font_sizes.append(fontsize)
+        font_weights.append(fontweight)
+
+    return {
+        "codepoint": np.array(codepoints, dtype=np.uint32),
+        "bbox": page_bboxes(np.array(boxes, dtype=np.float64).reshape(char_count, 4), page_bbox, page_rotation),
+        "rotation": np.array(rotations, dtype=np.float64),
+        "font_id": np.array(font_ids, dtype=np.int32),
+        "font_size": np.array(font_sizes, dtype=np.float64),
+        "font_weight": np.array(font_weights, dtype=np.int32),
+        "char_idx": np.arange(char_count, dtype=np.int32),
+        "fonts": font_cache.fonts,
+    }
+
+
+def chars_from_arrays(char_arrays: CharArrays, mask: np.ndarray | None = None) -> Chars:
+    columns = [char_arrays[k] for k in ["codepoint", "bbox", "rotation", "font_id", "char_idx"]]
+    if mask is not None:
+        columns = [column[mask] for column in columns]
+
+    fonts = char_arrays["fonts"]
     chars: Chars = []
-
-    x_start, y_start, x_end, y_end = page_bbox
-    page_width = math.ceil(abs(x_end - x_start))
-    page_height = math.ceil(abs(y_end - y_start))
-
-    for i in range(textpage.count_chars()):
-        text = chr(pdfium_c.FPDFText_GetUnicode(textpage, i))
-
-        rotation = pdfium_c.FPDFText_GetCharAngle(textpage, i)
-        loosebox = (rotation == 0) and (text != "'" or quote_loosebox)
-
-        char_box = textpage.get_charbox(i, loose=loosebox)
-        cx_start, cy_start, cx_end, cy_end = char_box
-
-        cx_start -= x_start
-        cx_end -= x_start
-        cy_start -= y_start
-        cy_end -= y_start
-
-        ty_start = page_height - cy_start
-        ty_end = page_height - cy_end
-
-        bbox_coords = [min(cx_start, cx_end), min(ty_start, ty_end), max(cx_start, cx_end), max(ty_start, ty_end)]
-        bbox = Bbox(bbox_coords).rotate(page_width, page_height, page_rotation)
-
-        fontname, fontflag = get_fontname(textpage, i)
-        fontsize = pdfium_c.FPDFText_GetFontSize(textpage, i)
-        fontweight = pdfium_c.FPDFText_GetFontWeight(textpage, i)
-
-        char_dict: Char = {
-            "bbox": bbox,
-            "char": text,
+    for codepoint, bbox, rotation, font_id, char_idx in zip(*[column.tolist() for column in columns]):
+        chars.append({
+            "bbox": Bbox(bbox),
+            "char": chr(codepoint),
             "rotation": rotation,
-            "font": {
-                "name": fontname,
-                "flags": fontflag,
-                "size": fontsize,
-                "weight": fontweight,
-            },
-            "char_idx": i
-        }
-        chars.append(char_dict)
-
+            "font": fonts[font_id],
+            "char_idx": char_idx
+        })
     return chars
 
 
+def get_text(textpage: pdfium.PdfTextPage) -> str:
+    """
+    Gets the text of every char on the page with one bulk pdfium call, indexed like the chars.
+    """
+    raw_textpage = textpage.raw
+    char_count = pdfium_c.FPDFText_CountChars(raw_textpage)
+    if char_count <= 0:
+        return ""
+
+    # Leave room for surrogate pairs, pdfium writes them past the requested count
+    buffer = create_string_buffer((char_count + 1) * 4)
+    unit_count = pdfium_c.FPDFText_GetText(raw_textpage, 0, char_count, cast(buffer, POINTER(c_ushort))) - 1
+    if unit_count != char_count:
+        # Chars outside the BMP take two utf-16 units, so the text no longer lines up with the char indices
+        return "".join(chr(pdfium_c.FPDFText_GetUnicode(raw_textpage, i)) for i in range(char_count))
+
+    units = np.frombuffer(buffer.raw, dtype="<u2", count=char_count).copy()
+    # pdfium reports hyphens as U+FFFE in bulk text, restore the hyphen char from the per-char unicode
+    for i in np.flatnonzero(units == 0xFFFE).tolist():
+        units[i] = pdfium_c.FPDFText_GetUnicode(raw_textpage, i)
+    return units.tobytes().decode("utf-16-le", errors="surrogatepass")
+
+
+def get_chars(
+    textpage: pdfium.PdfTextPage,
+    page_bbox: list[float],
+    page_rotation: int,
+    quote_loosebox=True,
+    font_cache: FontCache | None = None
+) -> Chars:
+    return chars_from_arrays(get_char_arrays(textpage, page_bbox, page_rotation, quote_loosebox, font_cache))
+
+
+def _word_starts(break_after: np.ndarray, font_ids: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+    # A word starts at the first char, after a space/newline/hyphen, and on any change in font or rotation
+    starts = np.ones(len(break_after), dtype=bool)
+    starts[1:] = break_after[:-1] | (font_ids[1:] != font_ids[:-1]) | (rotations[1:] != rotations[:-1])
+    return np.flatnonzero(starts)
+
+
+def _unique_words(starts: np.ndarray, bboxes: np.ndarray, word_texts: List[str], rotations: np.ndarray, font_ids: np.ndarray) -> np.ndarray:
+    mins = np.minimum.reduceat(bboxes[:, :2], starts, axis=0)
+    maxs = np.maximum.reduceat(bboxes[:, 2:], starts, axis=0)
+    # Viewing the rounded floats as ints gives cheap hashable keys (and keeps -0.0 apart from 0.0, like the old string keys)
+    rounded = np.round(np.concatenate([mins, maxs], axis=1)).view(np.int64).tolist()
+
+    seen = set()
+    keep = []
+    for bbox, text, rotation, font_id in zip(rounded, word_texts, rotations[starts].tolist(), font_ids[starts].tolist()):
+        key = (*bbox, text, rotation, font_id)
+        keep.append(key not in seen)
+        seen.add(key)
+    return np.array(keep, dtype=bool)
+
+
+def deduplicate_char_arrays(char_arrays: CharArrays) -> np.ndarray:
+    """
+    Builds words from the chars, and drops words that are exact duplicates of an earlier word (overprinted text).
+    Returns a boolean mask over the chars to keep.
+    """
+    codepoints = char_arrays["codepoint"]
+    char_count = len(codepoints)
+    if char_count == 0:
+        return np.zeros(0, dtype=bool)
+
+    starts = _word_starts(np.isin(codepoints, WORD_BREAK_CODEPOINTS), char_arrays["font_id"], char_arrays["rotation"])
+    ends = np.append(starts[1:], char_count)
+
+    text = codepoints.astype("<u4").tobytes().decode("utf-32-le", errors="surrogatepass")
+    word_texts = [text[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+    keep_words = _unique_words(starts, char_arrays["bbox"], word_texts, char_arrays["rotation"], char_arrays["font_id"])
+    return np.repeat(keep_words, ends - starts)
+
+
 def deduplicate_chars(chars: Chars) -> Chars:
-    # we first construct words from the chars and then deduplicate them
-    words: Spans = []
-    word: Span = None
-
-    def word_break():
-        words.append({
-            "bbox": char["bbox"],
-            "text": char["char"],
-            "rotation": char["rotation"],
-            "font": char["font"],
-            "char_start_idx": char["char_idx"],
-            "char_end_idx": char["char_idx"],
-            "chars": [char],
-            "url": '',
-        })
+    if not chars:
+        return []
 
+    font_ids = {}
+    char_font_ids = []
     for char in chars:
-        if words:
-            word = words[-1]
-
-        if not word:
-            word_break()
-            continue
-
-        # we also break on hyphenation
-        if any(word['text'].endswith(x) for x in ['\n', ' ', '\x02']):
-            word_break()
-            continue
-
-        # we break on any change in font info
-        if any(char['font'][k] != word['font'][k] for k in ['name', 'flags', 'size', 'weight']):
-            word_break()
-            continue
-
-        if char['rotation'] != word['rotation']:
-            word_break()
-            continue
-
-        word['text'] += char['char']
-        word['char_end_idx'] = char['char_idx']
-        word['bbox'] = word['bbox'].merge(char['bbox'])
-        word['chars'].append(char)
-
-    # deduplicate words
-    seen = {}
-    deduped = []
-    for word in words:
-        # Round the bbox coordinates
-        bbox = word['bbox'].bbox
-        bbox = [round(x, 0) for x in bbox]
-
-        key = f"{bbox}-{word['text']}-{word['rotation']}-{word['font']['name']}-{word['font']['flags']}-{word['font']['size']}-{word['font']['weight']}"
-        if key not in seen:
-            seen[key] = True
-            deduped.append(word)
-
-    return [char for word in deduped for char in word['chars']]
+        font = char["font"]
+        key = (font["name"], font["flags"], font["size"], font["weight"])
+        char_font_ids.append(font_ids.setdefault(key, len(font_ids)))
+
+    texts = [char["char"] for char in chars]
+    starts = _word_starts(
+        np.array([text[-1:] in WORD_BREAK_CHARS for text in texts], dtype=bool),
+        np.array(char_font_ids),
+        np.array([char["rotation"] for char in chars], dtype=np.float64)
+    )
+    ends = np.append(starts[1:], len(chars))
+    word_texts = ["".join(texts[start:end]) for start, end in zip(starts.tolist(), ends.tolist())]
+
+    keep_words = _unique_words(
+        starts,
+        np.array([char["bbox"].bbox for char in chars], dtype=np.float64),
+        word_texts,
+        np.array([char["rotation"] for char in chars], dtype=np.float64),
+        np.array(char_font_ids)
+    )
+    keep = np.repeat(keep_words, ends - starts).tolist()
+    return [char for char, keep_char in zip(chars, keep) if keep_char]
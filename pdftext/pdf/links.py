@@ -1,11 +1,12 @@
 import ctypes
 import math
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pypdfium2 as pdfium
 import pypdfium2.raw as pdfium_c
 
-from pdftext.pdf.utils import matrix_intersection_area
+from pdftext.pdf.utils import intersecting_pairs
 from pdftext.schema import Bbox, Link, Page, PageReference, Pages, Span
 
 
@@ -48,10 +49,25 @@ def _xy_to_scaled_pos(x, y, page_bbox, page_rotation, expand_by=1) -> List[float
     return _rect_to_scaled_bbox([x - expand_by, y - expand_by, x + expand_by, y + expand_by], page_bbox, page_rotation)[:2]
 
 
-def get_links(page_idx: int, pdf: pdfium.PdfDocument) -> List[Link]:
+def get_links(page_idx: int, pdf: pdfium.PdfDocument, page: pdfium.PdfPage | None = None) -> List[Link]:
     urls = []
 
-    page = pdf.get_page(page_idx)
+    # Reuse the page if the caller already holds it, since loading it again parses the content
+    own_page = page is None
+    if own_page:
+        page = pdf.get_page(page_idx)
+    try:
+        annot_count = pdfium_c.FPDFPage_GetAnnotCount(page)
+        if annot_count > 0:
+            urls = _get_annot_links(page_idx, pdf, page, annot_count)
+    finally:
+        if own_page:
+            page.close()
+    return urls
+
+
+def _get_annot_links(page_idx: int, pdf: pdfium.PdfDocument, page: pdfium.PdfPage, annot_count: int) -> List[Link]:
+    urls = []
     page_bbox: List[float] = page.get_bbox()
     page_rotation = 0
     try:
@@ -59,7 +75,7 @@ def get_links(page_idx: int, pdf: pdfium.PdfDocument) -> List[Link]:
     except:
         pass
 
-    annot_count = pdfium_c.FPDFPage_GetAnnotCount(page)
+    fs_rect = pdfium_c.FS_RECTF()
     for i in range(annot_count):
         link: Link = {
             'page': page_idx,
@@ -69,21 +85,23 @@ def get_links(page_idx: int, pdf: pdfium.PdfDocument) -> List[Link]:
             'url': None,
         }
         annot = pdfium_c.FPDFPage_GetAnnot(page, i)
-        if pdfium_c.FPDFAnnot_GetSubtype(annot) != pdfium_c.FPDF_ANNOT_LINK:
-            continue
+        try:
+            if pdfium_c.FPDFAnnot_GetSubtype(annot) != pdfium_c.FPDF_ANNOT_LINK:
+                continue
 
-        fs_rect = pdfium_c.FS_RECTF()
-        success = pdfium_c.FPDFAnnot_GetRect(annot, fs_rect)
-        if not success:
-            continue
+            success = pdfium_c.FPDFAnnot_GetRect(annot, fs_rect)
+            if not success:
+                continue
+
+            link_obj = pdfium_c.FPDFAnnot_GetLink(annot)
+        finally:
+            pdfium_c.FPDFPage_CloseAnnot(annot)
 
         link['bbox'] = _rect_to_scaled_bbox(
             [fs_rect.left, fs_rect.top, fs_rect.right, fs_rect.bottom],
             page_bbox, page_rotation
         )
 
-        link_obj = pdfium_c.FPDFAnnot_GetLink(annot)
-
         dest = pdfium_c.FPDFLink_GetDest(pdf, link_obj)
         if dest:
             tgt_page = pdfium_c.FPDFDest_GetDestPageIndex(pdf, dest)
@@ -122,30 +140,36 @@ def get_links(page_idx: int, pdf: pdfium.PdfDocument) -> List[Link]:
     return urls
 
 
-def merge_links(page: Page, pdf: pdfium.PdfDocument, refs: PageReference):
+def split_links(page: Page, links: List[Link]):
     """
     Merges links with spans. Some spans can also have multiple links associated with them.
     We break up the spans and reconstruct them taking the links into account.
+    Refs are numbered across the whole document, so internal links get an int url here, indexing into
+    page["link_refs"], and resolve_links swaps in the real url once earlier pages are done.
     """
     page_id = page["page"]
-
-    links = get_links(page_id, pdf)
+    page["link_refs"] = []
+    if not links:
+        return
 
     spans = [span for block in page['blocks'] for line in block['lines'] for span in line['spans']]
     span_bboxes = [span['bbox'].bbox for span in spans]
     link_bboxes = [link['bbox'] for link in links]
 
-    intersection_matrix = matrix_intersection_area(link_bboxes, span_bboxes)
+    # Each link goes to the span it overlaps most, the first one on ties
+    link_idxs, span_idxs, areas = intersecting_pairs(link_bboxes, span_bboxes)
+    order = np.lexsort((span_idxs, -areas, link_idxs))
+    link_idxs, span_idxs = link_idxs[order], span_idxs[order]
+    first = np.concatenate([[True], link_idxs[1:] != link_idxs[:-1]]) if len(link_idxs) else np.zeros(0, dtype=bool)
+    link_spans = dict(zip(link_idxs[first].tolist(), span_idxs[first].tolist()))
 
+    ref_ids: Dict[Tuple[int, Tuple[float, ...]], int] = {}
     span_link_map: Dict[int, List[Link]] = {}
     for link_idx, link in enumerate(links):
-        intersection_link = intersection_matrix[link_idx]
-        if intersection_link.sum() == 0:
+        max_intersection = link_spans.get(link_idx)
+        if max_intersection is None:
             continue
 
-        max_intersection = intersection_link.argmax()
-        span = spans[max_intersection]
-
         dest_page = link['dest_page']
         if dest_page is not None:
             if link['dest_pos']:
@@ -157,52 +181,107 @@ def merge_links(page: Page, pdf: pdfium.PdfDocument, refs: PageReference):
                 # if we don't have a dest pos, we just link to the top of the page
                 dest_pos = [0.0, 0.0]
 
-            ref = refs.add_ref(dest_page, dest_pos)
-            link['url'] = ref.url
+            # Links to the same target share a ref, so they also share a placeholder
+            ref_key = (dest_page, tuple(dest_pos))
+            if ref_key not in ref_ids:
+                ref_ids[ref_key] = len(page["link_refs"])
+                page["link_refs"].append((dest_page, dest_pos))
+            link['url'] = ref_ids[ref_key]
 
         span_link_map.setdefault(max_intersection, [])
         span_link_map[max_intersection].append(link)
 
+    linked_spans = sorted(span_link_map)
+    span_char_urls = dict(zip(linked_spans, _char_urls([spans[span_idx] for span_idx in linked_spans], [span_link_map[span_idx] for span_idx in linked_spans])))
+
     span_idx = 0
     for block in page["blocks"]:
         for line in block["lines"]:
             spans = []
             for span in line["spans"]:
-                if span_idx in span_link_map:
-                    spans.extend(_reconstruct_spans(span, span_link_map[span_idx]))
+                if span_idx in span_char_urls:
+                    spans.extend(_reconstruct_spans(span, span_char_urls[span_idx]))
                 else:
                     spans.append(span)
                 span_idx += 1
             line['spans'] = spans
 
 
-def _reconstruct_spans(orig_span: dict, links: List[Link]) -> List[Span]:
+def resolve_links(page: Page, refs: PageReference):
+    """
+    Adds the page's refs to the document refs, and replaces the placeholder urls from split_links.
+    Must be called in page order, since that's the order refs are numbered in.
+    """
+    link_refs = page.pop("link_refs", None)
+    if not link_refs:
+        return
+
+    urls = [refs.add_ref(dest_page, dest_pos).url for dest_page, dest_pos in link_refs]
+    for block in page["blocks"]:
+        for line in block["lines"]:
+            for span in line["spans"]:
+                if isinstance(span["url"], int):
+                    span["url"] = urls[span["url"]]
+
+
+def merge_links(page: Page, pdf: pdfium.PdfDocument, refs: PageReference):
+    split_links(page, get_links(page["page"], pdf))
+    resolve_links(page, refs)
+
+
+def add_links_and_refs(pages: Pages, pdf_doc: pdfium.PdfDocument):
+    # Links for already extracted pages, extraction with links=True does this per page instead
+    refs = PageReference()
+    for page in pages:
+        merge_links(page, pdf_doc, refs)
+
+    for page in pages:
+        page["refs"] = refs.get_refs(page["page"])
+
+
+def _char_urls(spans: List[Span], span_links: List[List[Link]]) -> List[List[Any]]:
+    """
+    The url of the link each char overlaps most, for the chars of every span, or '' if it doesn't overlap any of the
+    span's links.  All chars and links on the page are matched at once, and only chars near a link are compared.
+    """
+    chars = [char for span in spans for char in span['chars']]
+    links = [link for links in span_links for link in links]
+    char_spans = np.repeat(np.arange(len(spans)), [len(span['chars']) for span in spans])
+    link_spans = np.repeat(np.arange(len(spans)), [len(links) for links in span_links])
+
+    char_bboxes = np.array([char['bbox'].bbox for char in chars], dtype=np.float64).reshape(-1, 4)
+    # Chars without an area are grown by a point, like Bbox(ensure_nonzero_area=True)
+    no_area = (char_bboxes[:, 2] - char_bboxes[:, 0]) * (char_bboxes[:, 3] - char_bboxes[:, 1]) <= 0
+    char_bboxes[no_area, 2] = np.maximum(char_bboxes[no_area, 0], char_bboxes[no_area, 2] + 1)
+    char_bboxes[no_area, 3] = np.maximum(char_bboxes[no_area, 1], char_bboxes[no_area, 3] + 1)
+
+    char_idxs, link_idxs, areas = intersecting_pairs(char_bboxes, [link['bbox'] for link in links])
+    same_span = char_spans[char_idxs] == link_spans[link_idxs]
+    char_idxs, link_idxs, areas = char_idxs[same_span], link_idxs[same_span], areas[same_span]
+    # Largest area first, and the span's first link on ties
+    order = np.lexsort((link_idxs, -areas, char_idxs))
+    char_idxs, link_idxs = char_idxs[order], link_idxs[order]
+    first = np.concatenate([[True], char_idxs[1:] != char_idxs[:-1]]) if len(char_idxs) else np.zeros(0, dtype=bool)
+
+    char_urls = [''] * len(chars)
+    for char_idx, link_idx in zip(char_idxs[first].tolist(), link_idxs[first].tolist()):
+        char_urls[char_idx] = links[link_idx]['url']
+    ends = np.cumsum([len(span['chars']) for span in spans]).tolist()
+    return [char_urls[start:end] for start, end in zip([0] + ends, ends)]
+
+
+def _reconstruct_spans(orig_span: dict, char_urls: List[Any]) -> List[Span]:
     """
     Reconstructs the spans by breaking them up into smaller spans based on the links.
     """
     spans: List[Span] = []
     span: Span = None
-    link_bboxes = [Bbox(link['bbox']) for link in links]
-
-    for char in orig_span['chars']:
-        char_bbox = Bbox(char['bbox'].bbox)
-        intersections: List[Tuple[float, Link]] = []
-        for i, link_bbox in enumerate(link_bboxes):
-            if char_bbox.area > 0:
-                area = link_bbox.intersection_area(char_bbox)
-            else:
-                area = link_bbox.intersection_area(Bbox(char['bbox'].bbox, ensure_nonzero_area=True))
-            if area > 0:
-                intersections.append((area, links[i]))
-
-        current_url = ''
-        if intersections:
-            intersections.sort(key=lambda x: x[0], reverse=True)
-            current_url = intersections[0][1]['url']
 
+    for char, current_url in zip(orig_span['chars'], char_urls):
+        char_bbox = char['bbox']
         if not span or current_url != span['url']:
             span = {
-                "bbox": char_bbox,
+                "bbox": char_bbox.copy(),
                 "text": char["char"],
                 "rotation": char["rotation"],
                 "font": char["font"],
@@ -215,17 +294,7 @@ def _reconstruct_spans(orig_span: dict, links: List[Link]) -> List[Span]:
         else:
             span['text'] += char['char']
             span['char_end_idx'] = char['char_idx']
-            span['bbox'] = span['bbox'].merge(char_bbox)
+            span['bbox'].merge_into(char_bbox)
             span['chars'].append(char)
 
     return spans
-
-
-def add_links_and_refs(pages: Pages, pdf_doc: pdfium.PdfDocument):
-    refs = PageReference()
-
-    for page in pages:
-        merge_links(page, pdf_doc, refs)
-
-    for page in pages:
-        page["refs"] = refs.get_refs(page["page"])
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
 import math
-import statistics
-from typing import List
+import re
+from ctypes import c_double
+from itertools import accumulate
+from typing import Iterator, List, Tuple
 import unicodedata
 
+import numpy as np
 import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 
-from pdftext.pdf.chars import get_chars, deduplicate_chars
-from pdftext.pdf.utils import flatten
-from pdftext.schema import Blocks, Chars, Line, Lines, Pages, Span, Spans
+from pdftext.cache import PageCache, get_default_page_cache
+from pdftext.pdf.chars import chars_from_arrays, deduplicate_char_arrays, get_char_arrays, get_text
+from pdftext.pdf.links import get_links, split_links
+from pdftext.pdf.utils import FontCache, flatten, page_bboxes, page_content_hash
+from pdftext.schema import Bbox, Blocks, Chars, Line, Lines, Page, Pages, Span, Spans
+from pdftext.wire import pack_page, unpack_page
+
+LINE_END_RE = re.compile(r"[\n\x02]")
 
 
 def is_math_symbol(char):
@@ -19,6 +28,13 @@ def is_math_symbol(char):
     category = unicodedata.category(char)
     return category == 'Sm'
 
+def _reduce_others(values: List[float], func) -> List[float]:
+    # For each index, func (min or max) of every other value, from prefix and suffix reductions.  Needs 2+ values
+    prefix = list(accumulate(values, func))
+    suffix = list(accumulate(reversed(values), func))[::-1]
+    return [suffix[1]] + [func(prefix[i - 1], suffix[i + 1]) for i in range(1, len(values) - 1)] + [prefix[-2]]
+
+
 def assign_scripts(lines: Lines, height_threshold: float = 0.8, line_distance_threshold: float = 0.1):
     for line in lines:
         prev_span = None
@@ -29,6 +45,8 @@ def assign_scripts(lines: Lines, height_threshold: float = 0.8, line_distance_th
         if line["bbox"].height > line["bbox"].width:
             continue
 
+        other_tops = _reduce_others([s["bbox"].y_start - s["bbox"].height * line_distance_threshold for s in line["spans"]], max)
+        other_bottoms = _reduce_others([s["bbox"].y_end + s["bbox"].height * line_distance_threshold for s in line["spans"]], min)
         for i, span in enumerate(line["spans"]):
             is_first = i == 0 or not prev_span["text"].strip()
             is_last = i == len(line["spans"]) - 1 or not line["spans"][i + 1]["text"].strip()
@@ -40,11 +58,12 @@ def assign_scripts(lines: Lines, height_threshold: float = 0.8, line_distance_th
             next_fullheight = is_last or span_height / max(1, line["spans"][i + 1]["bbox"].height) <= height_threshold
             prev_fullheight = is_first or span_height / max(1, prev_span["bbox"].height) <= height_threshold
 
-            above = any([span_top < (s["bbox"].y_start - s["bbox"].height * line_distance_threshold) for j, s in enumerate(line["spans"]) if j != i])
+            # Above any other span is the same as above the highest of the others
+            above = span_top < other_tops[i]
             prev_above = is_first or span_top < prev_span["bbox"].y_start
             next_above = is_last or span_top < line["spans"][i + 1]["bbox"].y_start
 
-            below = any([span_bottom > (s["bbox"].y_end + s["bbox"].height * line_distance_threshold) for j, s in enumerate(line["spans"]) if j != i])
+            below = span_bottom > other_bottoms[i]
             prev_below = is_first or span_bottom > prev_span["bbox"].y_end
             next_below = is_last or span_bottom > line["spans"][i + 1]["bbox"].y_end
 
@@ -80,7 +99,7 @@ def get_spans(chars: Chars, superscript_height_threshold: float = 0.8, line_dist
 
     def span_break():
         spans.append({
-            "bbox": char["bbox"],
+            "bbox": char["bbox"].copy(),
             "text": char["char"],
             "rotation": char["rotation"],
             "font": char["font"],
@@ -98,8 +117,8 @@ def get_spans(chars: Chars, superscript_height_threshold: float = 0.8, line_dist
             span_break()
             continue
 
-        # we break on any change in font info
-        if any(char['font'][k] != span['font'][k] for k in ['name', 'flags', 'size', 'weight']):
+        # we break on any change in font info, interned fonts are the same object
+        if char['font'] is not span['font'] and any(char['font'][k] != span['font'][k] for k in ['name', 'flags', 'size', 'weight']):
             span_break()
             continue
 
@@ -123,7 +142,7 @@ def get_spans(chars: Chars, superscript_height_threshold: float = 0.8, line_dist
 
         span['text'] += char['char']
         span['char_end_idx'] = char['char_idx']
-        span['bbox'] = span['bbox'].merge(char['bbox'])
+        span['bbox'].merge_into(char['bbox'])
         span['chars'].append(char)
 
     return spans
@@ -134,7 +153,7 @@ def get_lines(spans: Spans) -> Lines:
     line: Line = None
 
     def line_break():
-        lines.append({"spans": [span], "bbox": span["bbox"], "rotation": span["rotation"]})
+        lines.append({"spans": [span], "bbox": span["bbox"].copy(), "rotation": span["rotation"]})
 
     for span in spans:
         if lines:
@@ -159,102 +178,281 @@ def get_lines(spans: Spans) -> Lines:
             continue
 
         line["spans"].append(span)
-        line["bbox"] = line["bbox"].merge(span["bbox"])
+        line["bbox"].merge_into(span["bbox"])
 
     return lines
 
 
+def _intersects(bbox: List[float], other: List[float]) -> bool:
+    # Bbox.intersection_pct(other) > 0, on bbox lists
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if area == 0:
+        return False
+    x_overlap = max(0, min(bbox[2], other[2]) - max(bbox[0], other[0]))
+    y_overlap = max(0, min(bbox[3], other[3]) - max(bbox[1], other[1]))
+    return x_overlap * y_overlap / area > 0
+
+
+def _union(bbox: List[float], other: List[float]) -> List[float]:
+    return [min(bbox[0], other[0]), min(bbox[1], other[1]), max(bbox[2], other[2]), max(bbox[3], other[3])]
+
+
 def get_blocks(lines: Lines) -> Blocks:
+    """
+    Groups consecutive lines into blocks, then merges consecutive blocks that overlap.  Most merge rules only compare a
+    line with the one before it, so they're computed for all lines at once, and split the lines into runs that are
+    always in the same block.  Only the first line of each run is checked against the block so far.
+    """
     if not lines:
         return []
 
-    x_diffs = []
-    y_diffs = []
-    for i in range(len(lines) - 1):
-        prev_center = lines[i]["bbox"].center
-        curr_center = lines[i + 1]["bbox"].center
-        x_diffs.append(abs(curr_center[0] - prev_center[0]))
-        y_diffs.append(abs(curr_center[1] - prev_center[1]))
+    bboxes = np.array([line["bbox"].bbox for line in lines], dtype=np.float64)
+    centers = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2, (bboxes[:, 1] + bboxes[:, 3]) / 2], axis=1)
+    x_diffs, y_diffs = np.abs(np.diff(centers, axis=0)).T
 
     median_x_gap = 0.1
-    if x_diffs:
-        median_x_gap = statistics.median(x_diffs) or median_x_gap
+    if len(x_diffs):
+        median_x_gap = float(np.median(x_diffs)) or median_x_gap
     median_y_gap = 0.1
-    if y_diffs:
-        median_y_gap = statistics.median(y_diffs) or median_y_gap
+    if len(y_diffs):
+        median_y_gap = float(np.median(y_diffs)) or median_y_gap
 
     tolerance_factor = 1.5
     allowed_x_gap = median_x_gap * tolerance_factor
     allowed_y_gap = median_y_gap * tolerance_factor
 
-    def block_merge():
-        block["lines"].append(line)
-        block["bbox"] = block["bbox"].merge(line["bbox"])
+    prev, curr = bboxes[:-1], bboxes[1:]
+    close_y = y_diffs <= allowed_y_gap
+    # we merge if the line is close enough to the previous line
+    merge = (x_diffs <= allowed_x_gap) & close_y
+    # we make an exception for the last line w.r.t the x diff, because the last line is can be incomplete
+    merge |= (prev[:, 2] > curr[:, 2]) & close_y
+    # if the y diff is very small, and you see a line continuation, we merge (can happen with inline math between text spans)
+    merge |= (y_diffs < allowed_y_gap * 0.2) & (prev[:, 2] > curr[:, 0])
+    # we make an exception for the first line w.r.t the x diff, because the first line is usually indented
+    indented_second_line = (prev[:, 0] > curr[:, 0]) & close_y
+
+    run_starts = np.flatnonzero(np.concatenate([[True], ~merge]))
+    run_lengths = np.diff(np.append(run_starts, len(lines))).tolist()
+    run_bboxes = np.stack([
+        np.minimum.reduceat(bboxes[:, 0], run_starts),
+        np.minimum.reduceat(bboxes[:, 1], run_starts),
+        np.maximum.reduceat(bboxes[:, 2], run_starts),
+        np.maximum.reduceat(bboxes[:, 3], run_starts),
+    ], axis=1).tolist()
+    first_bboxes = bboxes[run_starts].tolist()
+    run_indented = np.concatenate([[False], indented_second_line[run_starts[1:] - 1]]).tolist()
+
+    block_runs = [[0]]
+    block_bboxes = [run_bboxes[0]]
+    single_line_block = run_lengths[0] == 1
+    for run_idx in range(1, len(run_starts)):
+        # we also merge when we see the current line intersecting the previous block
+        if (run_indented[run_idx] and single_line_block) or _intersects(block_bboxes[-1], first_bboxes[run_idx]):
+            block_runs[-1].append(run_idx)
+            block_bboxes[-1] = _union(block_bboxes[-1], run_bboxes[run_idx])
+            single_line_block = False
+        else:
+            block_runs.append([run_idx])
+            block_bboxes.append(run_bboxes[run_idx])
+            single_line_block = run_lengths[run_idx] == 1
 
-    blocks: Blocks = []
-    for line in lines:
-        if not blocks:
-            # First block
-            blocks.append({"lines": [line], "bbox": line["bbox"], "rotation": line["rotation"]})
+    # we do one last pass of merging overlapping blocks in the PDF reading order
+    run_starts = run_starts.tolist() + [len(lines)]
+    groups = [[0]]
+    group_bboxes = [block_bboxes[0]]
+    for block_idx in range(1, len(block_runs)):
+        if _intersects(group_bboxes[-1], block_bboxes[block_idx]):
+            groups[-1].append(block_idx)
+            group_bboxes[-1] = _union(group_bboxes[-1], block_bboxes[block_idx])
+        else:
+            groups.append([block_idx])
+            group_bboxes.append(block_bboxes[block_idx])
+
+    merged_blocks: Blocks = []
+    for group, bbox in zip(groups, group_bboxes):
+        start, end = run_starts[block_runs[group[0]][0]], run_starts[block_runs[group[-1]][-1] + 1]
+        block = {"lines": lines[start:end], "bbox": Bbox(bbox)}
+        if group == [0]:
+            block["rotation"] = lines[0]["rotation"]  # Only the first block has a rotation, unless it was merged
+        merged_blocks.append(block)
+    return merged_blocks
+
+
+def get_text_lines(textpage: pdfium.PdfTextPage, page_bbox: List[float], page_rotation: int) -> Lines:
+    """
+    Text-only lines for plain text output. The text comes from one bulk pdfium call, and each line only gets
+    the bbox of pdfium's text rects, which is all that block grouping needs. Fonts, chars, duplicate removal
+    and superscripts are skipped.
+    """
+    text = get_text(textpage)
+    raw_textpage = textpage.raw
+
+    # Lines end after a newline or a hyphen, like in get_lines
+    line_ends = [match.end() for match in LINE_END_RE.finditer(text)]
+    if not line_ends or line_ends[-1] != len(text):
+        line_ends.append(len(text))
+
+    left, top, right, bottom = c_double(), c_double(), c_double(), c_double()
+    line_ranges = []
+    line_boxes = []
+    line_start = 0
+    for line_end in line_ends:
+        rect_count = pdfium_c.FPDFText_CountRects(raw_textpage, line_start, line_end - line_start)
+        if rect_count <= 0:
+            # Whitespace-only lines have no rects, keep their text with the previous line
+            if line_ranges:
+                line_ranges[-1][1] = line_end
+            line_start = line_end
             continue
 
-        block = blocks[-1]
-        last_line = block["lines"][-1]
+        line_box = None
+        for i in range(rect_count):
+            pdfium_c.FPDFText_GetRect(raw_textpage, i, left, top, right, bottom)
+            if line_box is None:
+                line_box = [left.value, bottom.value, right.value, top.value]
+            else:
+                line_box = [min(line_box[0], left.value), min(line_box[1], bottom.value), max(line_box[2], right.value), max(line_box[3], top.value)]
+        line_ranges.append([line_start, line_end])
+        line_boxes.extend(line_box)
+        line_start = line_end
 
-        last_center = last_line["bbox"].center
-        current_center = line["bbox"].center
+    bboxes = page_bboxes(np.array(line_boxes, dtype=np.float64).reshape(-1, 4), page_bbox, page_rotation)
 
-        x_diff = abs(current_center[0] - last_center[0])
-        y_diff = abs(current_center[1] - last_center[1])
+    lines: Lines = []
+    for (start, end), bbox in zip(line_ranges, bboxes.tolist()):
+        span = {
+            "bbox": Bbox(bbox),
+            "text": text[start:end],
+            "rotation": 0,
+            "char_start_idx": start,
+            "char_end_idx": end - 1,
+            "url": '',
+        }
+        lines.append({"spans": [span], "bbox": Bbox(list(bbox)), "rotation": 0})
+    return lines
 
-        # we merge if the line is close enough to the previous line
-        if x_diff <= allowed_x_gap and y_diff <= allowed_y_gap:
-            block_merge()
-            continue
 
-        # we make an exception for the first line w.r.t the x diff, because the first line is usually indented
-        line_x_indented_start = last_line["bbox"].x_start > line["bbox"].x_start
-        if len(block["lines"]) == 1 and line_x_indented_start and y_diff <= allowed_y_gap:
-            block_merge()
-            continue
+def _load_page(pdf: pdfium.PdfDocument, page_idx: int, flatten_pdf: bool) -> Tuple[pdfium.PdfPage, List[float], int, int, int]:
+    page = pdf.get_page(page_idx)
+    if flatten_pdf:
+        flatten(page)
+        page.close()
+        page = pdf.get_page(page_idx)
 
-        # we make an exception for the last line w.r.t the x diff, because the last line is can be incomplete
-        line_x_indented_end = last_line["bbox"].x_end > line["bbox"].x_end
-        if line_x_indented_end and y_diff <= allowed_y_gap:
-            block_merge()
-            continue
+    page_bbox: List[float] = page.get_bbox()
+    page_width = math.ceil(abs(page_bbox[2] - page_bbox[0]))
+    page_height = math.ceil(abs(page_bbox[1] - page_bbox[3]))
 
-        # if the y diff is very small, and you see a line continuation, we merge (can happen with inline math between text spans)
-        if y_diff < allowed_y_gap * 0.2 and last_line["bbox"].x_end > line["bbox"].x_start:
-            block_merge()
-            continue
+    page_rotation = 0
+    try:
+        page_rotation = page.get_rotation()
+    except:
+        pass
 
-        # we also merge when we see the current line intersecting the previous block
-        if block["bbox"].intersection_pct(line["bbox"]) > 0:
-            block_merge()
-            continue
+    return page, page_bbox, page_width, page_height, page_rotation
 
-        blocks.append({"lines": [line], "bbox": line["bbox"]})
 
-    # we do one last pass of merging overlapping blocks in the PDF reading order
-    merged_blocks = []
-    for i in range(len(blocks)):
-        if not merged_blocks:
-            merged_blocks.append(blocks[i])
-            continue
+def get_text_page(pdf: pdfium.PdfDocument, page_idx: int, flatten_pdf: bool = True) -> Page:
+    page, page_bbox, page_width, page_height, page_rotation = _load_page(pdf, page_idx, flatten_pdf)
+    textpage = page.get_textpage()
+    lines = get_text_lines(textpage, page_bbox, page_rotation)
+    textpage.close()
+    page.close()
 
-        prev_block = merged_blocks[-1]
-        curr_block = blocks[i]
+    return {
+        "page": page_idx,
+        "bbox": page_bbox,
+        "width": page_width,
+        "height": page_height,
+        "rotation": page_rotation,
+        "blocks": get_blocks(lines)
+    }
 
-        if prev_block["bbox"].intersection_pct(curr_block["bbox"]) > 0:
-            merged_blocks[-1] = {
-                "lines": prev_block["lines"] + curr_block["lines"],
-                "bbox": prev_block["bbox"].merge(curr_block["bbox"])
-            }
-        else:
-            merged_blocks.append(curr_block)
 
-    return merged_blocks
+def iter_text_pages(pdf: pdfium.PdfDocument, page_range: range, flatten_pdf: bool = True) -> Iterator[Page]:
+    for page_idx in page_range:
+        yield get_text_page(pdf, page_idx, flatten_pdf)
+
+
+def get_text_pages(pdf: pdfium.PdfDocument, page_range: range, flatten_pdf: bool = True) -> Pages:
+    return list(iter_text_pages(pdf, page_range, flatten_pdf))
+
+
+def get_page(
+    pdf: pdfium.PdfDocument,
+    page_idx: int,
+    flatten_pdf: bool = True,
+    quote_loosebox: bool = True,
+    superscript_height_threshold: float = 0.7,
+    line_distance_threshold: float = 0.1,
+    font_cache: FontCache | None = None,
+    link_pdf: pdfium.PdfDocument | None = None,
+    page_cache: PageCache | None = None,
+) -> Page:
+    """
+    Links are split into spans when link_pdf is given.  Flattening drops link annotations, so with flatten_pdf,
+    link_pdf must be a separate, unflattened copy of the document.
+    """
+    content_key = None
+    if page_cache is not None:
+        # Hashed before flattening, which changes the page, flatten_pdf is part of the key instead
+        content_key = (page_content_hash(pdf, page_idx), flatten_pdf, quote_loosebox, superscript_height_threshold, line_distance_threshold)
+        packed = page_cache.get(content_key)
+        if packed is not None:
+            fonts = [font_cache.intern(font) for font in packed.fonts] if font_cache is not None else None
+            page = unpack_page(packed, fonts=fonts)
+            page["page"] = page_idx
+            page["bbox"] = list(page["bbox"])
+            if link_pdf is not None:
+                split_links(page, get_links(page_idx, link_pdf))
+            return page
+
+    page, page_bbox, page_width, page_height, page_rotation = _load_page(pdf, page_idx, flatten_pdf)
+    links = None
+    if link_pdf is not None:
+        links = get_links(page_idx, link_pdf, None if flatten_pdf else page)
+    textpage = page.get_textpage()
+    char_arrays = get_char_arrays(textpage, page_bbox, page_rotation, quote_loosebox, font_cache)
+    # Release the pdfium page as soon as the chars are read
+    textpage.close()
+    page.close()
+
+    chars = chars_from_arrays(char_arrays, deduplicate_char_arrays(char_arrays))
+    spans = get_spans(chars, superscript_height_threshold=superscript_height_threshold, line_distance_threshold=line_distance_threshold)
+    lines = get_lines(spans)
+    assign_scripts(lines, height_threshold=superscript_height_threshold, line_distance_threshold=line_distance_threshold)
+    blocks = get_blocks(lines)
+
+    page = {
+        "page": page_idx,
+        "bbox": page_bbox,
+        "width": page_width,
+        "height": page_height,
+        "rotation": page_rotation,
+        "blocks": blocks
+    }
+    if content_key is not None:
+        page_cache.put(content_key, pack_page(page))
+    if links is not None:
+        split_links(page, links)
+    return page
+
+
+def iter_pages(
+    pdf: pdfium.PdfDocument,
+    page_range: range,
+    flatten_pdf: bool = True,
+    quote_loosebox: bool = True,
+    superscript_height_threshold: float = 0.7,
+    line_distance_threshold: float = 0.1,
+    link_pdf: pdfium.PdfDocument | None = None,
+    page_cache: PageCache | None = None,
+) -> Iterator[Page]:
+    font_cache = FontCache()
+    page_cache = page_cache or get_default_page_cache()
+    for page_idx in page_range:
+        yield get_page(pdf, page_idx, flatten_pdf, quote_loosebox, superscript_height_threshold, line_distance_threshold, font_cache, link_pdf, page_cache)
 
 
 def get_pages(
@@ -264,39 +462,7 @@ def get_pages(
     quote_loosebox: bool =True,
     superscript_height_threshold: float = 0.7,
     line_distance_threshold: float = 0.1,
+    link_pdf: pdfium.PdfDocument | None = None,
+    page_cache: PageCache | None = None,
 ) -> Pages:
-    pages: Pages = []
-
-    for page_idx in page_range:
-        page = pdf.get_page(page_idx)
-        if flatten_pdf:
-            flatten(page)
-            page = pdf.get_page(page_idx)
-
-        textpage = page.get_textpage()
-
-        page_bbox: List[float] = page.get_bbox()
-        page_width = math.ceil(abs(page_bbox[2] - page_bbox[0]))
-        page_height = math.ceil(abs(page_bbox[1] - page_bbox[3]))
-
-        page_rotation = 0
-        try:
-            page_rotation = page.get_rotation()
-        except:
-            pass
-
-        chars = deduplicate_chars(get_chars(textpage, page_bbox, page_rotation, quote_loosebox))
-        spans = get_spans(chars, superscript_height_threshold=superscript_height_threshold, line_distance_threshold=line_distance_threshold)
-        lines = get_lines(spans)
-        assign_scripts(lines, height_threshold=superscript_height_threshold, line_distance_threshold=line_distance_threshold)
-        blocks = get_blocks(lines)
-
-        pages.append({
-            "page": page_idx,
-            "bbox": page_bbox,
-            "width": page_width,
-            "height": page_height,
-            "rotation": page_rotation,
-            "blocks": blocks
-        })
-    return pages
+    return list(iter_pages(pdf, page_range, flatten_pdf, quote_loosebox, superscript_height_threshold, line_distance_threshold, link_pdf, page_cache))
@@ -1,5 +1,9 @@
+import ctypes
+import hashlib
+import math
+import re
 from ctypes import byref, c_int, create_string_buffer
-from typing import List
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pypdfium2 as pdfium
@@ -9,6 +13,7 @@ LINE_BREAKS = ["\n", "\u000D", "\u000A"]
 TABS = ["\t", "\u0009", "\x09"]
 SPACES = [" ", "\ufffe", "\uFEFF", "\xa0"]
 WHITESPACE_CHARS = ["\n", "\r", "\f", "\t", " "]
+CREATION_DATE_RE = re.compile(rb"/CreationDate\([^)]*\)")
 
 
 def flatten(page, flag=pdfium_c.FLAT_NORMALDISPLAY):
@@ -17,6 +22,36 @@ def flatten(page, flag=pdfium_c.FLAT_NORMALDISPLAY):
         raise pdfium.PdfiumError("Failed to flatten annotations / form fields.")
 
 
+def page_content_hash(pdf: pdfium.PdfDocument, page_idx: int) -> str:
+    """
+    Hashes the page's content streams and resources, by saving a copy of the page into an empty document.
+    Identical pages hash the same across documents, and any change that could change the extracted text doesn't.
+    """
+    blocks = []
+
+    def write_block(_, data, size):
+        blocks.append(ctypes.string_at(data, size))
+        return 1
+
+    writer = pdfium_c.FPDF_FILEWRITE()
+    writer.version = 1
+    writer.WriteBlock = type(writer.WriteBlock)(write_block)
+
+    page_doc = pdfium_c.FPDF_CreateNewDocument()
+    try:
+        if not pdfium_c.FPDF_ImportPagesByIndex(page_doc, pdf, (c_int * 1)(page_idx), 1, 0):
+            raise pdfium.PdfiumError(f"Failed to copy page {page_idx}.")
+        if not pdfium_c.FPDF_SaveAsCopy(page_doc, writer, pdfium_c.FPDF_NO_INCREMENTAL):
+            raise pdfium.PdfiumError(f"Failed to save page {page_idx}.")
+    finally:
+        pdfium_c.FPDF_CloseDocument(page_doc)
+
+    # The new document gets a creation date, and a time based ID in the trailer
+    data = b"".join(blocks)
+    data = CREATION_DATE_RE.sub(b"", data[:data.rfind(b"trailer")])
+    return hashlib.sha256(data).hexdigest()
+
+
 def get_fontname(textpage, i):
     font_name_str = ""
     flags = 0
@@ -38,6 +73,54 @@ def get_fontname(textpage, i):
     return font_name_str, flags
 
 
+class FontCache:
+    """
+    Interns font records for a document, so every char that shares a font also shares one font dict.
+    The ctypes buffers used to read font info are allocated once and reused for every char.
+    """
+    def __init__(self, buffer_size: int = 256):
+        self.buffer_size = buffer_size
+        self.buffer = create_string_buffer(buffer_size)
+        self.flags = c_int()
+        self.names: Dict[bytes, str] = {}
+        self.font_ids: Dict[Tuple[str, int, float, int], int] = {}
+        self.fonts: List[dict] = []
+
+    def get_fontname(self, textpage, i) -> Tuple[str, int]:
+        try:
+            length = pdfium_c.FPDFText_GetFontInfo(textpage, i, self.buffer, self.buffer_size, byref(self.flags))
+            if length > self.buffer_size:
+                self.buffer_size = length
+                self.buffer = create_string_buffer(length)
+                pdfium_c.FPDFText_GetFontInfo(textpage, i, self.buffer, length, byref(self.flags))
+
+            if length > 0:
+                raw_name = self.buffer.value
+                name = self.names.get(raw_name)
+                if name is None:
+                    name = self.names[raw_name] = raw_name.decode('utf-8')
+                return name, self.flags.value
+        except:
+            pass
+        return "", 0
+
+    def get_font_id(self, name: str, flags: int, size: float, weight: int) -> int:
+        key = (name, flags, size, weight)
+        font_id = self.font_ids.get(key)
+        if font_id is None:
+            font_id = self.font_ids[key] = len(self.fonts)
+            self.fonts.append({
+                "name": name,
+                "flags": flags,
+                "size": size,
+                "weight": weight,
+            })
+        return font_id
+
+    def intern(self, font: dict) -> dict:
+        return self.fonts[self.get_font_id(font["name"], font["flags"], font["size"], font["weight"])]
+
+
 def matrix_intersection_area(boxes1: List[List[float]], boxes2: List[List[float]]) -> np.ndarray:
     if len(boxes1) == 0 or len(boxes2) == 0:
         return np.zeros((len(boxes1), len(boxes2)))
@@ -57,3 +140,122 @@ def matrix_intersection_area(boxes1: List[List[float]], boxes2: List[List[float]
     height = np.maximum(0, max_y - min_y)
 
     return width * height  # Shape: (N, M)
+
+
+def _grid_cells(boxes: np.ndarray, origin: np.ndarray, cell_size: np.ndarray, grid_size: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    # (box index, cell id) for every grid cell each box covers.  Only boxes with a positive width and height can
+    # intersect anything, so the rest are left out
+    valid = np.flatnonzero(np.isfinite(boxes).all(axis=1) & (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1]))
+    cells = np.floor((boxes[valid] - np.tile(origin, 2)) / np.tile(cell_size, 2))
+    cells = np.clip(cells, 0, np.tile(np.array(grid_size) - 1, 2)).astype(np.int64)
+    x_counts = cells[:, 2] - cells[:, 0] + 1
+    counts = x_counts * (cells[:, 3] - cells[:, 1] + 1)
+    box_idxs = np.repeat(np.arange(len(valid)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = cells[box_idxs, 0] + offsets % x_counts[box_idxs]
+    cell_y = cells[box_idxs, 1] + offsets // x_counts[box_idxs]
+    return valid[box_idxs], cell_x * grid_size[1] + cell_y
+
+
+def intersecting_pairs(boxes1: List[List[float]], boxes2: List[List[float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The (index1, index2) pairs of boxes with a positive intersection area, sorted, and their areas, the same values as
+    matrix_intersection_area.  Both sets are bucketed into a grid about the size of a typical box, and only boxes that
+    share a cell are compared, so time and memory grow with the number of nearby pairs instead of
+    len(boxes1) * len(boxes2).
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    empty = np.zeros(0, dtype=np.int64)
+    both = np.concatenate([boxes1, boxes2])
+    both = both[np.isfinite(both).all(axis=1) & (both[:, 2] > both[:, 0]) & (both[:, 3] > both[:, 1])]
+    if len(boxes1) == 0 or len(boxes2) == 0 or len(both) == 0:
+        return empty, empty, np.zeros(0)
+
+    origin = both[:, :2].min(axis=0)
+    extent = both[:, 2:].max(axis=0) - origin
+    # Cells about the median box size, with at most ~4 cells per box so sparse pages or tiny boxes don't make huge grids
+    grid_size = np.clip(np.floor(extent / np.median(both[:, 2:] - both[:, :2], axis=0)), 1, len(both))
+    max_cells = 4 * len(both)
+    if grid_size.prod() > max_cells:
+        grid_size = np.clip(np.floor(grid_size * math.sqrt(max_cells / grid_size.prod())), 1, None)
+    grid_size = (int(grid_size[0]), int(grid_size[1]))
+    cell_size = extent / np.array(grid_size)
+    cell_size[cell_size <= 0] = 1.0
+    idxs1, cells1 = _grid_cells(boxes1, origin, cell_size, grid_size)
+    idxs2, cells2 = _grid_cells(boxes2, origin, cell_size, grid_size)
+
+    # Join the two sets on cell id, then drop pairs that share more than one cell
+    order = np.argsort(cells2, kind="stable")
+    idxs2, cells2 = idxs2[order], cells2[order]
+    starts = np.searchsorted(cells2, cells1, side="left")
+    counts = np.searchsorted(cells2, cells1, side="right") - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_keys = np.unique(np.repeat(idxs1, counts) * len(boxes2) + idxs2[np.repeat(starts, counts) + offsets])
+    pairs1, pairs2 = pair_keys // len(boxes2), pair_keys % len(boxes2)
+
+    box1, box2 = boxes1[pairs1], boxes2[pairs2]
+    width = np.maximum(0, np.minimum(box1[:, 2], box2[:, 2]) - np.maximum(box1[:, 0], box2[:, 0]))
+    height = np.maximum(0, np.minimum(box1[:, 3], box2[:, 3]) - np.maximum(box1[:, 1], box2[:, 1]))
+    areas = width * height
+    keep = areas > 0
+    return pairs1[keep], pairs2[keep], areas[keep]
+
+
+class SegmentUnion:
+    """
+    Running unions of (N, 4) boxes, where each box is merged with the boxes before it in its segment.  Offsetting each
+    value's rank by its segment makes a single cumulative max reset at every segment start, and keeps values exact.
+    The ranks only depend on the boxes, so they're computed once for any number of segmentations.
+    """
+    def __init__(self, bboxes: np.ndarray):
+        self.bboxes = bboxes
+        self.ranks = np.argsort(np.argsort(bboxes, axis=0, kind="stable"), axis=0, kind="stable")
+        self.sorted_values = np.sort(bboxes, axis=0)
+
+    def union(self, starts: np.ndarray) -> np.ndarray:
+        # starts marks the first box of each segment
+        n = len(self.bboxes)
+        offsets = ((np.cumsum(starts) - 1) * n)[:, None]
+        keys = self.ranks.copy()
+        keys[:, :2] = n - 1 - keys[:, :2]  # Mins are maxes over reversed ranks
+        keys = np.maximum.accumulate(keys + offsets, axis=0) - offsets
+        keys[:, :2] = n - 1 - keys[:, :2]
+        return np.take_along_axis(self.sorted_values, keys, axis=0)
+
+
+def rotate_bboxes(boxes: np.ndarray, page_width: float, page_height: float, rotation: int) -> np.ndarray:
+    # Vectorized version of Bbox.rotate over an (N, 4) array of boxes
+    if rotation not in [0, 90, 180, 270]:
+        raise ValueError("Rotation must be one of [0, 90, 180, 270] degrees.")
+
+    if rotation == 0:
+        return boxes
+
+    x_min, y_min, x_max, y_max = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    if rotation == 90:
+        new_x_min, new_y_min, new_x_max, new_y_max = page_height - y_max, x_min, page_height - y_min, x_max
+    elif rotation == 180:
+        new_x_min, new_y_min, new_x_max, new_y_max = page_width - x_max, page_height - y_max, page_width - x_min, page_height - y_min
+    else:
+        new_x_min, new_y_min, new_x_max, new_y_max = y_min, page_width - x_max, y_max, page_width - x_min
+
+    # Ensure that x_min < x_max and y_min < y_max
+    return np.stack([
+        np.minimum(new_x_min, new_x_max),
+        np.minimum(new_y_min, new_y_max),
+        np.maximum(new_x_min, new_x_max),
+        np.maximum(new_y_min, new_y_max)
+    ], axis=1)
+
+
+def page_bboxes(boxes: np.ndarray, page_bbox: List[float], page_rotation: int) -> np.ndarray:
+    # Converts (N, 4) pdfium left, bottom, right, top boxes to page space, flips the y axis, and applies the page rotation
+    x_start, y_start, x_end, y_end = page_bbox
+    page_width = math.ceil(abs(x_end - x_start))
+    page_height = math.ceil(abs(y_end - y_start))
+
+    xs = boxes[:, [0, 2]] - x_start
+    ys = page_height - (boxes[:, [1, 3]] - y_start)
+    bboxes = np.stack([xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)], axis=1)
+    return rotate_bboxes(bboxes, page_width, page_height, page_rotation)
@@ -0,0 +1,517 @@
+import asyncio
+import atexit
+import ctypes
+import mmap
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+from pdftext.cache import get_default_page_cache
+from pdftext.pdf.pages import get_pages, get_text_pages
+from pdftext.schema import Page, Pages
+from pdftext.settings import settings
+from pdftext.wire import PackedPage, pack_page, unpack_page
+
+# pdfium isn't thread safe, so the little pdfium work async calls do in the parent runs on one thread, off the event loop
+_pdfium_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdftext-pdfium")
+
+# Worker state, an LRU of open documents keyed by (pdf_path, flatten_pdf)
+_documents: OrderedDict = OrderedDict()
+_max_documents: int = settings.WORKER_MAX_OPEN_DOCUMENTS
+
+
+@dataclass(frozen=True)
+class SharedDocument:
+    # A pdf the parent copied into shared memory, which is what workers get instead of the bytes
+    name: str
+    size: int
+
+
+class _BufferReader:
+    # File access over a read-only buffer, for pdfium to read from without a copy of the whole document
+    def __init__(self, buffer: memoryview):
+        self.buffer = buffer
+        self.position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.position = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: len(self.buffer)}[whence] + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        end = len(self.buffer) if size < 0 else self.position + size
+        data = self.buffer[self.position:end].tobytes()
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.buffer[self.position:self.position + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def as_pdf_input(pdf):
+    """
+    Accepts a path, bytes, a buffer like a memoryview, bytearray or mmap, or a file-like object.
+    Returns a path, bytes, or a byte memoryview, which can all be opened more than once.
+    """
+    if isinstance(pdf, (str, bytes)):
+        return pdf
+    if isinstance(pdf, Path):
+        return str(pdf)
+    if isinstance(pdf, mmap.mmap):
+        return memoryview(pdf)
+    if hasattr(pdf, "read"):
+        # File-like objects can only be read once, and are usually request bodies rather than files
+        return pdf.read()
+    return memoryview(pdf).cast("B")
+
+
+class _BufferDocument(pdfium.PdfDocument):
+    # A document read from the caller's buffer.  pdfium's input holders sit in a reference cycle, so the buffer is
+    # released when the document closes, rather than whenever the cycle is collected
+    def __init__(self, buffer: memoryview):
+        self.buffer = buffer
+        try:
+            if buffer.readonly:
+                super().__init__(_BufferReader(buffer))
+            else:
+                # The view is by address, so only self.buffer exports the caller's buffer
+                address = ctypes.addressof((ctypes.c_char * buffer.nbytes).from_buffer(buffer))
+                super().__init__((ctypes.c_char * buffer.nbytes).from_address(address))
+        except BaseException:
+            buffer.release()
+            raise
+
+    def close(self, _by_parent=False):
+        closed = super().close(_by_parent)
+        self.buffer.release()
+        return closed
+
+
+def _load_pdf(pdf, flatten_pdf):
+    pdf = as_pdf_input(pdf)
+    pdf = _BufferDocument(pdf) if isinstance(pdf, memoryview) else pdfium.PdfDocument(pdf)
+
+    # Must be called on the parent pdf, before the page was retrieved
+    if flatten_pdf:
+        pdf.init_forms()
+
+    return pdf
+
+
+def _share_pdf(pdf) -> Tuple[Any, SharedMemory | None]:
+    # Paths are passed to workers as is, anything in memory is copied once into shared memory
+    if isinstance(pdf, str):
+        return pdf, None
+    shared_memory = SharedMemory(create=True, size=max(len(pdf), 1))
+    shared_memory.buf[:len(pdf)] = pdf
+    return SharedDocument(shared_memory.name, len(pdf)), shared_memory
+
+
+def _unshare_pdf(shared_memory: SharedMemory | None):
+    if shared_memory is not None:
+        shared_memory.close()
+        try:
+            shared_memory.unlink()
+        except FileNotFoundError:
+            pass  # Already cleaned up, when an abandoned generator is closed at shutdown
+
+
+def _open_document(pdf_path, flatten_pdf) -> Tuple[pdfium.PdfDocument, SharedMemory | None]:
+    if not isinstance(pdf_path, SharedDocument):
+        return _load_pdf(pdf_path, flatten_pdf), None
+
+    shared_memory = SharedMemory(name=pdf_path.name)
+    # pdfium reads the shared memory in place.  The view is by address, so it doesn't pin the buffer, and the
+    # shared memory can be closed once the document is
+    view = (ctypes.c_char * pdf_path.size).from_buffer(shared_memory.buf)
+    data = (ctypes.c_char * pdf_path.size).from_address(ctypes.addressof(view))
+    del view
+    pdf_doc = pdfium.PdfDocument(data)
+    if flatten_pdf:
+        pdf_doc.init_forms()
+    return pdf_doc, shared_memory
+
+
+def _close_document(pdf_doc: pdfium.PdfDocument, shared_memory: SharedMemory | None):
+    pdf_doc.close()
+    if shared_memory is not None:
+        shared_memory.close()
+
+
+def _close_documents():
+    while _documents:
+        _, document = _documents.popitem()
+        _close_document(*document)
+
+
+def worker_init(max_documents: int):
+    global _max_documents
+    _max_documents = max_documents
+
+    atexit.register(_close_documents)
+
+
+def _get_document(pdf_path, flatten_pdf) -> pdfium.PdfDocument:
+    key = (pdf_path, flatten_pdf)
+    document = _documents.get(key)
+    if document is not None:
+        _documents.move_to_end(key)
+        return document[0]
+
+    document = _open_document(pdf_path, flatten_pdf)
+    _documents[key] = document
+    while len(_documents) > _max_documents:
+        _, evicted = _documents.popitem(last=False)
+        _close_document(*evicted)
+    return document[0]
+
+
+@contextmanager
+def _batch_document(pdf_path, flatten_pdf) -> Iterator[pdfium.PdfDocument]:
+    if not isinstance(pdf_path, SharedDocument):
+        yield _get_document(pdf_path, flatten_pdf)
+        return
+
+    # Every call shares its pdf under a new name, so shared documents are never reused after it.  They're opened for
+    # each batch instead of going in the LRU, where they'd keep the memory mapped after the parent unlinks it
+    document = _open_document(pdf_path, flatten_pdf)
+    try:
+        yield document[0]
+    finally:
+        _close_document(*document)
+
+
+def _extract_pages(pdf_doc: pdfium.PdfDocument, pdf_path, page_range, flatten_pdf, quote_loosebox, text_only, links) -> Pages:
+    if text_only:
+        return get_text_pages(pdf_doc, page_range, flatten_pdf)
+    if not links:
+        return get_pages(pdf_doc, page_range, flatten_pdf, quote_loosebox)
+    if not flatten_pdf:
+        return get_pages(pdf_doc, page_range, flatten_pdf, quote_loosebox, link_pdf=pdf_doc)
+
+    # Flattening drops link annotations, so links come from an unflattened copy
+    link_document = _open_document(pdf_path, False)
+    try:
+        return get_pages(pdf_doc, page_range, flatten_pdf, quote_loosebox, link_pdf=link_document[0])
+    finally:
+        _close_document(*link_document)
+
+
+def _page_costs(pdf_doc: pdfium.PdfDocument, page_idxs: List[int]) -> Dict[int, int]:
+    # Per-char work dominates extraction time, so the char count is a cheap estimate of each page's cost
+    costs = {}
+    for page_idx in page_idxs:
+        page = pdf_doc.get_page(page_idx)
+        textpage = page.get_textpage()
+        costs[page_idx] = pdfium_c.FPDFText_CountChars(textpage)
+        textpage.close()
+        page.close()
+    return costs
+
+
+def _run_batch(pdf_path, page_range, flatten_pdf=False, quote_loosebox=True, text_only=False, links=False, page_func=None, cost_pages=(), **page_kwargs) -> Tuple[int, float, List[Any], Dict[str, int], Dict[int, int]]:
+    """
+    Extracts page_range, and estimates the cost of cost_pages, so the parent can schedule them.
+    Returns (pid, seconds busy, pages, page cache stats, {page_idx: cost}).
+    """
+    start = time.perf_counter()
+    page_cache = get_default_page_cache()
+    hits, misses = (page_cache.hits, page_cache.misses) if page_cache is not None else (0, 0)
+    with _batch_document(pdf_path, flatten_pdf) as pdf_doc:
+        pages = _extract_pages(pdf_doc, pdf_path, page_range, flatten_pdf, quote_loosebox, text_only, links)
+        costs = _page_costs(pdf_doc, cost_pages)
+    if page_func is None:
+        # Pages go back to the parent packed into arrays, which is much cheaper to pickle than nested dicts
+        pages = [pack_page(page) for page in pages]
+    else:
+        pages = [page_func(page, **page_kwargs) for page in pages]
+    cache_stats = {"page_cache_hits": 0, "page_cache_misses": 0}
+    if page_cache is not None:
+        cache_stats = {"page_cache_hits": page_cache.hits - hits, "page_cache_misses": page_cache.misses - misses}
+    return os.getpid(), time.perf_counter() - start, pages, cache_stats, costs
+
+
+def _page_range(pdf_path, page_range=None) -> List[int]:
+    if page_range is not None:
+        return list(page_range)
+    pdf_doc = _load_pdf(pdf_path, False)
+    try:
+        return list(range(len(pdf_doc)))
+    finally:
+        pdf_doc.close()
+
+
+class ExtractionPool:
+    """
+    A long-lived pool of worker processes that can extract pages from many documents.
+    Workers open documents lazily, and keep the most recently used ones open between calls.
+    """
+    def __init__(self, workers: int | None = None, max_open_documents: int = settings.WORKER_MAX_OPEN_DOCUMENTS):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=worker_init, initargs=(max_open_documents,))
+        self.max_in_flight = self.workers * settings.WORKER_BATCHES_IN_FLIGHT
+        self.worker_stats: Dict[int, Dict[str, float]] = {}
+        self.scheduled_time = 0.0
+        # With fork, workers start on the first submit.  Starting them now, before any pdf is in shared memory, keeps
+        # them from inheriting the parent's mapping of it, which would outlive the unlink.  The resource tracker is
+        # started first so workers share it, like they would if they'd been forked later
+        if os.name == "posix":
+            resource_tracker.ensure_running()
+        self.executor.submit(os.getpid).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def utilization(self) -> Dict[int, float]:
+        # Fraction of the scheduling wall time that each worker process spent extracting pages
+        if not self.scheduled_time:
+            return {}
+        return {pid: stats["busy"] / self.scheduled_time for pid, stats in self.worker_stats.items()}
+
+    def page_cache_stats(self) -> Dict[str, int]:
+        # Page cache hits and misses summed over the workers, see PAGE_CACHE_SIZE
+        return {
+            "hits": sum(stats["page_cache_hits"] for stats in self.worker_stats.values()),
+            "misses": sum(stats["page_cache_misses"] for stats in self.worker_stats.values()),
+        }
+
+    def _record(self, result: Tuple[int, float, List[PackedPage], Dict[str, int], Dict[int, int]]) -> List[PackedPage]:
+        pid, busy, pages, cache_stats, _ = result
+        stats = self.worker_stats.setdefault(pid, {"busy": 0.0, "pages": 0, "batches": 0, "page_cache_hits": 0, "page_cache_misses": 0})
+        stats["busy"] += busy
+        stats["pages"] += len(pages)
+        stats["batches"] += 1
+        for key, value in cache_stats.items():
+            stats[key] += value
+        return pages
+
+    def _schedule(self, items: Iterable[Tuple[Any, Any, int | None]], return_exceptions=False, **kwargs) -> Iterator[Tuple[Any, PackedPage | BaseException | None]]:
+        """
+        Runs (key, pdf_path, page_idx) items, and yields (key, packed page) in item order.
+        Idle workers pull small batches from a shared queue.  Only items within WORKER_SCHEDULE_HORIZON of the next page
+        to yield are scheduled, which bounds the pages held for reordering.  Each batch also has its worker estimate the
+        cost of a few upcoming pages, and once pages have a cost, the most expensive ones go first.  Items with a
+        page_idx of None are placeholders, and yield (key, None).  With return_exceptions, pages from a failed batch
+        yield the exception instead of raising it.
+        """
+        items = iter(items)
+        horizon = []  # [position, key, pdf_path, page_idx, cost], not yet submitted, cost is None until it's estimated
+        cost_requested = set()  # Positions of items a worker is estimating the cost of
+        in_flight = {}  # future -> (batch, cost items)
+        results = {}
+        next_position = 0
+        next_yield = 0
+
+        def fill_horizon():
+            # Items are cheap to pull, nothing is opened until a worker gets them
+            nonlocal next_position
+            while next_position < next_yield + settings.WORKER_SCHEDULE_HORIZON:
+                item = next(items, None)
+                if item is None:
+                    return
+                key, pdf_path, page_idx = item
+                if page_idx is None:
+                    results[next_position] = (key, None)
+                else:
+                    horizon.append([next_position, key, pdf_path, page_idx, None])
+                next_position += 1
+
+        def next_batch():
+            costed = [item for item in horizon if item[4] is not None]
+            if costed:
+                largest = max(costed, key=lambda item: item[4])
+                batch = sorted([item for item in costed if item[2] == largest[2]], key=lambda item: item[4], reverse=True)
+            else:
+                batch = [item for item in horizon if item[2] == horizon[0][2]]
+            batch = batch[:settings.WORKER_BATCH_PAGES]
+            batch_positions = {item[0] for item in batch}
+            horizon[:] = [item for item in horizon if item[0] not in batch_positions]
+            return batch
+
+        def cost_items(pdf_path):
+            # The worker has the document open already, so it estimates pages from the same one.  Asking for more pages
+            # than each batch extracts lets the estimates get ahead of extraction, up to the horizon
+            found = []
+            for item in horizon:
+                if len(found) == 2 * settings.WORKER_BATCH_PAGES:
+                    break
+                if item[4] is None and item[2] == pdf_path and item[0] not in cost_requested:
+                    cost_requested.add(item[0])
+                    found.append(item)
+            return found
+
+        start = time.perf_counter()
+        try:
+            while True:
+                fill_horizon()
+                while horizon and len(in_flight) < self.max_in_flight:
+                    batch = next_batch()
+                    estimate = cost_items(batch[0][2])
+                    future = self.executor.submit(_run_batch, batch[0][2], [item[3] for item in batch], cost_pages=[item[3] for item in estimate], **kwargs)
+                    in_flight[future] = (batch, estimate)
+
+                if next_yield in results:
+                    yield results.pop(next_yield)
+                    next_yield += 1
+                    continue
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, estimate = in_flight.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        if not return_exceptions:
+                            raise error
+                        pages = [error] * len(batch)
+                    else:
+                        result = future.result()
+                        pages = self._record(result)
+                        for item in estimate:
+                            item[4] = result[4][item[3]]
+                    for item in estimate:
+                        cost_requested.discard(item[0])
+                    for item, page in zip(batch, pages):
+                        results[item[0]] = (item[1], page)
+        finally:
+            for future in in_flight:
+                future.cancel()
+            self.scheduled_time += time.perf_counter() - start
+
+    def iter_packed_pages(self, pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, text_only=False, links=False) -> Iterator[PackedPage]:
+        return self.iter_page_results(pdf_path, None, page_range, flatten_pdf, quote_loosebox, text_only, links)
+
+    def iter_page_results(self, pdf_path, page_func, page_range=None, flatten_pdf=False, quote_loosebox=True, text_only=False, links=False, **page_kwargs) -> Iterator[Any]:
+        """
+        Yields page_func(page, **page_kwargs) for each page, in page order.  page_func runs in the workers, on the page
+        dict before links are resolved, so only its result is sent back.  It has to be a module level function so it
+        can be pickled.  Without page_func, pages come back packed.
+        """
+        pdf_path = as_pdf_input(pdf_path)
+        source, shared_memory = _share_pdf(pdf_path)
+        try:
+            items = ((None, source, page_idx) for page_idx in _page_range(pdf_path, page_range))
+            for _, result in self._schedule(items, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, text_only=text_only, links=links, page_func=page_func, **page_kwargs):
+                yield result
+        finally:
+            _unshare_pdf(shared_memory)
+
+    async def iter_packed_pages_async(self, pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, text_only=False, links=False, max_in_flight_pages: int | None = None) -> AsyncIterator[PackedPage]:
+        """
+        Async version of iter_packed_pages.  Batches are submitted in page order, with at most max_in_flight_pages
+        submitted and not yet yielded, so a slow consumer stops new work being queued.  If the caller stops iterating
+        or is cancelled, batches that haven't started are cancelled.  Reading file-like inputs, counting pages and
+        copying into shared memory run in threads, so the event loop isn't blocked.
+        """
+        loop = asyncio.get_running_loop()
+        max_in_flight_pages = max_in_flight_pages or settings.ASYNC_MAX_IN_FLIGHT_PAGES
+        pdf_path = await loop.run_in_executor(None, as_pdf_input, pdf_path)
+        page_range = await loop.run_in_executor(_pdfium_executor, _page_range, pdf_path, page_range)
+        batch_pages = settings.WORKER_BATCH_PAGES
+        batches = [page_range[i:i + batch_pages] for i in range(0, len(page_range), batch_pages)]
+
+        sharing = loop.run_in_executor(None, _share_pdf, pdf_path)
+        try:
+            source, shared_memory = await asyncio.shield(sharing)
+        except asyncio.CancelledError:
+            # The copy carries on in its thread, so its shared memory is released once it's done
+            sharing.add_done_callback(lambda future: future.exception() or _unshare_pdf(future.result()[1]))
+            raise
+
+        in_flight = deque()  # (future, batch size), in page order
+        in_flight_pages = 0
+        next_batch = 0
+        try:
+            while next_batch < len(batches) or in_flight:
+                while next_batch < len(batches) and (not in_flight or in_flight_pages + len(batches[next_batch]) <= max_in_flight_pages):
+                    batch = batches[next_batch]
+                    future = self.executor.submit(_run_batch, source, batch, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, text_only=text_only, links=links)
+                    in_flight.append((asyncio.wrap_future(future), len(batch)))
+                    in_flight_pages += len(batch)
+                    next_batch += 1
+
+                future, size = in_flight[0]
+                pages = self._record(await future)
+                in_flight.popleft()
+                in_flight_pages -= size
+                for page in pages:
+                    yield page
+        finally:
+            for future, _ in in_flight:
+                future.cancel()
+            _unshare_pdf(shared_memory)
+
+    def iter_pages(self, pdf_path, page_range=None, flatten_pdf=False, quote_loosebox=True, text_only=False, keep_chars=True, links=False) -> Iterator[Page]:
+        # Pages are only unpacked as they're yielded, and char dicts are skipped unless keep_chars is set
+        for packed in self.iter_packed_pages(pdf_path, page_range, flatten_pdf, quote_loosebox, text_only, links):
+            yield unpack_page(packed, keep_chars)
+
+    def iter_documents(self, documents: Iterable, flatten_pdf=False, quote_loosebox=True, text_only=False, keep_chars=True, links=False, return_exceptions=False) -> Iterator[Tuple[Any, Pages | BaseException]]:
+        """
+        Extracts many documents, yielding (pdf_path, pages) in input order.
+        Each document is a pdf path or any other input extraction accepts, or a (pdf, page_range) tuple, and is yielded
+        back as given.  Pages from all documents share one queue, so small and large documents keep every worker busy.
+        With links, spans are split by link in the workers, and resolve_links numbers the refs once pages are back in
+        order.  With return_exceptions, a document that fails yields (pdf_path, exception), and the rest carry on.
+        """
+        shared = {}  # Shared memory for documents that haven't been yielded yet, by document position
+
+        def items():
+            for doc_idx, document in enumerate(documents):
+                pdf_path, page_range = document if isinstance(document, tuple) else (document, None)
+                try:
+                    pdf_input = as_pdf_input(pdf_path)
+                    page_idxs = _page_range(pdf_input, page_range)
+                except Exception as error:
+                    if not return_exceptions:
+                        raise
+                    yield (doc_idx, pdf_path, True, error), None, None
+                    continue
+
+                source, shared[doc_idx] = _share_pdf(pdf_input) if page_idxs else (None, None)
+                if not page_idxs:
+                    yield (doc_idx, pdf_path, True, None), source, None
+                for i, page_idx in enumerate(page_idxs):
+                    yield (doc_idx, pdf_path, i == len(page_idxs) - 1, None), source, page_idx
+
+        doc_pages: Pages = []
+        doc_error = None
+        try:
+            schedule = self._schedule(items(), return_exceptions=return_exceptions, flatten_pdf=flatten_pdf, quote_loosebox=quote_loosebox, text_only=text_only, links=links)
+            for (doc_idx, pdf_path, is_last, error), packed in schedule:
+                if isinstance(packed, BaseException):
+                    doc_error = doc_error or packed
+                elif packed is not None and doc_error is None:
+                    doc_pages.append(unpack_page(packed, keep_chars))
+                if is_last:
+                    _unshare_pdf(shared.pop(doc_idx, None))
+                    error = error or doc_error
+                    yield pdf_path, doc_pages if error is None else error
+                    doc_pages = []
+                    doc_error = None
+        finally:
+            for shared_memory in shared.values():
+                _unshare_pdf(shared_memory)
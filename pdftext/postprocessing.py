@@ -1,3 +1,4 @@
+import re
 import unicodedata
 from typing import List
 
@@ -19,38 +20,67 @@ REPLACEMENTS = {
 }
 
 
+class _TranslationTable(dict):
+    # A str.translate table that maps each codepoint with func the first time it's seen.  Every codepoint can't be
+    # listed up front, since most of the unicode range (unassigned and private use) is control chars
+    def __init__(self, func):
+        super().__init__()
+        self.func = func
+
+    def __missing__(self, codepoint: int) -> str:
+        value = self[codepoint] = self.func(chr(codepoint))
+        return value
+
+
+def _is_control_char(char: str) -> bool:
+    return unicodedata.category(char)[0] == "C" and char != HYPHEN_CHAR and char not in WHITESPACE_CHARS
+
+
 def postprocess_text(text: str) -> str:
+    # REPLACEMENTS are multi-char, the rest is one translate pass, the same as running each step on every char
     for old, new in REPLACEMENTS.items():
-        text = text.replace(old, new)
-    text = replace_special_chars(text)
-    text = replace_control_chars(text)
-    text = replace_ligatures(text)
-    return text
+        if old in text:
+            text = text.replace(old, new)
+    return text.translate(_POSTPROCESS_TABLE)
+
+
+def _rstrip_parts(parts: List[str]):
+    # rstrip of "".join(parts), in place
+    while parts and not parts[-1].rstrip():
+        parts.pop()
+    if parts:
+        parts[-1] = parts[-1].rstrip()
 
 
 def handle_hyphens(text: str, keep_hyphens=False) -> str:
     if keep_hyphens:
-        text = text.replace(HYPHEN_CHAR, "-\n")
-    elif len(text) == 0:
-        pass
-    else:
-        new_text = ""
-        found_hyphen = False
-        for i in range(len(text) - 1):
-            if text[i] == HYPHEN_CHAR:
-                found_hyphen = True
-            elif found_hyphen:
-                if text[i] in LINE_BREAKS:
-                    pass
-                elif text[i] in SPACES:
-                    new_text = new_text.rstrip() + "\n"
-                    found_hyphen = False
-                else:
-                    new_text += text[i]
-            else:
-                new_text += text[i]
-        text = new_text
-    return text
+        return text.replace(HYPHEN_CHAR, "-\n")
+    if len(text) == 0:
+        return text
+
+    # The last char is dropped, page text always ends with a line break
+    text = text[:-1]
+    if HYPHEN_CHAR not in text:
+        return text
+
+    # Everything from a hyphen to the next space is joined without line breaks, and the space ends the line
+    parts = []
+    start = 0
+    while True:
+        hyphen = text.find(HYPHEN_CHAR, start)
+        if hyphen == -1:
+            parts.append(text[start:])
+            break
+        parts.append(text[start:hyphen])
+        space = _SPACES_RE.search(text, hyphen)
+        end = space.start() if space else len(text)
+        parts.append(text[hyphen:end].translate(_HYPHEN_JOIN_TABLE))
+        if space is None:
+            break
+        _rstrip_parts(parts)
+        parts.append("\n")
+        start = end + 1
+    return "".join(parts)
 
 
 def replace_special_chars(text: str) -> str:
@@ -64,7 +94,7 @@ def replace_special_chars(text: str) -> str:
 
 
 def replace_control_chars(text: str) -> str:
-    return "".join(char for char in text if (unicodedata.category(char)[0] != "C" or char == HYPHEN_CHAR or char in WHITESPACE_CHARS))
+    return text.translate(_CONTROL_CHARS_TABLE)
 
 
 def replace_ligatures(text: str) -> str:
@@ -73,6 +103,12 @@ def replace_ligatures(text: str) -> str:
     return text
 
 
+_SPACES_RE = re.compile("[" + "".join(re.escape(space) for space in SPACES) + "]")
+_HYPHEN_JOIN_TABLE = {ord(char): None for char in [HYPHEN_CHAR] + LINE_BREAKS}
+_CONTROL_CHARS_TABLE = _TranslationTable(lambda char: "" if _is_control_char(char) else char)
+_POSTPROCESS_TABLE = _TranslationTable(lambda char: replace_ligatures(replace_control_chars(replace_special_chars(char))))
+
+
 def sort_blocks(blocks: List, tolerance=1.25) -> List:
     # Sort blocks into best guess reading order
     vertical_groups = {}
@@ -93,21 +129,12 @@ def sort_blocks(blocks: List, tolerance=1.25) -> List:
 
 
 def merge_text(page: Page, sort=False, hyphens=False) -> str:
-    text = ""
     if sort:
         page["blocks"] = sort_blocks(page["blocks"])
 
+    blocks = []
     for block in page["blocks"]:
-        block_text = ""
-        for line in block["lines"]:
-            line_text = ""
-            for span in line["spans"]:
-                line_text += span["text"]
-            line_text = postprocess_text(line_text)
-            line_text = line_text.rstrip() + "\n"
-
-            block_text += line_text
-        block_text = block_text.rstrip() + "\n\n"
-        text += block_text
-    text = handle_hyphens(text, keep_hyphens=hyphens)
-    return text
+        lines = [postprocess_text("".join(span["text"] for span in line["spans"])).rstrip() for line in block["lines"]]
+        blocks.append("\n".join(lines).rstrip())
+        blocks.append("\n\n")
+    return handle_hyphens("".join(blocks), keep_hyphens=hyphens)
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, TypedDict, Union
+from typing import Any, Dict, List, Optional, Tuple, TypedDict, Union
+
+import numpy as np
 
 
 class Bbox:
+    # Bboxes are allocated for every char, so skip the per-instance __dict__
+    __slots__ = ("bbox", "ensure_nonzero_area")
+
     def __init__(self, bbox: List[float], ensure_nonzero_area=False):
         if ensure_nonzero_area:
             bbox = list(bbox)
@@ -13,6 +18,12 @@ class Bbox:
         self.bbox = bbox
         self.ensure_nonzero_area = ensure_nonzero_area
 
+    def __getstate__(self):
+        return self.bbox, self.ensure_nonzero_area
+
+    def __setstate__(self, state):
+        self.bbox, self.ensure_nonzero_area = state
+
     def __getitem__(self, item):
         return self.bbox[item]
 
@@ -63,6 +74,25 @@ class Bbox:
 
         return Bbox([x_start, y_start, x_end, y_end])
 
+    def merge_into(self, other: Bbox) -> Bbox:
+        # Merges other into this bbox in place, only use this on bboxes you own (see copy)
+        bbox = self.bbox
+        if not isinstance(bbox, list):
+            bbox = self.bbox = list(bbox)
+        other_bbox = other.bbox
+        if not bbox[0] < other_bbox[0]:
+            bbox[0] = other_bbox[0]
+        if not bbox[1] < other_bbox[1]:
+            bbox[1] = other_bbox[1]
+        if not bbox[2] > other_bbox[2]:
+            bbox[2] = other_bbox[2]
+        if not bbox[3] > other_bbox[3]:
+            bbox[3] = other_bbox[3]
+        return self
+
+    def copy(self) -> Bbox:
+        return Bbox(list(self.bbox))
+
     def overlap_x(self, other: Bbox):
         return max(0, min(self.bbox[2], other.bbox[2]) - max(self.bbox[0], other.bbox[0]))
 
@@ -86,7 +116,7 @@ class Bbox:
         x_min, y_min, x_max, y_max = self.bbox
 
         if rotation == 0:
-            return Bbox(self.bbox)
+            return self
         elif rotation == 90:
             new_x_min = page_height - y_max
             new_y_min = x_min
@@ -134,6 +164,17 @@ class Char(TypedDict):
     char_idx: int
 
 
+class CharArrays(TypedDict):
+    codepoint: np.ndarray  # (N,) uint32
+    bbox: np.ndarray  # (N, 4) float64, x_start, y_start, x_end, y_end after page transforms
+    rotation: np.ndarray  # (N,) float64
+    font_id: np.ndarray  # (N,) int32, index into fonts
+    font_size: np.ndarray  # (N,) float64
+    font_weight: np.ndarray  # (N,) int32
+    char_idx: np.ndarray  # (N,) int32
+    fonts: List[Dict[str, Union[Any, str]]]  # interned font records
+
+
 class Span(TypedDict):
     bbox: Bbox
     text: str
@@ -179,6 +220,18 @@ class TableInput(TypedDict):
     img_size: List[int]
 
 
+class ColumnarDocument(TypedDict):
+    # Each table maps column names to arrays of the same length, rows point to their parent with an index column
+    pages: Dict[str, np.ndarray]
+    blocks: Dict[str, np.ndarray]  # page, bbox
+    lines: Dict[str, np.ndarray]  # block, bbox
+    spans: Dict[str, np.ndarray]  # line, bbox, rotation, font, char_start_idx, char_end_idx, superscript, subscript
+    chars: Dict[str, np.ndarray]  # span, bbox, rotation, font, char_idx, empty without keep_chars
+    fonts: Dict[str, np.ndarray]  # size, weight, flags
+    refs: Dict[str, np.ndarray]  # page, idx, coord
+    strings: Dict[str, str]  # string columns like "spans.text", concatenated, split by the "<column>_ends" column of the table
+
+
 class Link(TypedDict):
     page: int
     bbox: List[float]
@@ -205,9 +258,11 @@ class Reference:
 class PageReference:
     def __init__(self):
         self.page_ref_map: Dict[int, List[Reference]] = {}
+        self.coord_ref_map: Dict[Tuple[int, Tuple[float, ...]], Reference] = {}
 
     def get_refs(self, page: int) -> List[Reference]:
-        return self.page_ref_map.get(page, [])
+        # Returns the live list, so refs added later (from links on later pages) show up in it
+        return self.page_ref_map.setdefault(page, [])
 
     def add_ref(self, page: int, coord: List[float]) -> Reference:
         self.page_ref_map.setdefault(page, [])
@@ -215,14 +270,11 @@ class PageReference:
         if ref is None:
             ref = Reference(idx=len(self.page_ref_map[page]), page=page, coord=coord)
             self.page_ref_map[page].append(ref)
+            self.coord_ref_map[(page, tuple(coord))] = ref
         return ref
 
     def check_ref(self, page: int, coord: List[float]) -> Optional[Reference]:
-        refs = self.page_ref_map.get(page, [])
-        for ref in refs:
-            if ref.coord == coord:
-                return ref
-        return None
+        return self.coord_ref_map.get((page, tuple(coord)))
 
 
 Chars = List[Char]
@@ -0,0 +1,135 @@
+import glob
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import click
+
+from pdftext.extraction import _process_page
+from pdftext.pool import ExtractionPool
+from pdftext.postprocessing import merge_text
+
+
+def collect_pdfs(inputs: List[str], file_list: str | None) -> List[str]:
+    # Directories are searched recursively for pdfs, anything else that isn't a file is treated as a glob
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += sorted(str(path) for path in Path(item).rglob("*") if path.suffix.lower() == ".pdf" and path.is_file())
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                raise click.BadParameter(f"No files match {item}", param_hint="INPUTS")
+            paths += matches
+
+    if file_list is not None:
+        with open(file_list, "r", encoding="utf-8") as f:
+            paths += [line.strip() for line in f if line.strip()]
+
+    return list(dict.fromkeys(paths))
+
+
+class JsonlWriter:
+    # Writes records to stdout, one file, or shard files of shard_size records each
+    def __init__(self, out_path: str | None, shard_size: int | None):
+        self.out_path = out_path
+        self.shard_size = shard_size
+        self.shard = 0
+        self.records = 0
+        self.file = None
+
+    def _open(self):
+        if self.out_path is None:
+            return sys.stdout
+        path = self.out_path
+        if self.shard_size:
+            stem, suffix = os.path.splitext(self.out_path)
+            path = f"{stem}-{self.shard:05d}{suffix or '.jsonl'}"
+        return open(path, "w", encoding="utf-8")
+
+    def write(self, record: dict):
+        if self.shard_size and self.records == self.shard_size:
+            self.close()
+            self.shard += 1
+            self.records = 0
+        if self.file is None:
+            self.file = self._open()
+        self.file.write(json.dumps(record) + "\n")
+        self.records += 1
+
+    def close(self):
+        if self.file is not None and self.file is not sys.stdout:
+            self.file.close()
+        self.file = None
+
+
+@click.command(help="Extract plain text or JSON from many PDFs to JSONL.")
+@click.argument("inputs", nargs=-1)
+@click.option("--file_list", type=click.Path(exists=True), help="File with one pdf path per line", default=None)
+@click.option("--out_path", type=click.Path(exists=False), help="Path to the output jsonl file, defaults to stdout")
+@click.option("--shard_size", type=int, help="Split the output into files of this many records, numbered after out_path", default=None)
+@click.option("--per_page", is_flag=True, help="Write one record per page instead of one per document", default=False)
+@click.option("--json", is_flag=True, help="Output blocks and lines instead of plain text", default=False)
+@click.option("--sort", is_flag=True, help="Attempt to sort the text by reading order", default=False)
+@click.option("--keep_hyphens", is_flag=True, help="Keep hyphens in words", default=False)
+@click.option("--flatten_pdf", is_flag=True, help="Flatten form fields and annotations into page contents", default=False)
+@click.option("--keep_chars", is_flag=True, help="Keep character level information", default=False)
+@click.option("--fast", is_flag=True, help="Faster plain text extraction that skips char level information", default=False)
+@click.option("--workers", type=int, help="Number of workers, defaults to the cpu count", default=None)
+def extract_batch_cli(inputs, file_list, out_path, shard_size, per_page, **kwargs):
+    paths = collect_pdfs(inputs, file_list)
+    if shard_size and out_path is None:
+        raise click.UsageError("--shard_size needs --out_path")
+
+    writer = JsonlWriter(out_path, shard_size)
+    failures = []
+    page_count = 0
+    start = time.perf_counter()
+    with ExtractionPool(kwargs["workers"]) as pool:
+        documents = pool.iter_documents(
+            paths,
+            flatten_pdf=kwargs["flatten_pdf"],
+            text_only=kwargs["fast"] and not kwargs["json"],
+            keep_chars=kwargs["keep_chars"] and kwargs["json"],
+            return_exceptions=True
+        )
+        for pdf_path, pages in documents:
+            if isinstance(pages, BaseException):
+                failures.append((pdf_path, f"{type(pages).__name__}: {pages}"))
+                writer.write({"path": pdf_path, "error": failures[-1][1]})
+                continue
+
+            records = []
+            for page in pages:
+                if kwargs["json"]:
+                    _process_page(page, sort=kwargs["sort"], keep_chars=kwargs["keep_chars"])
+                    records.append(page)
+                else:
+                    records.append({"page": page["page"], "text": merge_text(page, sort=kwargs["sort"], hyphens=kwargs["keep_hyphens"]).strip()})
+            page_count += len(records)
+
+            if per_page:
+                for record in records:
+                    writer.write({"path": pdf_path, **record})
+            elif kwargs["json"]:
+                writer.write({"path": pdf_path, "pages": records})
+            else:
+                writer.write({"path": pdf_path, "text": "\n".join(record["text"] for record in records)})
+    writer.close()
+
+    duration = time.perf_counter() - start
+    click.echo(
+        f"Extracted {len(paths) - len(failures)} of {len(paths)} documents, {page_count} pages in {duration:.1f}s "
+        f"({page_count / duration if duration else 0:.1f} pages/s, {len(paths) / duration if duration else 0:.2f} documents/s)",
+        err=True
+    )
+    if failures:
+        click.echo(f"{len(failures)} failed:", err=True)
+        for pdf_path, error in failures:
+            click.echo(f"  {pdf_path}: {error}", err=True)
+        sys.exit(1)
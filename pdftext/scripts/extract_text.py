@@ -1,11 +1,13 @@
-import json
+import sys
 from pathlib import Path
 from typing import List
 
 import click
 import pypdfium2 as pdfium
 
-from pdftext.extraction import plain_text_output, dictionary_output
+from pdftext.columnar import columnar_output, save_columnar
+from pdftext.extraction import plain_text_output, iter_dictionary_output
+from pdftext.output import write_json
 
 def parse_range_str(range_str: str) -> List[int]:
     range_lst = range_str.split(",")
@@ -23,11 +25,14 @@ def parse_range_str(range_str: str) -> List[int]:
 @click.argument("pdf_path", type=click.Path(exists=True))
 @click.option("--out_path", type=click.Path(exists=False), help="Path to the output text file, defaults to stdout")
 @click.option("--json", is_flag=True, help="Output json instead of plain text", default=False)
+@click.option("--jsonl", is_flag=True, help="Output one json page per line instead of plain text", default=False)
+@click.option("--format", "output_format", type=click.Choice(["text", "json", "jsonl", "npz", "arrow"]), default=None, help="Output format, npz and arrow write columnar tables to out_path")
 @click.option("--sort", is_flag=True, help="Attempt to sort the text by reading order", default=False)
 @click.option("--keep_hyphens", is_flag=True, help="Keep hyphens in words", default=False)
 @click.option("--page_range", type=str, help="Page numbers or ranges to extract, comma separated like 1,2-4,10", default=None)
 @click.option("--flatten_pdf", is_flag=True, help="Flatten form fields and annotations into page contents", default=False)
 @click.option("--keep_chars", is_flag=True, help="Keep character level information", default=False)
+@click.option("--fast", is_flag=True, help="Faster plain text extraction that skips char level information", default=False)
 @click.option("--workers", type=int, help="Number of workers to use for parallel processing", default=None)
 def extract_text_cli(
         pdf_path: Path,
@@ -42,8 +47,11 @@ def extract_text_cli(
         pdf_doc.close()
         assert all(0 <= p <= doc_len for p in pages), "Invalid page number(s) provided"
 
-    if kwargs["json"]:
-        text = dictionary_output(
+    output_format = kwargs["output_format"] or ("jsonl" if kwargs["jsonl"] else "json" if kwargs["json"] else "text")
+    if output_format in ("npz", "arrow"):
+        if out_path is None:
+            raise click.UsageError(f"--format {output_format} needs --out_path")
+        document = columnar_output(
             pdf_path,
             sort=kwargs["sort"],
             page_range=pages,
@@ -52,16 +60,39 @@ def extract_text_cli(
             workers=kwargs["workers"],
             disable_links=True
         )
-        text = json.dumps(text)
-    else:
-        text = plain_text_output(
+        save_columnar(document, out_path, output_format)
+        return
+
+    if output_format in ("json", "jsonl"):
+        # Pages are written as they're extracted, so the whole document is never held in memory
+        page_iter = iter_dictionary_output(
             pdf_path,
             sort=kwargs["sort"],
-            hyphens=kwargs["keep_hyphens"],
             page_range=pages,
             flatten_pdf=kwargs["flatten_pdf"],
-            workers=kwargs["workers"]
+            keep_chars=kwargs["keep_chars"],
+            workers=kwargs["workers"],
+            disable_links=True,
+            bbox_objects=True
         )
+        if out_path is None:
+            write_json(page_iter, sys.stdout, jsonl=output_format == "jsonl")
+            if output_format == "json":
+                sys.stdout.write("\n")
+        else:
+            with open(out_path, "w+", encoding="utf-8") as f:
+                write_json(page_iter, f, jsonl=output_format == "jsonl")
+        return
+
+    text = plain_text_output(
+        pdf_path,
+        sort=kwargs["sort"],
+        hyphens=kwargs["keep_hyphens"],
+        page_range=pages,
+        flatten_pdf=kwargs["flatten_pdf"],
+        workers=kwargs["workers"],
+        fast=kwargs["fast"]
+    )
 
     if out_path is None:
         print(text)
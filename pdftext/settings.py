@@ -1,4 +1,5 @@
 import os.path
+from typing import Optional
 
 from pydantic_settings import BaseSettings
 
@@ -6,6 +7,19 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # Inference
     WORKER_PAGE_THRESHOLD: int = 10  # Min number of pages per worker in parallel
+    WORKER_BATCHES_IN_FLIGHT: int = 2  # Page batches queued per worker
+    WORKER_BATCH_PAGES: int = 2  # Max pages in each batch handed to a worker
+    WORKER_SCHEDULE_HORIZON: int = 64  # How far past the next page to yield the scheduler looks for expensive pages
+    WORKER_MAX_OPEN_DOCUMENTS: int = 8  # Documents each pool worker keeps open between tasks
+
+    # Result cache
+    CACHE_DIR: Optional[str] = None  # Directory for the on-disk page cache, disabled when unset
+    CACHE_MAX_BYTES: int = 1024 ** 3  # Least recently used pages are evicted past this size
+    PAGE_CACHE_SIZE: int = 0  # Pages kept in memory to reuse for identical pages in other documents, 0 disables it
+
+    # Async
+    ASYNC_WORKERS: Optional[int] = None  # Workers in the pool shared by async calls, defaults to the cpu count
+    ASYNC_MAX_IN_FLIGHT_PAGES: int = 32  # Pages each async call can have queued or running before the caller reads them
 
     # Benchmark
     RESULTS_FOLDER: str = "results"
@@ -1,59 +1,181 @@
-from typing import List
+import math
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
 import numpy as np
 
+from pdftext.pdf.utils import SegmentUnion
 from pdftext.postprocessing import sort_blocks
 from pdftext.schema import Page, Bbox, Tables
 
 
-def get_dynamic_gap_thresh(page: Page, img_size: list, default_thresh=.01, min_chars=100):
-    space_dists = []
+def page_char_arrays(page: Page) -> Tuple[np.ndarray, List[str], np.ndarray, np.ndarray]:
+    # Char bboxes as an (N, 4) array and char texts, in page order, with the char offset where each span and line ends
+    bboxes, texts, span_ends, line_ends = [], [], [], []
     for block in page["blocks"]:
         for line in block["lines"]:
             for span in line["spans"]:
-                for i in range(1, len(span["chars"])):
-                    char1 = span["chars"][i - 1]
-                    char2 = span["chars"][i]
-                    if page["rotation"] == 90:
-                        space_dists.append((char2["bbox"][0] - char1["bbox"][2]) / img_size[0])
-                    elif page["rotation"] == 180:
-                        space_dists.append((char2["bbox"][1] - char1["bbox"][3]) / img_size[1])
-                    elif page["rotation"] == 270:
-                        space_dists.append((char1["bbox"][0] - char2["bbox"][2]) / img_size[0])
-                    else:
-                        space_dists.append((char1["bbox"][1] - char2["bbox"][3]) / img_size[1])
+                for char in span["chars"]:
+                    bboxes.append(char["bbox"].bbox if isinstance(char["bbox"], Bbox) else char["bbox"])
+                    texts.append(char["char"])
+                span_ends.append(len(texts))
+            line_ends.append(len(texts))
+    return np.array(bboxes, dtype=np.float64).reshape(-1, 4), texts, np.array(span_ends, dtype=np.int64), np.array(line_ends, dtype=np.int64)
+
+
+def _gap_thresh(bboxes: np.ndarray, span_ends: np.ndarray, rotation: int, img_size: list, default_thresh=.01, min_chars=100):
+    # Distances between each pair of adjacent chars in the same span, along the reading direction
+    same_span = np.ones(len(bboxes), dtype=bool)
+    same_span[span_ends[span_ends < len(bboxes)]] = False
+    first, second = bboxes[:-1][same_span[1:]], bboxes[1:][same_span[1:]]
+    if rotation == 90:
+        space_dists = (second[:, 0] - first[:, 2]) / img_size[0]
+    elif rotation == 180:
+        space_dists = (second[:, 1] - first[:, 3]) / img_size[1]
+    elif rotation == 270:
+        space_dists = (first[:, 0] - second[:, 2]) / img_size[0]
+    else:
+        space_dists = (first[:, 1] - second[:, 3]) / img_size[1]
     cell_gap_thresh = np.percentile(space_dists, 80) if len(space_dists) > min_chars else default_thresh
     return cell_gap_thresh
 
 
+def get_dynamic_gap_thresh(page: Page, img_size: list, default_thresh=.01, min_chars=100):
+    bboxes, _, span_ends, _ = page_char_arrays(page)
+    return _gap_thresh(bboxes, span_ends, page["rotation"], img_size, default_thresh, min_chars)
+
+
 def is_same_span(bbox, curr_box, img_size, space_thresh, rotation):
+    # Works on single boxes, or on (N, 4) arrays of boxes to compare row by row
+    bbox, curr_box = np.asarray(bbox), np.asarray(curr_box)
+
     def normalized_diff(a, b, dimension, mult=1, use_abs=True):
-        func = abs if use_abs else lambda x: x
-        return func(a - b) / img_size[dimension] < space_thresh * mult
+        diff = a - b
+        return (np.abs(diff) if use_abs else diff) / img_size[dimension] < space_thresh * mult
 
     if rotation == 90:
-        return all([
-            normalized_diff(bbox[0], curr_box[0], 0, use_abs=False),
-            normalized_diff(bbox[1], curr_box[3], 1),
-            normalized_diff(bbox[0], curr_box[0], 0, mult=5)
-        ])
+        return (normalized_diff(bbox[..., 0], curr_box[..., 0], 0, use_abs=False)
+                & normalized_diff(bbox[..., 1], curr_box[..., 3], 1)
+                & normalized_diff(bbox[..., 0], curr_box[..., 0], 0, mult=5))
     elif rotation == 180:
-        return all([
-            normalized_diff(bbox[2], curr_box[0], 0, use_abs=False),
-            normalized_diff(bbox[1], curr_box[1], 1),
-            normalized_diff(bbox[2], curr_box[0], 1, mult=5)
-        ])
+        return (normalized_diff(bbox[..., 2], curr_box[..., 0], 0, use_abs=False)
+                & normalized_diff(bbox[..., 1], curr_box[..., 1], 1)
+                & normalized_diff(bbox[..., 2], curr_box[..., 0], 1, mult=5))
     elif rotation == 270:
-        return all([
-            normalized_diff(bbox[0], curr_box[0], 0, use_abs=False),
-            normalized_diff(bbox[3], curr_box[1], 1),
-            normalized_diff(bbox[0], curr_box[0], 1, mult=5)
-        ])
+        return (normalized_diff(bbox[..., 0], curr_box[..., 0], 0, use_abs=False)
+                & normalized_diff(bbox[..., 3], curr_box[..., 1], 1)
+                & normalized_diff(bbox[..., 0], curr_box[..., 0], 1, mult=5))
     else:  # 0 or default case
-        return all([
-            normalized_diff(bbox[0], curr_box[2], 0, use_abs=False),
-            normalized_diff(bbox[1], curr_box[1], 1),
-            normalized_diff(bbox[0], curr_box[2], 1, mult=5)
-        ])
+        return (normalized_diff(bbox[..., 0], curr_box[..., 2], 0, use_abs=False)
+                & normalized_diff(bbox[..., 1], curr_box[..., 1], 1)
+                & normalized_diff(bbox[..., 0], curr_box[..., 2], 1, mult=5))
+
+
+def group_cells(bboxes: np.ndarray, texts: List[str], line_starts: np.ndarray, img_size: list, space_thresh: float, rotation: int, max_passes=8) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Marks the chars that start a new cell, and returns the running union of each cell's boxes.  A char joins the cell
+    before it if it's close to the union of that cell's boxes, which depends on where earlier cells start.  Starting
+    from only the line starts, each pass is correct at least one char further than the one before, so repeating until
+    nothing changes gives the same cells as going char by char, usually in a few passes.  Lines that are still
+    changing after max_passes, like chars stepping just over half the gap apart, are grouped char by char instead.
+    """
+    if len(bboxes) == 0:
+        return line_starts.copy(), bboxes.copy()
+    segment_union = SegmentUnion(bboxes)
+    empty = np.array([text == "" for text in texts], dtype=bool)
+
+    starts = line_starts.copy()
+    changed = np.ones(len(bboxes), dtype=bool)
+    for _ in range(max_passes):
+        union = segment_union.union(starts)
+        # An empty first char never joins with the next one
+        joins = is_same_span(bboxes[1:], union[:-1], img_size, space_thresh, rotation) & ~(starts[:-1] & empty[:-1])
+        new_starts = line_starts.copy()
+        new_starts[1:] |= ~joins
+        changed = new_starts != starts
+        if not changed.any():
+            return starts, union
+        starts = new_starts
+
+    # A line that didn't change in the last pass has converged, since cells never cross lines
+    line_ids = np.cumsum(line_starts)
+    cell_start, curr_box = None, None
+    for i in np.flatnonzero(np.isin(line_ids, line_ids[changed])).tolist():
+        bbox = bboxes[i].tolist()
+        if line_starts[i] or cell_start is None or (cell_start == i - 1 and empty[cell_start]) or not is_same_span(bbox, curr_box, img_size, space_thresh, rotation):
+            starts[i] = True
+            cell_start, curr_box = i, bbox
+        else:
+            starts[i] = False
+            curr_box = [min(curr_box[0], bbox[0]), min(curr_box[1], bbox[1]), max(curr_box[2], bbox[2]), max(curr_box[3], bbox[3])]
+    return starts, segment_union.union(starts)
+
+
+class LineIndex:
+    """
+    A uniform grid over the page's lines, rescaled to image coordinates once per page, so each table only checks the
+    lines in the grid cells it covers, instead of every line on the page.
+    """
+    def __init__(self, page: Page, img_size: list):
+        self.lines = [line for block in page["blocks"] for line in block["lines"]]
+        self.bboxes = [Bbox(bbox=line["bbox"]).rescale(img_size, page) for line in self.lines]
+
+        # About one line per cell on average
+        self.grid_size = max(1, math.isqrt(len(self.lines)))
+        self.cell_width = max(img_size[0], 1) / self.grid_size
+        self.cell_height = max(img_size[1], 1) / self.grid_size
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for line_idx, bbox in enumerate(self.bboxes):
+            if bbox.area == 0:
+                continue  # intersection_pct is always 0
+            for cell in self._cells(bbox.bbox):
+                self.cells[cell].append(line_idx)
+
+    def _cell_range(self, start: float, end: float, cell_size: float) -> range:
+        # Boxes outside the image are clamped into the edge cells
+        first = min(max(int(start // cell_size), 0), self.grid_size - 1)
+        last = min(max(int(end // cell_size), 0), self.grid_size - 1)
+        return range(min(first, last), max(first, last) + 1)
+
+    def _cells(self, bbox: List[float]):
+        for x in self._cell_range(bbox[0], bbox[2], self.cell_width):
+            for y in self._cell_range(bbox[1], bbox[3], self.cell_height):
+                yield x, y
+
+    def query(self, bbox: List[float]) -> List[int]:
+        # Indices of the lines that may overlap bbox, in page order
+        found = set()
+        for cell in self._cells(bbox):
+            found.update(self.cells.get(cell, ()))
+        return sorted(found)
+
+
+def _line_cells(lines: List[int], bboxes: np.ndarray, texts: List[str], line_ends: np.ndarray, page: Page, img_size: list, space_thresh: float, rotation: int) -> Dict[int, List[Tuple[str, List[float]]]]:
+    # The non-blank cells of each line, as text and a bbox rescaled to the image
+    line_cells = {line_idx: [] for line_idx in lines}
+    line_starts = np.concatenate([[0], line_ends[:-1]]) if len(line_ends) else line_ends
+    ranges = [(line_idx, line_starts[line_idx], line_ends[line_idx]) for line_idx in lines if line_ends[line_idx] > line_starts[line_idx]]
+    if not ranges:
+        return line_cells
+
+    char_idxs = np.concatenate([np.arange(start, end) for _, start, end in ranges])
+    char_lines = np.concatenate([np.full(end - start, line_idx) for line_idx, start, end in ranges])
+    first_chars = np.zeros(len(char_idxs), dtype=bool)
+    first_chars[np.cumsum([0] + [end - start for _, start, end in ranges[:-1]])] = True
+
+    scale = np.array([img_size[0] / page["width"], img_size[1] / page["height"]] * 2)
+    char_bboxes = bboxes[char_idxs] * scale
+    char_texts = [texts[idx] for idx in char_idxs.tolist()]
+    starts, union = group_cells(char_bboxes, char_texts, first_chars, img_size, space_thresh, rotation)
+
+    cell_starts = np.flatnonzero(starts)
+    cell_ends = np.append(cell_starts[1:], len(char_idxs))
+    cell_bboxes = union[cell_ends - 1].tolist()
+    for start, end, line_idx, bbox in zip(cell_starts.tolist(), cell_ends.tolist(), char_lines[cell_starts].tolist(), cell_bboxes):
+        text = "".join(char_texts[start:end])
+        if text.strip():
+            line_cells[line_idx].append((text, bbox))
+    return line_cells
 
 
 def table_cell_text(tables: List[List[int]], page: Page, img_size: list, table_thresh=.8, space_thresh=.01) -> Tables:
@@ -62,49 +184,29 @@ def table_cell_text(tables: List[List[int]], page: Page, img_size: list, table_t
     assert all(len(table) == 4 for table in tables), "Tables must be a list of 4 ints representing the bounding box of the table"
     assert len(img_size) == 2, "img_size must be a list of 2 ints representing the image dimensions width, height"
 
-    table_texts = []
-    space_thresh = max(space_thresh, get_dynamic_gap_thresh(page, img_size, default_thresh=space_thresh))
+    bboxes, texts, span_ends, line_ends = page_char_arrays(page)
+    rotation = page["rotation"]
+    space_thresh = max(space_thresh, _gap_thresh(bboxes, span_ends, rotation, img_size, default_thresh=space_thresh))
+    line_index = LineIndex(page, img_size)
+
+    # Lines that don't overlap a table have an intersection of 0, so only nearby lines need checking
+    table_lines = []
     for table in tables:
         table_poly = Bbox(bbox=table)
-        table_text = []
-        rotation = page["rotation"]
-
-        for block in page["blocks"]:
-            for line in block["lines"]:
-                line_bbox = Bbox(bbox=line["bbox"]).rescale(img_size, page)
-                if line_bbox.intersection_pct(table_poly) < table_thresh:
-                    continue
-                curr_span = None
-                curr_box = None
-                for span in line["spans"]:
-                    for char in span["chars"]:
-                        bbox = Bbox(bbox=char["bbox"]).rescale(img_size, page).bbox
-                        same_span = False
-                        if curr_span:
-                            same_span = is_same_span(bbox, curr_box, img_size, space_thresh, rotation)
-
-                        if curr_span is None:
-                            curr_span = char["char"]
-                            curr_box = bbox
-                        elif same_span:
-                            curr_span += char["char"]
-                            curr_box = [min(curr_box[0], bbox[0]), min(curr_box[1], bbox[1]),
-                                        max(curr_box[2], bbox[2]), max(curr_box[3], bbox[3])]
-                        else:
-                            if curr_span.strip():
-                                table_text.append({"text": curr_span, "bbox": curr_box})
-                            curr_span = char["char"]
-                            curr_box = bbox
-                if curr_span is not None and curr_span.strip():
-                    table_text.append({"text": curr_span, "bbox": curr_box})
+        candidates = line_index.query(table) if table_thresh > 0 else range(len(line_index.lines))
+        table_lines.append([line_idx for line_idx in candidates if line_index.bboxes[line_idx].intersection_pct(table_poly) >= table_thresh])
+
+    # Cells never cross lines, so they're grouped once for every line in any table
+    line_cells = _line_cells(sorted(set(line_idx for lines in table_lines for line_idx in lines)), bboxes, texts, line_ends, page, img_size, space_thresh, rotation)
+
+    table_texts = []
+    for table, lines in zip(tables, table_lines):
+        table_text = [cell for line_idx in lines for cell in line_cells[line_idx]]
         # Adjust to be relative to input table
-        for item in table_text:
-            item["bbox"] = [
-                item["bbox"][0] - table[0],
-                item["bbox"][1] - table[1],
-                item["bbox"][2] - table[0],
-                item["bbox"][3] - table[1]
-            ]
+        table_text = [{
+            "text": text,
+            "bbox": [bbox[0] - table[0], bbox[1] - table[1], bbox[2] - table[0], bbox[3] - table[1]]
+        } for text, bbox in table_text]
         table_text = sort_blocks(table_text)
         table_texts.append(table_text)
-    return table_texts
\ No newline at end of file
+    return table_texts
@@ -0,0 +1,203 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+from pdftext.schema import Bbox, Page
+
+SUPERSCRIPT_FLAG = 1
+SUBSCRIPT_FLAG = 2
+
+
+@dataclass
+class PackedPage:
+    """
+    A page flattened into numpy arrays, which pickle as raw buffers instead of millions of small objects.
+    Blocks, lines and spans are stored as consecutive ranges over the next level down.
+    """
+    meta: Dict[str, Any]  # page keys other than blocks
+    text: str  # span texts, concatenated
+    char_text: str | List[str] | None  # char texts, when they differ from the span texts
+    fonts: List[dict]
+    has_chars: bool
+    block_line_ends: np.ndarray
+    block_bboxes: np.ndarray
+    block_rotations: np.ndarray  # nan when the block has no rotation key
+    line_span_ends: np.ndarray
+    line_bboxes: np.ndarray
+    line_rotations: np.ndarray  # nan when the line has no rotation key
+    span_text_ends: np.ndarray
+    span_bboxes: np.ndarray
+    span_rotations: np.ndarray
+    span_fonts: np.ndarray  # -1 when the span has no font
+    span_char_idxs: np.ndarray  # char_start_idx, char_end_idx
+    span_flags: np.ndarray
+    span_char_ends: np.ndarray  # empty when the page has no chars
+    span_urls: Dict[int, str | None]  # only spans with a url
+    span_extra: Dict[int, Dict[str, Any]]  # any other span keys, rarely used
+    char_bboxes: np.ndarray
+    char_rotations: np.ndarray
+    char_fonts: np.ndarray
+    char_idxs: np.ndarray
+
+
+SPAN_KEYS = {"bbox", "text", "rotation", "font", "char_start_idx", "char_end_idx", "chars", "url", "superscript", "subscript"}
+
+
+def _font_id(font: dict, font_ids: Dict[int, int], fonts: List[dict]) -> int:
+    font_id = font_ids.get(id(font))
+    if font_id is None:
+        font_id = font_ids[id(font)] = len(fonts)
+        fonts.append(font)
+    return font_id
+
+
+def _bboxes(bboxes: List[List[float]]) -> np.ndarray:
+    return np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+
+
+def pack_page(page: Page) -> PackedPage:
+    blocks = page["blocks"]
+    lines = [line for block in blocks for line in block["lines"]]
+    spans = [span for line in lines for span in line["spans"]]
+    has_chars = all("chars" in span for span in spans)
+    chars = [char for span in spans for char in span["chars"]] if has_chars else []
+
+    # Fonts are interned per document, so identical fonts are the same object
+    font_ids: Dict[int, int] = {}
+    fonts: List[dict] = []
+
+    texts = [span["text"] for span in spans]
+    span_flags = np.zeros(len(spans), dtype=np.uint8)
+    span_urls = {}
+    span_extra = {}
+    for i, span in enumerate(spans):
+        if span.get("superscript"):
+            span_flags[i] |= SUPERSCRIPT_FLAG
+        if span.get("subscript"):
+            span_flags[i] |= SUBSCRIPT_FLAG
+        if span.get("url", '') != '':
+            span_urls[i] = span["url"]
+        extra = {k: v for k, v in span.items() if k not in SPAN_KEYS or (k in ("superscript", "subscript") and v is not True)}
+        if extra:
+            span_extra[i] = extra
+
+    text = "".join(texts)
+    char_texts = [char["char"] for char in chars]
+    char_text = "".join(char_texts)
+    if len(char_text) != len(chars):
+        char_text = char_texts
+
+    return PackedPage(
+        meta={k: v for k, v in page.items() if k != "blocks"},
+        text=text,
+        char_text=None if char_text == text else char_text,
+        fonts=fonts,
+        has_chars=has_chars,
+        block_line_ends=np.cumsum([len(block["lines"]) for block in blocks], dtype=np.int64),
+        block_bboxes=_bboxes([block["bbox"].bbox for block in blocks]),
+        block_rotations=np.array([block.get("rotation", np.nan) for block in blocks], dtype=np.float64),
+        line_span_ends=np.cumsum([len(line["spans"]) for line in lines], dtype=np.int64),
+        line_bboxes=_bboxes([line["bbox"].bbox for line in lines]),
+        line_rotations=np.array([line.get("rotation", np.nan) for line in lines], dtype=np.float64),
+        span_text_ends=np.cumsum([len(text) for text in texts], dtype=np.int64),
+        span_bboxes=_bboxes([span["bbox"].bbox for span in spans]),
+        span_rotations=np.array([span["rotation"] for span in spans], dtype=np.float64),
+        span_fonts=np.array([_font_id(span["font"], font_ids, fonts) if "font" in span else -1 for span in spans], dtype=np.int32),
+        span_char_idxs=np.array([(span["char_start_idx"], span["char_end_idx"]) for span in spans], dtype=np.int64).reshape(-1, 2),
+        span_flags=span_flags,
+        span_char_ends=np.cumsum([len(span["chars"]) for span in spans] if has_chars else [], dtype=np.int64),
+        span_urls=span_urls,
+        span_extra=span_extra,
+        char_bboxes=_bboxes([char["bbox"].bbox for char in chars]),
+        char_rotations=np.array([char["rotation"] for char in chars], dtype=np.float64),
+        char_fonts=np.array([_font_id(char["font"], font_ids, fonts) for char in chars], dtype=np.int32),
+        char_idxs=np.array([char["char_idx"] for char in chars], dtype=np.int64),
+    )
+
+
+def _rotation(rotation: float):
+    return None if rotation != rotation else rotation
+
+
+def unpack_page(packed: PackedPage, keep_chars: bool = True, fonts: List[dict] | None = None) -> Page:
+    """
+    Rebuilds the page dict.  Char dicts are only built when keep_chars is set, since they're most of the decode cost.
+    fonts replaces packed.fonts, to share the font dicts of the document the page is unpacked into.
+    """
+    text = packed.text
+    char_text = text if packed.char_text is None else packed.char_text
+    if fonts is None:
+        fonts = packed.fonts
+    keep_chars = keep_chars and packed.has_chars
+
+    if keep_chars:
+        char_bboxes = packed.char_bboxes.tolist()
+        char_rotations = packed.char_rotations.tolist()
+        char_fonts = packed.char_fonts.tolist()
+        char_idxs = packed.char_idxs.tolist()
+
+    span_text_ends = packed.span_text_ends.tolist()
+    span_bboxes = packed.span_bboxes.tolist()
+    span_rotations = packed.span_rotations.tolist()
+    span_fonts = packed.span_fonts.tolist()
+    span_char_idxs = packed.span_char_idxs.tolist()
+    span_flags = packed.span_flags.tolist()
+
+    span_char_ends = packed.span_char_ends.tolist()
+    spans = []
+    text_start = 0
+    char_start = 0
+    for i, text_end in enumerate(span_text_ends):
+        span_text = text[text_start:text_end]
+        span = {
+            "bbox": Bbox(span_bboxes[i]),
+            "text": span_text,
+            "rotation": span_rotations[i],
+        }
+        if span_fonts[i] >= 0:
+            span["font"] = fonts[span_fonts[i]]
+        span["char_start_idx"], span["char_end_idx"] = span_char_idxs[i]
+        if packed.has_chars:
+            char_end = span_char_ends[i]
+            span["chars"] = []
+            if keep_chars:
+                span["chars"] = [{
+                    "bbox": Bbox(char_bboxes[k]),
+                    "char": char_text[k],
+                    "rotation": char_rotations[k],
+                    "font": fonts[char_fonts[k]],
+                    "char_idx": char_idxs[k],
+                } for k in range(char_start, char_end)]
+            char_start = char_end
+        span["url"] = packed.span_urls.get(i, '')
+        if span_flags[i] & SUPERSCRIPT_FLAG:
+            span["superscript"] = True
+        if span_flags[i] & SUBSCRIPT_FLAG:
+            span["subscript"] = True
+        if i in packed.span_extra:
+            span.update(packed.span_extra[i])
+        spans.append(span)
+        text_start = text_end
+
+    lines = []
+    span_start = 0
+    for span_end, bbox, rotation in zip(packed.line_span_ends.tolist(), packed.line_bboxes.tolist(), packed.line_rotations.tolist()):
+        line = {"spans": spans[span_start:span_end], "bbox": Bbox(bbox)}
+        if _rotation(rotation) is not None:
+            line["rotation"] = rotation
+        lines.append(line)
+        span_start = span_end
+
+    blocks = []
+    line_start = 0
+    for line_end, bbox, rotation in zip(packed.block_line_ends.tolist(), packed.block_bboxes.tolist(), packed.block_rotations.tolist()):
+        block = {"lines": lines[line_start:line_end], "bbox": Bbox(bbox)}
+        if _rotation(rotation) is not None:
+            block["rotation"] = rotation
+        blocks.append(block)
+        line_start = line_end
+
+    page = dict(packed.meta)
+    page["blocks"] = blocks
+    return page
@@ -0,0 +1,49 @@
+import asyncio
+import io
+
+from pdftext.aio import extract_async, iter_pages_async
+from pdftext.extraction import dictionary_output
+from pdftext.pool import ExtractionPool
+
+
+def test_extract_async(pdf_path):
+    expected = dictionary_output(pdf_path, page_range=[0, 1, 2])
+
+    async def extract():
+        with ExtractionPool(workers=2) as pool:
+            return await extract_async(pdf_path, page_range=[0, 1, 2], pool=pool, max_in_flight_pages=2)
+
+    assert asyncio.run(extract()) == expected
+
+
+def test_iter_pages_async_cancel(pdf_path):
+    async def cancel():
+        with ExtractionPool(workers=1) as pool:
+            async def consume():
+                async for _ in iter_pages_async(pdf_path, pool=pool, max_in_flight_pages=2):
+                    await asyncio.sleep(60)
+
+            task = asyncio.create_task(consume())
+            while not pool.worker_stats:
+                await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return sum(stats["pages"] for stats in pool.worker_stats.values())
+
+    # Pages past the in-flight limit are never extracted
+    assert asyncio.run(cancel()) <= 4
+
+
+def test_iter_packed_pages_async(pdf_path):
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+
+    async def extract(pool, pdf):
+        return [page.meta["page"] async for page in pool.iter_packed_pages_async(pdf, [0, 2], max_in_flight_pages=1)]
+
+    with ExtractionPool(workers=2) as pool:
+        for pdf in [pdf_path, data, io.BytesIO(data)]:
+            assert asyncio.run(extract(pool, pdf)) == [0, 2]
@@ -0,0 +1,21 @@
+import json
+import shutil
+
+from click.testing import CliRunner
+
+from pdftext.extraction import paginated_plain_text_output
+from pdftext.scripts.extract_batch import extract_batch_cli
+
+
+def test_batch_cli(pdf_path, tmp_path):
+    shutil.copy(pdf_path, tmp_path / "a.pdf")
+    (tmp_path / "bad.pdf").write_bytes(b"not a pdf")
+    out_path = tmp_path / "out.jsonl"
+
+    result = CliRunner().invoke(extract_batch_cli, [str(tmp_path), "--per_page", "--out_path", str(out_path), "--workers", "2"])
+    assert result.exit_code == 1
+    assert "1 failed" in result.output
+
+    records = [json.loads(line) for line in out_path.read_text().splitlines()]
+    assert records[-1]["path"].endswith("bad.pdf") and "error" in records[-1]
+    assert [record["text"] for record in records[:-1]] == paginated_plain_text_output(pdf_path)
@@ -0,0 +1,66 @@
+import pickle
+import zlib
+
+import pypdfium2 as pdfium
+import pytest
+
+from pdftext.cache import PageCache, ResultCache
+from pdftext.extraction import dictionary_output, paginated_plain_text_output
+from pdftext.pdf.pages import get_pages
+
+
+def test_result_cache(pdf_path, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    expected = dictionary_output(pdf_path, page_range=[0, 1])
+
+    assert dictionary_output(pdf_path, page_range=[0, 1], cache=cache) == expected
+    assert len(list(cache._entries())) == 2
+    # Overlapping ranges reuse the cached pages
+    assert dictionary_output(pdf_path, page_range=[1], cache=cache) == dictionary_output(pdf_path, page_range=[1])
+    assert len(list(cache._entries())) == 2
+
+    # Options that change the extracted pages get their own entries
+    assert paginated_plain_text_output(pdf_path, page_range=[0], cache=cache) == paginated_plain_text_output(pdf_path, page_range=[0])
+    assert len(list(cache._entries())) == 3
+
+
+def test_result_cache_eviction(pdf_path, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    dictionary_output(pdf_path, page_range=[0, 1, 2], cache=cache)
+    sizes = [size for _, size, _ in sorted(cache._entries())]
+
+    cache.max_bytes = sum(sizes) - 1
+    cache.evict()
+    assert len(list(cache._entries())) == 2
+    assert cache.size() <= cache.max_bytes
+
+
+def test_page_cache(pdf_path, pdf_doc):
+    page_cache = PageCache()
+    expected = get_pages(pdf_doc, [0, 1], flatten_pdf=False, page_cache=page_cache)
+    assert page_cache.stats() == {"hits": 0, "misses": 2, "pages": 2}
+
+    other_doc = pdfium.PdfDocument(pdf_path)
+    # The same pages at other indexes in another document are hits, and take the index they're read at
+    pages = get_pages(other_doc, [1, 0], flatten_pdf=False, page_cache=page_cache, link_pdf=other_doc)
+    other_doc.close()
+    assert page_cache.stats() == {"hits": 2, "misses": 2, "pages": 2}
+    assert [page["page"] for page in pages] == [1, 0]
+    assert pages[1]["blocks"][0]["lines"][0]["spans"][0]["text"] == expected[0]["blocks"][0]["lines"][0]["spans"][0]["text"]
+    assert any(span["url"] for block in pages[0]["blocks"] for line in block["lines"] for span in line["spans"])
+
+
+
+class _Exploit:
+    def __reduce__(self):
+        return pytest.fail, ("Cache entry was unpickled",)
+
+
+def test_result_cache_no_pickle(pdf_path, tmp_path):
+    # Entries are npz and JSON, so a pickle planted in a shared cache directory is never loaded
+    cache = ResultCache(str(tmp_path))
+    expected = dictionary_output(pdf_path, page_range=[0], cache=cache)
+    (_, _, path), = cache._entries()
+    with open(path, "wb") as f:
+        f.write(zlib.compress(pickle.dumps(_Exploit())))
+    assert dictionary_output(pdf_path, page_range=[0], cache=cache) == expected
@@ -0,0 +1,43 @@
+import pytest
+
+from pdftext.pdf.chars import chars_from_arrays, deduplicate_char_arrays, deduplicate_chars, get_char_arrays
+from pdftext.pdf.utils import FontCache
+
+
+def legacy_deduplicate_chars(chars):
+    # The original string-keyed implementation, kept as the reference output
+    words = []
+    for char in chars:
+        word = words[-1] if words else None
+        if (
+            word is None
+            or any(word["text"].endswith(x) for x in ["\n", " ", "\x02"])
+            or any(char["font"][k] != word["font"][k] for k in ["name", "flags", "size", "weight"])
+            or char["rotation"] != word["rotation"]
+        ):
+            words.append({"bbox": char["bbox"], "text": char["char"], "rotation": char["rotation"], "font": char["font"], "chars": [char]})
+            continue
+        word["text"] += char["char"]
+        word["bbox"] = word["bbox"].merge(char["bbox"])
+        word["chars"].append(char)
+
+    seen = {}
+    deduped = []
+    for word in words:
+        bbox = [round(x, 0) for x in word["bbox"].bbox]
+        key = f"{bbox}-{word['text']}-{word['rotation']}-{word['font']['name']}-{word['font']['flags']}-{word['font']['size']}-{word['font']['weight']}"
+        if key not in seen:
+            seen[key] = True
+            deduped.append(word)
+    return [char for word in deduped for char in word["chars"]]
+
+
+@pytest.mark.parametrize("page_idx", range(12))
+def test_deduplicate_chars(pdf_doc, page_idx):
+    page = pdf_doc.get_page(page_idx)
+    char_arrays = get_char_arrays(page.get_textpage(), page.get_bbox(), page.get_rotation(), font_cache=FontCache())
+    chars = chars_from_arrays(char_arrays)
+
+    expected = [char["char_idx"] for char in legacy_deduplicate_chars(chars)]
+    assert [char["char_idx"] for char in deduplicate_chars(chars)] == expected
+    assert [char["char_idx"] for char in chars_from_arrays(char_arrays, deduplicate_char_arrays(char_arrays))] == expected
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from pdftext.columnar import TABLES, columnar_output, get_strings, load_columnar, save_columnar
+from pdftext.extraction import dictionary_output
+from pdftext.scripts.extract_text import extract_text_cli
+
+
+def _assert_same(loaded, document):
+    for table in TABLES:
+        assert loaded[table].keys() == document[table].keys()
+        for column, values in document[table].items():
+            assert loaded[table][column].dtype == values.dtype
+            assert np.array_equal(loaded[table][column], values)
+    assert loaded["strings"] == document["strings"]
+
+
+def test_columnar_output(pdf_path, tmp_path):
+    page_range = [0, 1, 2]
+    document = columnar_output(pdf_path, page_range=page_range, keep_chars=True)
+    pages = dictionary_output(pdf_path, page_range=page_range, keep_chars=True)
+
+    lines = [line for page in pages for block in page["blocks"] for line in block["lines"]]
+    spans = [span for line in lines for span in line["spans"]]
+    chars = [char for span in spans for char in span["chars"]]
+    assert get_strings(document, "spans", "text") == [span["text"] for span in spans]
+    assert get_strings(document, "chars", "char") == [char["char"] for char in chars]
+    assert np.allclose(document["spans"]["bbox"], [span["bbox"] for span in spans])
+    assert document["spans"]["line"].tolist() == [i for i, line in enumerate(lines) for _ in line["spans"]]
+    fonts = get_strings(document, "fonts", "name")
+    assert [fonts[font_id] for font_id in document["chars"]["font"]] == [char["font"]["name"] for char in chars]
+
+    save_columnar(document, tmp_path / "out.npz")
+    _assert_same(load_columnar(tmp_path / "out.npz"), document)
+
+
+def test_columnar_arrow(pdf_path, tmp_path):
+    pytest.importorskip("pyarrow")
+    out_path = tmp_path / "out"
+    result = CliRunner().invoke(extract_text_cli, [pdf_path, "--format", "arrow", "--out_path", str(out_path), "--page_range", "0-1"])
+    assert result.exit_code == 0, result.output
+    _assert_same(load_columnar(out_path), columnar_output(pdf_path, page_range=[0, 1], disable_links=True))
@@ -1,4 +1,9 @@
-from pdftext.extraction import paginated_plain_text_output, plain_text_output, dictionary_output
+import dataclasses
+import io
+import json
+
+from pdftext.extraction import paginated_plain_text_output, plain_text_output, dictionary_output, iter_dictionary_output
+from pdftext.output import write_json
 from pdftext.schema import Pages
 
 
@@ -35,3 +40,67 @@ def test_superscripts(pdf_path):
                     if span["text"] == "∞":
                         assert span["superscript"] is True
                         return True
+
+def test_font_interning(pdf_path):
+    pages: Pages = dictionary_output(pdf_path, page_range=[0], keep_chars=True)
+    chars = [char for block in pages[0]["blocks"] for line in block["lines"] for span in line["spans"] for char in span["chars"]]
+    font_keys = {(char["font"]["name"], char["font"]["flags"], char["font"]["size"], char["font"]["weight"]) for char in chars}
+    assert len({id(char["font"]) for char in chars}) == len(font_keys)
+
+def test_fast_plain_text(pdf_path, pdf_doc):
+    text = paginated_plain_text_output(pdf_path, fast=True)
+    assert len(text) == len(pdf_doc)
+    assert text[0].startswith("Subspace Adversarial Training")
+
+def test_iter_dictionary_output(pdf_path):
+    pages = dictionary_output(pdf_path, page_range=[0, 1])
+    streamed = list(iter_dictionary_output(pdf_path, page_range=[0, 1]))
+    assert [page["page"] for page in streamed] == [0, 1]
+    assert streamed[1]["blocks"] == pages[1]["blocks"]
+
+def test_links(pdf_path):
+    pages = dictionary_output(pdf_path, page_range=[1, 8])
+    urls = [span["url"] for page in pages for block in page["blocks"] for line in block["lines"] for span in line["spans"] if span["url"]]
+    assert urls and all(isinstance(url, str) for url in urls)
+    assert all("link_refs" not in page for page in pages)
+    assert {f"#{ref.ref}" for page in pages for ref in page["refs"]} <= set(urls)
+
+
+def test_write_json(pdf_path):
+    expected = dictionary_output(pdf_path, page_range=[0, 1, 2], keep_chars=True, disable_links=True)
+
+    stream = io.StringIO()
+    count = write_json(iter_dictionary_output(pdf_path, page_range=[0, 1, 2], keep_chars=True, disable_links=True, bbox_objects=True), stream)
+    assert count == 3
+    assert stream.getvalue() == json.dumps(expected)
+
+    stream = io.StringIO()
+    write_json(iter_dictionary_output(pdf_path, page_range=[0, 1, 2], bbox_objects=True), stream, jsonl=True)
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line)["page"] for line in lines] == [0, 1, 2]
+
+
+def test_write_json_refs(pdf_path):
+    # Refs from links on later pages are added after a page is yielded, so they're written separately at the end
+    expected = dictionary_output(pdf_path)
+    expected_refs = [dataclasses.asdict(ref) for page in expected for ref in page["refs"]]
+
+    stream, refs_stream = io.StringIO(), io.StringIO()
+    assert write_json(iter_dictionary_output(pdf_path, bbox_objects=True), stream, jsonl=True, refs_stream=refs_stream) == len(expected)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["page"] for record in records] == [page["page"] for page in expected]
+    assert all("refs" not in record for record in records)
+    refs = [json.loads(line) for line in refs_stream.getvalue().splitlines()]
+    assert refs == expected_refs
+    urls = {span["url"] for page in records for block in page["blocks"] for line in block["lines"] for span in line["spans"]}
+    assert {f"#page-{ref['page']}-{ref['idx']}" for ref in refs} == {url for url in urls if url.startswith("#")}
+
+    stream, refs_stream = io.StringIO(), io.StringIO()
+    write_json(iter_dictionary_output(pdf_path, page_range=[0, 1], bbox_objects=True), stream, refs_stream=refs_stream)
+    assert [page["page"] for page in json.loads(stream.getvalue())] == [0, 1]
+    assert json.loads(refs_stream.getvalue()) == [dataclasses.asdict(ref) for page in dictionary_output(pdf_path, page_range=[0, 1]) for ref in page["refs"]]
+
+    # Without refs_stream, only the pages are written
+    stream = io.StringIO()
+    write_json(iter_dictionary_output(pdf_path, page_range=[0, 1], bbox_objects=True), stream)
+    assert [page["page"] for page in json.loads(stream.getvalue())] == [0, 1]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from pdftext.pdf.links import add_links_and_refs, resolve_links, split_links
+from pdftext.pdf.pages import get_pages
+from pdftext.pdf.utils import intersecting_pairs, matrix_intersection_area
+from pdftext.schema import Bbox, PageReference
+
+
+def test_intersecting_pairs():
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0, 500, (300, 2))
+    boxes = np.concatenate([starts, starts + rng.uniform(0, 40, (300, 2))], axis=1)
+    boxes[:20, 2] = boxes[:20, 0]  # Zero width boxes don't intersect anything
+    boxes1, boxes2 = boxes[:100].tolist(), boxes[100:].tolist()
+
+    matrix = matrix_intersection_area(boxes1, boxes2)
+    idxs1, idxs2 = np.nonzero(matrix > 0)
+    pairs1, pairs2, areas = intersecting_pairs(boxes1, boxes2)
+    assert pairs1.tolist() == idxs1.tolist() and pairs2.tolist() == idxs2.tolist()
+    assert areas.tolist() == matrix[idxs1, idxs2].tolist()
+    assert len(intersecting_pairs([], boxes2)[0]) == 0
+
+
+def test_split_links():
+    chars = [{"bbox": Bbox([i * 10, 0, i * 10 + 10, 10]), "char": c, "rotation": 0, "font": {"name": "f"}, "char_idx": i} for i, c in enumerate("see ref 1")]
+    span = {"bbox": Bbox([0, 0, 90, 10]), "text": "see ref 1", "rotation": 0, "font": {"name": "f"}, "char_start_idx": 0, "char_end_idx": 8, "chars": chars, "url": ""}
+    page = {"page": 0, "blocks": [{"lines": [{"spans": [span], "bbox": Bbox([0, 0, 90, 10])}], "bbox": Bbox([0, 0, 90, 10])}]}
+    links = [
+        {"page": 0, "bbox": [38, 2, 70, 8], "dest_page": None, "dest_pos": None, "url": "https://example.com"},
+        {"page": 0, "bbox": [80, 0, 90, 10], "dest_page": 2, "dest_pos": [10.0, 20.0], "url": None},
+        {"page": 0, "bbox": [200, 0, 210, 10], "dest_page": None, "dest_pos": None, "url": "https://unused.com"},
+    ]
+    split_links(page, links)
+
+    spans = page["blocks"][0]["lines"][0]["spans"]
+    assert [(span["text"], span["url"]) for span in spans] == [("see", ""), (" ref", "https://example.com"), (" ", ""), ("1", 0)]
+    assert spans[1]["bbox"].bbox == [30, 0, 70, 10]
+    assert page["link_refs"] == [(2, [10.0, 20.0])]
+
+
+def test_add_links_and_refs(pdf_path, pdf_doc):
+    # Adding links to pages extracted without them matches extracting with links
+    pages = get_pages(pdf_doc, [0, 1, 8], flatten_pdf=False)
+    add_links_and_refs(pages, pdf_doc)
+    expected = get_pages(pdf_doc, [0, 1, 8], flatten_pdf=False, link_pdf=pdf_doc)
+    refs = PageReference()
+    for page in expected:
+        resolve_links(page, refs)
+        page["refs"] = refs.get_refs(page["page"])
+
+    def spans(pages):
+        return [(span["text"], span["bbox"].bbox, span["url"]) for page in pages for block in page["blocks"] for line in block["lines"] for span in line["spans"]]
+    assert spans(pages) == spans(expected)
+    assert [page["refs"] for page in pages] == [page["refs"] for page in expected]
+    assert any(page["refs"] for page in pages)
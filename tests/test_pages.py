@@ -0,0 +1,25 @@
+from pdftext.pdf.pages import get_blocks
+from pdftext.schema import Bbox
+
+
+def _line(x_start, y_start, x_end, height=10):
+    return {"bbox": Bbox([x_start, y_start, x_end, y_start + height]), "rotation": 0, "spans": []}
+
+
+def test_get_blocks():
+    lines = [
+        # An indented paragraph with a short last line
+        _line(20, 0, 400), _line(0, 12, 400), _line(0, 24, 400), _line(0, 36, 200),
+        # A second paragraph further down
+        _line(0, 100, 400), _line(0, 112, 400),
+        # A line far to the right that overlaps the second paragraph
+        _line(300, 105, 500),
+        # A short label far below
+        _line(0, 300, 50),
+    ]
+    blocks = get_blocks(lines)
+    assert [[lines.index(line) for line in block["lines"]] for block in blocks] == [[0, 1, 2, 3], [4, 5, 6], [7]]
+    assert blocks[0]["bbox"].bbox == [0, 0, 400, 46]
+    assert blocks[1]["bbox"].bbox == [0, 100, 500, 122]
+    assert blocks[0]["rotation"] == 0 and "rotation" not in blocks[1]
+    assert get_blocks([]) == []
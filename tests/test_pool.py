@@ -0,0 +1,81 @@
+import io
+import mmap
+import os
+
+import pytest
+
+from pdftext.extraction import dictionary_output, paginated_plain_text_output
+from pdftext.pool import ExtractionPool, _run_batch
+
+
+def test_extraction_pool(pdf_path, pdf_doc):
+    expected = paginated_plain_text_output(pdf_path, page_range=[0, 1, 2])
+    with ExtractionPool(workers=2) as pool:
+        assert paginated_plain_text_output(pdf_path, page_range=[0, 1, 2], pool=pool) == expected
+
+        documents = list(pool.iter_documents([(pdf_path, [3]), pdf_path, (pdf_path, [0, 1])]))
+        assert [len(pages) for _, pages in documents] == [1, len(pdf_doc), 2]
+        assert [page["page"] for page in documents[1][1]] == list(range(len(pdf_doc)))
+
+
+def test_in_memory_inputs(pdf_path):
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+
+    expected = paginated_plain_text_output(pdf_path, page_range=[0, 1])
+    for pdf in [data, memoryview(data), bytearray(data)]:
+        assert paginated_plain_text_output(pdf, page_range=[0, 1]) == expected
+    assert paginated_plain_text_output(io.BytesIO(data), page_range=[0, 1]) == expected
+
+    # Workers read in-memory documents from shared memory
+    with ExtractionPool(workers=2) as pool:
+        assert paginated_plain_text_output(data, page_range=[0, 1], pool=pool) == expected
+        documents = list(pool.iter_documents([(data, [0, 1]), (io.BytesIO(data), [0])]))
+        assert documents[0][0] is data
+        assert [len(pages) for _, pages in documents] == [2, 1]
+
+
+def test_run_batch_costs(pdf_path):
+    # Workers estimate the cost of upcoming pages while they extract a batch
+    _, _, pages, _, costs = _run_batch(pdf_path, [0], cost_pages=[1, 2])
+    assert len(pages) == 1 and sorted(costs) == [1, 2]
+    assert all(cost > 0 for cost in costs.values())
+
+    with ExtractionPool(workers=2) as pool:
+        assert [page.meta["page"] for page in pool.iter_packed_pages(pdf_path)] == list(range(12))
+
+
+def _shared_mappings():
+    with open("/proc/self/maps") as f:
+        return [line for line in f if "/psm_" in line]
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="Needs /proc")
+def test_shared_memory_released(pdf_path):
+    # Each call shares the pdf under a new name, so workers mustn't keep it mapped once the call is done
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+
+    with ExtractionPool(workers=1) as pool:
+        for _ in range(3):
+            paginated_plain_text_output(data, page_range=[0, 1, 2], pool=pool)
+        assert pool.executor.submit(_shared_mappings).result() == []
+
+
+def test_buffers_released(pdf_path):
+    # Callers can close or resize their buffer once extraction returns
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+
+    expected = paginated_plain_text_output(pdf_path, page_range=[0, 1])
+    with open(pdf_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert paginated_plain_text_output(mapped, page_range=[0, 1]) == expected
+            assert dictionary_output(mapped, page_range=[0])[0]["page"] == 0
+            with ExtractionPool(workers=1) as pool:
+                assert paginated_plain_text_output(mapped, page_range=[0, 1], pool=pool) == expected
+
+    buffer = bytearray(data)
+    assert paginated_plain_text_output(buffer, page_range=[0, 1]) == expected
+    assert dictionary_output(buffer, page_range=[0], flatten_pdf=True)[0]["page"] == 0
+    buffer.extend(b"\n")
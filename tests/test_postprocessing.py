@@ -0,0 +1,70 @@
+import copy
+
+import pytest
+
+from pdftext.extraction import _get_pages
+from pdftext.pdf.utils import LINE_BREAKS, SPACES
+from pdftext.postprocessing import HYPHEN_CHAR, handle_hyphens, merge_text, postprocess_text, replace_control_chars
+
+
+def legacy_handle_hyphens(text, keep_hyphens=False):
+    # The original char by char implementation, kept as the reference output
+    if keep_hyphens:
+        return text.replace(HYPHEN_CHAR, "-\n")
+    new_text = ""
+    found_hyphen = False
+    for i in range(len(text) - 1):
+        if text[i] == HYPHEN_CHAR:
+            found_hyphen = True
+        elif found_hyphen:
+            if text[i] in LINE_BREAKS:
+                pass
+            elif text[i] in SPACES:
+                new_text = new_text.rstrip() + "\n"
+                found_hyphen = False
+            else:
+                new_text += text[i]
+        else:
+            new_text += text[i]
+    return new_text
+
+
+def legacy_merge_text(page, hyphens=False):
+    text = ""
+    for block in page["blocks"]:
+        block_text = ""
+        for line in block["lines"]:
+            line_text = ""
+            for span in line["spans"]:
+                line_text += span["text"]
+            line_text = postprocess_text(line_text)
+            line_text = line_text.rstrip() + "\n"
+            block_text += line_text
+        block_text = block_text.rstrip() + "\n\n"
+        text += block_text
+    return legacy_handle_hyphens(text, keep_hyphens=hyphens)
+
+
+def test_postprocess_text():
+    text = f"a\r\nb\rc﻿d\xa0e\x00f\x01{HYPHEN_CHAR}\x0c\tgﬃh\U000f0000i"
+    assert postprocess_text(text) == f"a\nb\nc d ef{HYPHEN_CHAR}\x0c\tgffihi"
+    assert replace_control_chars("a\x00\x7f​b\n") == "ab\n"
+    assert postprocess_text("") == ""
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "\n",
+    f"hyp{HYPHEN_CHAR}\nhen word\n",
+    f"a {HYPHEN_CHAR}  \n\nb{HYPHEN_CHAR}\n{HYPHEN_CHAR}c d{HYPHEN_CHAR}",
+    f"end{HYPHEN_CHAR}\n\n\xa0\tnext{HYPHEN_CHAR}\r\nline\ufeffx\n\n",
+])
+def test_handle_hyphens(text):
+    assert handle_hyphens(text) == legacy_handle_hyphens(text)
+
+
+def test_merge_text(pdf_path):
+    pages = _get_pages(pdf_path)
+    for page in pages:
+        for hyphens in [False, True]:
+            assert merge_text(copy.deepcopy(page), hyphens=hyphens) == legacy_merge_text(page, hyphens=hyphens)
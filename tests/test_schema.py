@@ -0,0 +1,20 @@
+import pickle
+
+from pdftext.schema import Bbox
+
+
+def test_bbox_merge_into():
+    bbox = Bbox([10, 10, 20, 20])
+    other = Bbox([5, 15, 25, 18])
+    merged = bbox.copy().merge_into(other)
+    assert merged.bbox == bbox.merge(other).bbox == [5, 10, 25, 20]
+    assert bbox.bbox == [10, 10, 20, 20]
+
+
+def test_bbox_pickle():
+    bbox = Bbox([0, 0, 1, 0], ensure_nonzero_area=True)
+    restored = pickle.loads(pickle.dumps(bbox))
+    assert restored.bbox == bbox.bbox
+    assert restored.ensure_nonzero_area
+    assert not hasattr(restored, "__dict__")
+    assert restored.rotate(10, 10, 0) is restored
@@ -1,4 +1,12 @@
-from pdftext.extraction import table_output
+import numpy as np
+
+from pdftext import extraction
+from pdftext.cache import ResultCache
+from pdftext.extraction import dictionary_output, table_output
+from pdftext.pool import ExtractionPool
+from pdftext.schema import Bbox
+from pdftext.settings import settings
+from pdftext.tables import LineIndex, group_cells, is_same_span, page_char_arrays
 
 def test_table_extraction(pdf_path, pdf_doc):
     _table_extraction(pdf_path, pdf_doc)
@@ -48,3 +56,78 @@ def _table_extraction(pdf_path, pdf_doc, img_size_scaler: float = 2.0):
         assert 0 <= cell["bbox"][2] <= table1_width
         assert 0 <= cell["bbox"][3] <= table1_height
 
+
+
+def test_line_index(pdf_path):
+    page = dictionary_output(pdf_path, page_range=[5], keep_chars=True)[0]
+    img_size = [page["width"] * 2, page["height"] * 2]
+    line_index = LineIndex(page, img_size)
+    for table in [[0, 0, img_size[0], img_size[1]], [100, 200, 400, 300], [-50, -50, 10, 10], [900, 900, 2000, 2000]]:
+        overlapping = [i for i, bbox in enumerate(line_index.bboxes) if bbox.intersection_area(Bbox(table)) > 0]
+        assert set(overlapping) <= set(line_index.query(table))
+
+
+def test_group_cells(pdf_path):
+    page = dictionary_output(pdf_path, page_range=[5], keep_chars=True)[0]
+    bboxes, texts, _, line_ends = page_char_arrays(page)
+    line_starts = np.zeros(len(bboxes), dtype=bool)
+    line_starts[np.concatenate([[0], line_ends[:-1]])[np.diff(np.concatenate([[0], line_ends])) > 0]] = True
+    img_size, space_thresh = [page["width"], page["height"]], .01
+
+    # Char by char, the cell grows to include each char that's close to it
+    expected = []
+    for i, bbox in enumerate(bboxes.tolist()):
+        if line_starts[i] or not curr_text or not is_same_span(bbox, curr_box, img_size, space_thresh, page["rotation"]):
+            expected.append(i)
+            curr_text, curr_box = texts[i], bbox
+        else:
+            curr_text += texts[i]
+            curr_box = [min(curr_box[0], bbox[0]), min(curr_box[1], bbox[1]), max(curr_box[2], bbox[2]), max(curr_box[3], bbox[3])]
+
+    starts, union = group_cells(bboxes, texts, line_starts, img_size, space_thresh, page["rotation"])
+    assert np.flatnonzero(starts).tolist() == expected
+
+    # Lines left over after the last pass are grouped char by char, with the same cells
+    for max_passes in [0, 1]:
+        capped_starts, capped_union = group_cells(bboxes, texts, line_starts, img_size, space_thresh, page["rotation"], max_passes=max_passes)
+        assert np.array_equal(capped_starts, starts) and np.array_equal(capped_union, union)
+
+
+def test_group_cells_stepping_chars():
+    # Each char is just over half the gap below the one before, so cells are pairs, and every pass only fixes one more
+    n = 2000
+    x, y = np.arange(n) * 2., np.arange(n) * 6.
+    bboxes = np.stack([x, y, x + 1, y + 5], axis=1)
+    line_starts = np.zeros(n, dtype=bool)
+    line_starts[[0, n // 2]] = True
+    starts, _ = group_cells(bboxes, ["a"] * n, line_starts, [1000, 1000], .01, 0)
+    assert np.flatnonzero(starts).tolist() == list(range(0, n, 2))
+
+
+def test_table_output_workers(pdf_path):
+    table_inputs = [{"tables": [[0, 0, 1000, 1000], [50, 100, 600, 500]], "img_size": [1000, 1400]}] * 3
+    expected = table_output(pdf_path, table_inputs, page_range=[1, 5, 6])
+    with ExtractionPool(2) as pool:
+        assert table_output(pdf_path, table_inputs, page_range=[1, 5, 6], pool=pool) == expected
+        assert sum(stats["pages"] for stats in pool.worker_stats.values()) == 3
+
+
+def test_table_output_cache_workers(pdf_path, tmp_path, monkeypatch):
+    # Cache misses are still extracted by the workers
+    monkeypatch.setattr(settings, "WORKER_PAGE_THRESHOLD", 1)
+    pools = []
+
+    class RecordingPool(ExtractionPool):
+        def __init__(self, workers=None, *args, **kwargs):
+            super().__init__(workers, *args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(extraction, "ExtractionPool", RecordingPool)
+    table_inputs = [{"tables": [[0, 0, 1000, 1000], [50, 100, 600, 500]], "img_size": [1000, 1400]}] * 3
+    expected = table_output(pdf_path, table_inputs, page_range=[1, 5, 6])
+    cache = ResultCache(str(tmp_path))
+    assert table_output(pdf_path, table_inputs, page_range=[1, 5, 6], workers=2, cache=cache) == expected
+    assert [pool.workers for pool in pools] == [2]
+    assert sum(stats["pages"] for stats in pools[0].worker_stats.values()) == 3
+    assert table_output(pdf_path, table_inputs, page_range=[1, 5, 6], workers=2, cache=cache) == expected
+    assert len(pools) == 1
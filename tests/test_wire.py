@@ -0,0 +1,27 @@
+import pickle
+
+from pdftext.pdf.pages import get_pages, get_text_pages
+from pdftext.wire import pack_page, unpack_page
+
+
+def _as_lists(value):
+    if isinstance(value, dict):
+        return {k: _as_lists(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_as_lists(v) for v in value]
+    if hasattr(value, "bbox"):
+        return value.bbox
+    return value
+
+
+def test_pack_roundtrip(pdf_doc):
+    pages = get_pages(pdf_doc, range(len(pdf_doc)), flatten_pdf=False)
+    pages += get_text_pages(pdf_doc, [0], flatten_pdf=False)
+    for page in pages:
+        unpacked = unpack_page(pickle.loads(pickle.dumps(pack_page(page))))
+        assert _as_lists(unpacked) == _as_lists(page)
+        assert list(unpacked["blocks"][0]["lines"][0]["spans"][0].keys()) == list(page["blocks"][0]["lines"][0]["spans"][0].keys())
+
+    # Without chars, spans still keep an empty chars list
+    unpacked = unpack_page(pack_page(pages[0]), keep_chars=False)
+    assert all(span["chars"] == [] for block in unpacked["blocks"] for line in block["lines"] for span in line["spans"])